@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Compare the market search with and without the SearchIndex
+
+usage: python3 benchmarks/market_search.py [--plugins 10000]
+"""
+
+import argparse
+import random
+import string
+import timeit
+
+from wazo_plugind.db import SearchIndex, iin
+
+WORDS = [
+    ''.join(random.choice(string.ascii_lowercase) for _ in range(random.randint(3, 10)))
+    for _ in range(2000)
+]
+SEARCHES = ['a', 'pl', 'voip', 'plugin-42', 'zzzz', 'Sébastien']
+
+
+def make_catalog(size):
+    return [
+        {
+            'name': f'plugin-{i}',
+            'namespace': random.choice(WORDS),
+            'display_name': ' '.join(random.sample(WORDS, 3)).title(),
+            'description': ' '.join(random.sample(WORDS, 25)),
+            'author': random.choice(['Sébastien', 'François', 'Wazo Authors']),
+            'tags': random.sample(WORDS, 3),
+            'versions': [
+                {'version': f'0.{v}.0', 'min_wazo_version': '21.01'} for v in range(3)
+            ],
+        }
+        for i in range(size)
+    ]
+
+
+def linear_search(catalog, search):
+    def f(item):
+        for v in item.values():
+            if iin(search, v):
+                return True
+            if not isinstance(v, (list, tuple)):
+                continue
+            for element in v:
+                if iin(search, element):
+                    return True
+        return False
+
+    return [item for item in catalog if f(item)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--plugins', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    catalog = make_catalog(args.plugins)
+    build_time = timeit.timeit(lambda: SearchIndex(catalog), number=1)
+    print(f'{args.plugins} plugins, index built in {build_time * 1000:.1f} ms')
+
+    index = SearchIndex(catalog)
+    print(f'{"search":>12} {"linear (ms)":>12} {"index (ms)":>12} {"matches":>8}')
+    for search in SEARCHES:
+        linear = timeit.timeit(lambda: linear_search(catalog, search), number=1)
+        indexed = timeit.timeit(lambda: index.matches(search), number=args.repeat)
+        matches = len(index.matches(search))
+        assert matches == len(linear_search(catalog, search)), search
+        print(
+            f'{search:>12} {linear * 1000:12.1f} '
+            f'{indexed / args.repeat * 1000:12.3f} {matches:8}'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Compare the market sort and pagination with and without the sorted views
+
+The time per request of a full sort grows as n log n, the cost of a cached view or of a
+partial sort of the first entries should only grow linearly with the number of plugins.
+
+usage: python3 benchmarks/market_sort.py [--sizes 1000 10000 100000] [--limit 20]
+"""
+
+import argparse
+import math
+import random
+import timeit
+
+from wazo_plugind.db import LAST_ITEM, MarketCatalog, MarketDB
+
+
+class CatalogProxy:
+    def __init__(self, catalog):
+        self._catalog = catalog
+
+    def get_sorted_positions(self, order, reverse=False):
+        return self._catalog.sorted_positions(order, reverse)
+
+
+class InstalledPlugins:
+    def __init__(self, content):
+        self._versions = {
+            (metadata['namespace'], metadata['name']): metadata['installed_version']
+            for metadata in content
+        }
+
+    def installed_versions(self):
+        return self._versions
+
+
+def make_catalog(size):
+    return [
+        {
+            'name': f'plugin-{random.getrandbits(32):08x}',
+            'namespace': random.choice(['official', 'community', 'wazo']),
+            'installed_version': random.choice([f'0.{i}.0' for i in range(10)]),
+        }
+        for _ in range(size)
+    ]
+
+
+def full_sort(content, order, limit):
+    return sorted(content, key=lambda metadata: metadata.get(order, LAST_ITEM))[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(
+        f'{"plugins":>8} {"order":>18} {"full sort (ms)":>15} {"views (ms)":>11} '
+        f'{"full ns/nlogn":>15} {"views ns/n":>10}'
+    )
+    for size in args.sizes:
+        content = make_catalog(size)
+        catalog = MarketCatalog(content)
+        db = MarketDB(CatalogProxy(catalog), '26.15', InstalledPlugins(content))
+        positions = range(size)
+        catalog.sorted_positions('name')
+
+        def views(order):
+            result = db._sort(content, positions, order=order, limit=args.limit)
+            return [content[position] for position in db._paginate(result, args.limit)]
+
+        for order in ('name', 'installed_version'):
+            assert views(order) == full_sort(content, order, args.limit), order
+            full = timeit.timeit(
+                lambda: full_sort(content, order, args.limit), number=args.repeat
+            )
+            cached = timeit.timeit(lambda: views(order), number=args.repeat)
+            full, cached = full / args.repeat, cached / args.repeat
+            print(
+                f'{size:8} {order:>18} {full * 1000:15.2f} {cached * 1000:11.3f} '
+                f'{full / (size * math.log2(size)) * 1e9:15.2f} '
+                f'{cached / size * 1e9:10.2f}'
+            )
+
+
+if __name__ == '__main__':
+    main()
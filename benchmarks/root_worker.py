@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Measure the root worker throughput with concurrent callers
+
+The commands are replaced by sleeps: an `apt-get update` takes --update-delay seconds and
+an installation --install-delay seconds. The "serialized" run waits for each result
+before sending the next command, like the previous protocol did.
+
+usage: python3 benchmarks/root_worker.py [--callers 8] [--requests 10]
+"""
+
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from wazo_plugind import root_worker
+
+
+def fake_commands(update_delay, install_delay):
+    def update(self, uuid):
+        time.sleep(update_delay)
+        return True
+
+    def install(self, uuid, deb):
+        time.sleep(install_delay)
+        return True
+
+    root_worker._CommandExecutor.update = update
+    root_worker._CommandExecutor.install = install
+
+
+def run(worker, callers, requests, serialized):
+    lock = threading.Lock() if serialized else None
+    latencies = []
+
+    def call(i):
+        cmd = 'update' if i % callers == 0 else 'install'
+        args = ('uuid',) if cmd == 'update' else ('uuid', 'foo.deb')
+        start = time.perf_counter()
+        if lock:
+            with lock:
+                worker.send_cmd_and_wait(cmd, *args)
+        else:
+            worker.send_cmd_and_wait(cmd, *args)
+        latencies.append((cmd, time.perf_counter() - start))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(callers) as executor:
+        list(executor.map(call, range(callers * requests)))
+    elapsed = time.perf_counter() - start
+
+    installs = sorted(latency for cmd, latency in latencies if cmd == 'install')
+    p50 = installs[len(installs) // 2] * 1000
+    p99 = installs[int(len(installs) * 0.99)] * 1000
+    name = 'serialized' if serialized else 'multiplexed'
+    print(
+        f'{name:>12}: {len(latencies) / elapsed:8.1f} commands/s, '
+        f'install latency p50 {p50:7.1f} ms, p99 {p99:7.1f} ms'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--callers', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=10)
+    parser.add_argument('--update-delay', type=float, default=0.2)
+    parser.add_argument('--install-delay', type=float, default=0.005)
+    args = parser.parse_args()
+
+    fake_commands(args.update_delay, args.install_delay)
+    with root_worker.BaseWorker() as worker:
+        for serialized in (True, False):
+            run(worker, args.callers, args.requests, serialized)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Compare version.less_than with a LooseVersion built for each comparison
+
+usage: python3 benchmarks/version_compare.py [--comparisons 100000]
+"""
+
+import argparse
+import random
+import timeit
+
+from looseversion import LooseVersion
+
+from wazo_plugind.helpers import version
+
+CURRENT_WAZO_VERSION = '26.15'
+
+
+def loose_less_than(left, right):
+    return LooseVersion(left) < LooseVersion(right)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--comparisons', type=int, default=100000)
+    args = parser.parse_args()
+
+    wazo_versions = [f'{y}.{m:02}' for y in range(17, 27) for m in range(1, 17)]
+    plugin_versions = [
+        f'{a}.{b}.{c}' for a in range(3) for b in range(10) for c in range(5)
+    ]
+    pairs = [
+        random.choice(
+            [
+                (CURRENT_WAZO_VERSION, random.choice(wazo_versions)),
+                (random.choice(wazo_versions), CURRENT_WAZO_VERSION),
+                (random.choice(plugin_versions), random.choice(plugin_versions)),
+            ]
+        )
+        for _ in range(args.comparisons)
+    ]
+
+    def run(fn):
+        for left, right in pairs:
+            fn(left, right)
+
+    for name, fn in [
+        ('LooseVersion', loose_less_than),
+        ('less_than', version.less_than),
+    ]:
+        elapsed = timeit.timeit(lambda: run(fn), number=1)
+        per_call = elapsed / len(pairs) * 1e6
+        print(f'{name:>12}: {elapsed * 1000:8.1f} ms ({per_call:.2f} us/comparison)')
+
+
+if __name__ == '__main__':
+    main()
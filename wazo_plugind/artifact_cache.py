@@ -0,0 +1,163 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import contextlib
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+_artifact_cache = None
+_artifact_cache_lock = threading.Lock()
+
+# changes to the way packages are built that are not part of the key must increment this
+_KEY_FORMAT = 1
+_SUFFIX = '.deb'
+
+
+class ArtifactCache:
+    """Keeps the Debian packages built for the plugins
+
+    Packages are stored under a key identifying everything that went into the build. When
+    the packages use more than `max_size` bytes the least recently used ones are removed.
+    """
+
+    def __init__(self, directory, max_size):
+        self._directory = directory
+        self._max_size = max_size
+        self._lock = threading.Lock()
+
+    def get(self, key, destination):
+        """Copies the package stored under `key` to `destination`, returns False if unknown"""
+        path = self._path(key)
+        try:
+            _link_or_copy(path, destination)
+        except FileNotFoundError:
+            return False
+        with contextlib.suppress(OSError):
+            os.utime(path)
+        return True
+
+    def put(self, key, filename):
+        os.makedirs(self._directory, exist_ok=True)
+        fd, tmp_filename = tempfile.mkstemp(dir=self._directory, prefix='.put-')
+        os.close(fd)
+        try:
+            shutil.copyfile(filename, tmp_filename)
+            os.replace(tmp_filename, self._path(key))
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_filename)
+            raise
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        if not self._max_size:
+            return
+
+        with self._lock:
+            artifacts = []
+            for key in self._list_keys():
+                with contextlib.suppress(OSError):
+                    stat = os.stat(self._path(key))
+                    artifacts.append((stat.st_mtime, key, stat.st_size))
+
+            total = sum(size for _, _, size in artifacts)
+            for _, key, size in sorted(artifacts):
+                if total <= self._max_size:
+                    break
+                if key == keep:
+                    continue
+                logger.info('removing the package %s from the cache', key)
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(self._path(key))
+                total -= size
+
+    def purge(self):
+        with self._lock:
+            for key in self._list_keys():
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(self._path(key))
+        logger.info('package cache purged')
+
+    def _list_keys(self):
+        try:
+            names = os.listdir(self._directory)
+        except FileNotFoundError:
+            return []
+        return [
+            name[: -len(_SUFFIX)]
+            for name in names
+            if name.endswith(_SUFFIX) and not name.startswith('.')
+        ]
+
+    def _path(self, key):
+        return os.path.join(self._directory, f'{key}{_SUFFIX}')
+
+    @classmethod
+    def from_config(cls, config):
+        artifact_cache_config = config['artifact_cache']
+        return cls(
+            artifact_cache_config['directory'], artifact_cache_config['max_size']
+        )
+
+
+def artifact_key(source, rendered_files, wazo_version):
+    """Identifies a package built from `source` with the given DEBIAN files
+
+    `source` is a commit or a digest of the source tree. wazo-plugind is released with
+    Wazo, the Wazo version identifies the version of wazo-plugind that built the package.
+    """
+    digest = hashlib.sha256()
+    for part in (str(_KEY_FORMAT), source, wazo_version or ''):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    for filename, content in sorted(rendered_files.items()):
+        digest.update(filename.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(content.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def tree_digest(path):
+    """Hashes the names, modes and content of the files of a directory, except .git"""
+    digest = hashlib.sha256()
+    for root, dirnames, filenames in os.walk(path):
+        dirnames[:] = sorted(name for name in dirnames if name != '.git')
+        links = [name for name in dirnames if os.path.islink(os.path.join(root, name))]
+        for filename in sorted(filenames + links):
+            filename = os.path.join(root, filename)
+            stat = os.lstat(filename)
+            digest.update(os.path.relpath(filename, path).encode('utf-8'))
+            digest.update(f'\0{stat.st_mode:o}\0'.encode())
+            if os.path.islink(filename):
+                digest.update(os.readlink(filename).encode('utf-8'))
+            else:
+                with open(filename, 'rb') as f:
+                    for chunk in iter(lambda: f.read(65536), b''):
+                        digest.update(chunk)
+            digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _link_or_copy(source, destination):
+    try:
+        os.link(source, destination)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def get_artifact_cache(config):
+    global _artifact_cache
+    with _artifact_cache_lock:
+        if not _artifact_cache:
+            logger.debug('Creating a new package cache...')
+            _artifact_cache = ArtifactCache.from_config(config)
+    return _artifact_cache
@@ -1,4 +1,4 @@
-# Copyright 2017-2023 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2017-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import logging
@@ -24,7 +24,10 @@ def main(args):
 
     os.chdir(conf['home_dir'])
 
-    with RootWorker() as root_worker:
+    root_worker_config = conf['root_worker']
+    with RootWorker(
+        root_worker_config['timeouts'], root_worker_config['update_freshness']
+    ) as root_worker:
         if conf['user']:
             change_user(conf['user'])
 
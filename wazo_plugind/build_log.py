@@ -0,0 +1,101 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import logging
+import threading
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+
+class BuildLog:
+    """Keeps the last lines of output of each installation and publishes them on the bus
+
+    Lines are only appended to in-memory buffers by the installation threads. A background
+    thread publishes the new lines of each installation in a single event every
+    `publish_interval` seconds, at most `max_event_lines` lines per event.
+    """
+
+    def __init__(
+        self,
+        publisher,
+        max_lines=1000,
+        max_installs=100,
+        publish_interval=1.0,
+        max_event_lines=200,
+    ):
+        self._publisher = publisher
+        self._max_lines = max_lines
+        self._max_installs = max_installs
+        self._publish_interval = publish_interval
+        self._max_event_lines = max_event_lines
+        self._lock = threading.Lock()
+        self._logs = OrderedDict()
+        self._unpublished = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name='build-log-publisher', daemon=True
+        )
+
+    def open(self, uuid):
+        with self._lock:
+            self._get_or_create(uuid)
+
+    def append(self, uuid, stream, line):
+        entry = {'stream': stream, 'line': line}
+        with self._lock:
+            self._get_or_create(uuid).append(entry)
+            unpublished = self._unpublished.get(uuid)
+            if unpublished is None:
+                unpublished = deque(maxlen=self._max_event_lines)
+                self._unpublished[uuid] = unpublished
+            unpublished.append(entry)
+
+    def get_lines(self, uuid):
+        with self._lock:
+            log = self._logs.get(uuid)
+            return list(log) if log is not None else None
+
+    def flush(self):
+        with self._lock:
+            unpublished, self._unpublished = self._unpublished, {}
+
+        for uuid, lines in unpublished.items():
+            try:
+                self._publisher.install_log(uuid, list(lines))
+            except Exception as e:
+                logger.info('[%s] failed to publish the build log: %s', uuid, e)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.flush()
+
+    def _get_or_create(self, uuid):
+        log = self._logs.get(uuid)
+        if log is not None:
+            self._logs.move_to_end(uuid)
+            return log
+
+        log = self._logs[uuid] = deque(maxlen=self._max_lines)
+        while len(self._logs) > self._max_installs:
+            self._logs.popitem(last=False)
+        return log
+
+    def _run(self):
+        while not self._stopped.wait(self._publish_interval):
+            self.flush()
+
+    @classmethod
+    def from_config(cls, config, publisher):
+        build_log_config = config['build_log']
+        return cls(
+            publisher,
+            max_lines=build_log_config['max_lines'],
+            max_installs=build_log_config['max_installs'],
+            publish_interval=build_log_config['publish_interval'],
+        )
@@ -1,13 +1,39 @@
-# Copyright 2017-2024 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2017-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 from wazo_bus.publisher import BusPublisher
+from wazo_bus.resources.common.event import ServiceEvent
 from wazo_bus.resources.plugins.events import (
     PluginInstallProgressEvent,
     PluginUninstallProgressEvent,
 )
 
 
+class PluginTaskStepTimingEvent(ServiceEvent):
+    service = 'plugind'
+    name = 'plugin_task_step_timing'
+    routing_key_fmt = 'plugin.{action}.{uuid}.timing'
+
+    def __init__(self, plugin_uuid, action, step, timing):
+        content = {
+            'uuid': str(plugin_uuid),
+            'action': action,
+            'step': step,
+            'timing': timing,
+        }
+        super().__init__(content)
+
+
+class PluginInstallLogEvent(ServiceEvent):
+    service = 'plugind'
+    name = 'plugin_install_log'
+    routing_key_fmt = 'plugin.install.{uuid}.log'
+
+    def __init__(self, plugin_uuid, lines):
+        content = {'uuid': str(plugin_uuid), 'lines': lines}
+        super().__init__(content)
+
+
 class Publisher(BusPublisher):
     @classmethod
     def from_config(cls, service_uuid, bus_config):
@@ -26,6 +52,12 @@ class Publisher(BusPublisher):
         }
         self.publish(PluginInstallProgressEvent(ctx.uuid, 'error', errors))
 
+    def install_log(self, uuid, lines):
+        self.publish(PluginInstallLogEvent(uuid, lines))
+
+    def step_timing(self, ctx, action, step, timing):
+        self.publish(PluginTaskStepTimingEvent(ctx.uuid, action, step, timing))
+
     def uninstall(self, ctx, status):
         self.publish(PluginUninstallProgressEvent(ctx.uuid, status))
 
@@ -1,4 +1,4 @@
-# Copyright 2017-2025 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2017-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import argparse
@@ -33,10 +33,45 @@ _DEFAULT_CONFIG = {
     'default_debian_package_prefix': 'wazo-plugind',
     'debian_package_section': 'wazo-plugind-plugin',
     'debug': False,
+    'max_concurrent_tasks': 10,
+    'max_concurrent_dependency_builds': 4,
+    'jobs': {
+        'max_jobs': 100,
+        'persist_file': '/var/lib/wazo-plugind/jobs.json',
+    },
+    'git_cache': {
+        'enabled': True,
+        'directory': '/var/lib/wazo-plugind/cache/git',
+        'max_size': 1024 * 1024 * 1024,
+    },
+    'artifact_cache': {
+        'enabled': True,
+        'directory': '/var/lib/wazo-plugind/cache/debs',
+        'max_size': 2 * 1024 * 1024 * 1024,
+    },
+    'build_log': {
+        'max_lines': 1000,
+        'max_installs': 100,
+        'publish_interval': 1.0,
+    },
+    'root_worker': {
+        'update_freshness': 300,
+        'timeouts': {
+            'update': 600,
+            'install': 1800,
+            'uninstall': 1800,
+        },
+    },
     'log_level': 'info',
     'log_file': f'/var/log/{_DAEMONNAME}.log',
     'user': _DAEMONNAME,
-    'market': {'host': 'apps.wazo.community'},
+    'market': {'host': 'apps.wazo.community', 'timeout': 10},
+    'market_cache': {
+        'ttl': 300,
+        'stale_while_revalidate': 3600,
+        'prefetch_interval': 600,
+        'snapshot_file': '/var/lib/wazo-plugind/market.json',
+    },
     'confd': {
         'host': 'localhost',
         'port': 9486,
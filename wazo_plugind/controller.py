@@ -1,4 +1,4 @@
-# Copyright 2017-2024 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2017-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import logging
@@ -15,7 +15,7 @@ from xivo.http_helpers import ReverseProxied
 from xivo.status import StatusAggregator
 from xivo.token_renewer import TokenRenewer
 
-from wazo_plugind import http, service
+from wazo_plugind import http, market, service, tasks
 from wazo_plugind.bus import Publisher
 
 from .service_discovery import self_check
@@ -29,7 +29,7 @@ def _signal_handler(controller, signum, frame):
 
 class Controller:
     def __init__(self, config, root_worker):
-        self._executor = ThreadPoolExecutor(max_workers=10)  # Make it configurable
+        self._executor = ThreadPoolExecutor(max_workers=config['max_concurrent_tasks'])
         self._xivo_uuid = config.get('uuid')
         self._listen_addr = config['rest_api']['listen']
         self._listen_port = config['rest_api']['port']
@@ -43,7 +43,12 @@ class Controller:
         self._status_aggregator = StatusAggregator()
 
         bind_addr = (self._listen_addr, self._listen_port)
+        market_cache = market.get_market_cache(config)
+        self._market_prefetcher = market.MarketPrefetcher.from_config(
+            config, market_cache
+        )
         self._publisher = Publisher.from_config(config['uuid'], config['bus'])
+        self._build_log = tasks.get_build_log(config)
         plugin_service = service.PluginService.from_config(
             config, self._publisher, root_worker, self._executor
         )
@@ -76,6 +81,7 @@ class Controller:
         )
         self._status_aggregator.add_provider(http.provide_status)
         self._status_aggregator.add_provider(http.master_tenant.provide_status)
+        self._status_aggregator.add_provider(market_cache.provide_status)
 
     def run(self):
         logger.debug('starting http server')
@@ -91,11 +97,15 @@ class Controller:
             partial(self_check, self._listen_port),
         ):
             with self._token_renewer:
+                self._market_prefetcher.start()
+                self._build_log.start()
                 try:
                     self._server.start()
                 finally:
                     if self._stopping_thread:
                         self._stopping_thread.join()
+                    self._market_prefetcher.stop()
+                    self._build_log.stop()
         self._executor.shutdown()
 
     def stop(self, reason):
@@ -1,22 +1,35 @@
-# Copyright 2017-2025 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2017-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import copy
+import hashlib
+import heapq
+import json
 import logging
 import os
 import re
+import threading
+from collections import OrderedDict, defaultdict
 
 import yaml
 from requests import HTTPError
 from unidecode import unidecode
-from wazo_market_client import Client as MarketClient
 
 from wazo_plugind.helpers import version
 
-from . import debian
+from . import debian, metrics
 from .exceptions import InvalidPackageNameException, InvalidSortParamException
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 logger = logging.getLogger(__name__)
 
+_plugin_db = None
+_plugin_db_lock = threading.Lock()
+
 
 class AlwaysLast:
     def __lt__(self, other):
@@ -28,6 +41,27 @@ class AlwaysLast:
 
 LAST_ITEM = AlwaysLast()
 
+# a partial sort is used when at most this fraction of the entries is returned
+_TOP_K_RATIO = 0.1
+
+
+def _orderable(values):
+    """Returns True if the values are all strings or all numbers, ignoring LAST_ITEM
+
+    A partial sort does not compare every pair of values and would not always fail on
+    values that cannot be sorted.
+    """
+    kinds = set(map(type, values))
+    kinds.discard(AlwaysLast)
+    return kinds <= {str} or kinds <= {int, float, bool}
+
+
+def _sort_key(order):
+    def key(metadata):
+        return metadata.get(order, LAST_ITEM)
+
+    return key
+
 
 def normalize_caseless(s):
     return unidecode(s).casefold()
@@ -44,57 +78,258 @@ def iin(left, right):
     return normalize_caseless(left) in normalize_caseless(right)
 
 
+class SearchIndex:
+    """A case and accent insensitive index of the market content
+
+    The index matches the same entries as the `iin` function applied to each value of an
+    entry and to each element of its lists. Strings are normalized once when the index is
+    built and trigrams are used to select the entries that could match a search.
+
+    The `installed_version` is computed at each request and is not part of the index.
+    """
+
+    _ngram_size = 3
+    _dynamic_fields = ('installed_version',)
+    # fields added to each version by the MarketPluginUpdater
+    _version_fields = ('upgradable',)
+
+    def __init__(self, content):
+        self._size = len(content)
+        self._haystacks = []
+        self._exact_matches = defaultdict(set)
+        ngrams = defaultdict(list)
+
+        for position, metadata in enumerate(content):
+            haystacks = set()
+            for key, value in metadata.items():
+                if key in self._dynamic_fields:
+                    continue
+                self._index_value(position, key, value, haystacks)
+
+            self._haystacks.append(tuple(haystacks))
+            for ngram in self._ngrams(haystacks):
+                ngrams[ngram].append(position)
+
+        self._ngram_positions = {
+            ngram: tuple(positions) for ngram, positions in ngrams.items()
+        }
+
+    def matches(self, search):
+        needle = normalize_caseless(search)
+        positions = set(self._exact_matches.get(search, ()))
+
+        if len(needle) < self._ngram_size:
+            candidates = range(self._size)
+        else:
+            candidates = self._candidates(needle)
+
+        for position in candidates:
+            if position in positions:
+                continue
+            for haystack in self._haystacks[position]:
+                if needle in haystack:
+                    positions.add(position)
+                    break
+
+        return positions
+
+    def _candidates(self, needle):
+        smallest = None
+        for ngram in self._ngrams([needle]):
+            positions = self._ngram_positions.get(ngram)
+            if not positions:
+                return ()
+            if smallest is None or len(positions) < len(smallest):
+                smallest = positions
+        return smallest
+
+    def _index_value(self, position, key, value, haystacks):
+        if isinstance(value, str):
+            haystacks.add(normalize_caseless(value))
+        elif isinstance(value, dict):
+            self._index_keys(position, value)
+        elif isinstance(value, (list, tuple)):
+            for element in value:
+                if isinstance(element, str):
+                    haystacks.add(normalize_caseless(element))
+                elif isinstance(element, dict):
+                    self._index_keys(position, element)
+                    if key == 'versions':
+                        self._index_keys(position, self._version_fields)
+                elif isinstance(element, (list, tuple)):
+                    self._index_keys(position, element)
+
+    def _index_keys(self, position, keys):
+        for key in keys:
+            if isinstance(key, str):
+                self._exact_matches[key].add(position)
+
+    @classmethod
+    def _ngrams(cls, strings):
+        size = cls._ngram_size
+        return {
+            string[i : i + size]
+            for string in strings
+            for i in range(len(string) - size + 1)
+        }
+
+
+class MarketCatalog:
+    """The content of the market as fetched at a given time
+
+    Anything derived from the content is computed once and shared by all requests using
+    this version of the content. The items must not be modified.
+    """
+
+    # fields modified by the MarketPluginUpdater at each request
+    _dynamic_fields = ('installed_version', 'versions')
+    _max_sorted_views = 16
+
+    def __init__(self, items):
+        self.items = items
+        self._lock = threading.Lock()
+        self._search_index = None
+        self._positions = None
+        self._sorted_views = {}
+        self._digest = None
+
+    @property
+    def digest(self):
+        """A hash of the items, identifying this version of the content"""
+        with self._lock:
+            if self._digest is None:
+                content = json.dumps(self.items, sort_keys=True, default=str)
+                self._digest = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        return self._digest
+
+    @property
+    def search_index(self):
+        with self._lock:
+            if self._search_index is None:
+                self._search_index = SearchIndex(self.items)
+        return self._search_index
+
+    def position(self, namespace, name):
+        """Returns the position of the first item with this namespace and name or None"""
+        with self._lock:
+            if self._positions is None:
+                self._positions = {}
+                for position, metadata in enumerate(self.items):
+                    key = metadata.get('namespace'), metadata.get('name')
+                    self._positions.setdefault(key, position)
+        return self._positions.get((namespace, name))
+
+    def sorted_positions(self, order, reverse=False):
+        """Returns the positions of all the items sorted on `order`
+
+        None is returned when the items cannot be sorted once for all the requests, the
+        field is computed at each request, the values cannot be compared or too many
+        orders have been requested.
+        """
+        if order in self._dynamic_fields:
+            return None
+
+        view_key = order, reverse
+        with self._lock:
+            if view_key in self._sorted_views:
+                return self._sorted_views[view_key]
+            if len(self._sorted_views) >= self._max_sorted_views:
+                return None
+
+        key = _sort_key(order)
+        try:
+            view = sorted(
+                range(len(self.items)),
+                key=lambda position: key(self.items[position]),
+                reverse=reverse,
+            )
+        except TypeError:
+            view = None
+
+        with self._lock:
+            return self._sorted_views.setdefault(view_key, view)
+
+
 class MarketProxy:
     """The MarketProxy is an interface to the plugin market
 
-    The proxy should be used during the execution of an HTTP request. It will fetch the content
-    of the market and store it to allow multiple "queries" without having to do multiple HTTP
-    requests on the "real" market.
+    The proxy should be used during the execution of an HTTP request. It will get the catalog
+    of the market from the shared market cache. The shared items are only read, the entries
+    returned to the client are copied one by one to be annotated without altering the cache.
 
-    The proxy will only fetch the content of the market once, it is meant to be instanciated at
+    The proxy will only get the content of the market once, it is meant to be instanciated at
     each received HTTP request.
     """
 
-    def __init__(self, market_config):
-        self._client = MarketClient(**market_config)
-        self._content = {}
+    def __init__(self, market_cache):
+        self._market_cache = market_cache
+        self._catalog = None
+        self._copies = {}
+
+    def get_items(self):
+        """Returns the shared items of the catalog, they must not be modified"""
+        return self._get_catalog().items
+
+    def copy_item(self, position):
+        """Returns a copy of a single entry of the market without copying the others"""
+        if position not in self._copies:
+            self._copies[position] = copy.deepcopy(self._get_catalog().items[position])
+        return self._copies[position]
+
+    def get_item(self, namespace, name):
+        position = self._get_catalog().position(namespace, name)
+        if position is None:
+            return None
+        return self.copy_item(position)
 
-    def get_content(self):
-        if not self._content:
-            self._content = self._fetch_plugin_list()
-        return self._content
+    def get_search_index(self):
+        return self._get_catalog().search_index
 
-    def _fetch_plugin_list(self):
+    def get_position(self, namespace, name):
+        return self._get_catalog().position(namespace, name)
+
+    def get_sorted_positions(self, order, reverse=False):
+        return self._get_catalog().sorted_positions(order, reverse)
+
+    def get_digest(self):
+        return self._get_catalog().digest
+
+    def _get_catalog(self):
+        if self._catalog is None:
+            self._catalog = self._fetch_catalog()
+        return self._catalog
+
+    def _fetch_catalog(self):
         try:
-            result = self._client.plugins.list()
-            return result['items']
+            return self._market_cache.get_catalog()
         except HTTPError as e:
             logger.info(
                 'Failed to fetch plugins from the market %s', e.response.status_code
             )
+            return MarketCatalog([])
 
 
 class MarketPluginUpdater:
     def __init__(self, plugin_db, current_wazo_version):
         self._plugin_db = plugin_db
         self._current_wazo_version = current_wazo_version
+        self._installed_versions = None
 
     def update(self, plugin_info):
         namespace, name = plugin_info['namespace'], plugin_info['name']
-        plugin = self._plugin_db.get_plugin(namespace, name)
+        installed_version = self.installed_versions().get((namespace, name))
 
-        self._add_installed_version(plugin_info, plugin)
-        self._add_upgradable_field(plugin_info, plugin)
+        plugin_info['installed_version'] = installed_version
+        self._add_upgradable_field(plugin_info, installed_version)
 
         return plugin_info
 
-    def _add_installed_version(self, plugin_info, plugin):
-        installed_version = (
-            plugin.metadata()['version'] if plugin.is_installed() else None
-        )
-        plugin_info['installed_version'] = installed_version
+    def installed_versions(self):
+        if self._installed_versions is None:
+            self._installed_versions = self._plugin_db.installed_versions()
+        return self._installed_versions
 
-    def _add_upgradable_field(self, plugin_info, plugin):
+    def _add_upgradable_field(self, plugin_info, installed_version):
         for version_info in plugin_info.get('versions', []):
             version_info['upgradable'] = True
 
@@ -110,8 +345,7 @@ class MarketPluginUpdater:
                 version_info['upgradable'] = False
             elif version.less_than(max_wazo_version, self._current_wazo_version):
                 version_info['upgradable'] = False
-            elif plugin.is_installed():
-                installed_version = plugin.metadata()['version']
+            elif installed_version is not None:
                 if not version.less_than(installed_version, proposed_version):
                     version_info['upgradable'] = False
 
@@ -122,44 +356,56 @@ class MarketDB:
         self._updater = MarketPluginUpdater(plugin_db, current_wazo_version)
 
     def count(self, *args, **kwargs):
-        content = self._market_proxy.get_content()
+        items = self._market_proxy.get_items()
         if kwargs.get('filtered', False):
-            filters = self._extract_strict_filters(**kwargs)
-            content = self._strict_filter(content, **filters)
-            content = list(self._filter(content, **kwargs))
-        return len(content)
+            return len(self._select(items, **kwargs))
+        return len(items)
 
     def get(self, namespace, name):
-        filters = {
-            'namespace': namespace,
-            'name': name,
-        }
+        metadata = self._market_proxy.get_item(namespace, name)
+        if metadata is None:
+            raise LookupError(f'No such plugin {namespace}/{name}')
 
-        content = self._market_proxy.get_content()
-        content = self._add_local_values(content)
-        content = self._strict_filter(content, **filters)
+        return self._updater.update(metadata)
 
-        if not content:
-            raise LookupError(f'No such plugin {filters}')
+    def list_(self, *args, **kwargs):
+        return self.query(*args, **kwargs)['items']
+
+    def query(self, *args, **kwargs):
+        items = self._market_proxy.get_items()
+        total = len(items)
+        positions = self._select(items, **kwargs)
+        filtered = len(positions)
+        positions = self._sort(items, positions, **kwargs)
+        positions = self._paginate(positions, **kwargs)
+
+        return {
+            'items': [self._annotated(position) for position in positions],
+            'total': total,
+            'filtered': filtered,
+        }
 
-        return content[0]
+    def _annotated(self, position):
+        metadata = self._market_proxy.copy_item(position)
+        self._updater.update(metadata)
+        return metadata
 
-    def list_(self, *args, **kwargs):
-        filters = self._extract_strict_filters(**kwargs)
+    def _field(self, items, key, default=None):
+        """Returns a getter of a field of an entry, including the local values"""
+        if key == 'installed_version':
+            installed_versions = self._updater.installed_versions()
+
+            def installed_version(position):
+                metadata = items[position]
+                plugin = metadata.get('namespace'), metadata.get('name')
+                return installed_versions.get(plugin)
 
-        content = self._market_proxy.get_content()
-        content = self._add_local_values(content)
-        content = self._strict_filter(content, **filters)
-        content = self._filter(content, **kwargs)
-        content = self._sort(content, **kwargs)
-        content = self._paginate(content, **kwargs)
+            return installed_version
 
-        return content
+        if key == 'versions':
+            return lambda position: self._annotated(position).get(key, default)
 
-    def _add_local_values(self, content):
-        for metadata in content:
-            self._updater.update(metadata)
-        return content
+        return lambda position: items[position].get(key, default)
 
     @staticmethod
     def _extract_strict_filters(
@@ -176,60 +422,100 @@ class MarketDB:
             kwargs['installed_version'] = InstalledVersionMatcher(installed)
         return kwargs
 
-    @staticmethod
-    def _filter(content, search=None, **kwargs):
-        if not search:
-            return content
+    def _select(self, items, **kwargs):
+        """Returns the positions of the matching entries of the catalog"""
+        filters = self._extract_strict_filters(**kwargs)
+        positions = self._filter(items, **kwargs)
+        return self._strict_filter(items, positions, **filters)
 
-        def f(item):
-            for v in item.values():
-                if iin(search, v):
-                    return True
-                if not isinstance(v, (list, tuple)):
-                    continue
-                for element in v:
-                    if iin(search, element):
-                        return True
-            return False
+    def _filter(self, items, search=None, **kwargs):
+        if not search:
+            return range(len(items))
 
-        return filter(f, content)
+        positions = set(self._market_proxy.get_search_index().matches(search))
+        for key, installed_version in self._updater.installed_versions().items():
+            if not iin(search, installed_version):
+                continue
+            position = self._market_proxy.get_position(*key)
+            if position is not None:
+                positions.add(position)
+        return sorted(positions)
 
     @staticmethod
-    def _paginate(content, limit=None, offset=0, **kwargs):
+    def _paginate(positions, limit=None, offset=0, **kwargs):
         end = limit + offset if limit else None
-        return content[offset:end]
+        return positions[offset:end]
+
+    def _sort(
+        self,
+        items,
+        positions,
+        order=None,
+        direction=None,
+        limit=None,
+        offset=0,
+        **kwargs,
+    ):
+        if order is None:
+            return positions
 
-    @staticmethod
-    def _sort(content, order=None, direction=None, **kwargs):
         reverse = direction == 'desc'
+        view = self._market_proxy.get_sorted_positions(order, reverse)
+        if view is not None:
+            if len(positions) == len(items):
+                return view
+            selected = set(positions)
+            return [position for position in view if position in selected]
 
-        def key(element):
-            return element.get(order, LAST_ITEM)
+        field = self._field(items, order, LAST_ITEM)
+        keys = [field(position) for position in positions]
 
+        selected = (offset or 0) + limit if limit else None
         try:
-            return sorted(content, key=key, reverse=reverse)
+            if (
+                selected is not None
+                and selected <= len(keys) * _TOP_K_RATIO
+                and _orderable(keys)
+            ):
+                select = heapq.nlargest if reverse else heapq.nsmallest
+                indexes = select(selected, range(len(keys)), key=keys.__getitem__)
+            else:
+                indexes = sorted(
+                    range(len(keys)), key=keys.__getitem__, reverse=reverse
+                )
+            return [positions[index] for index in indexes]
         except TypeError:
             raise InvalidSortParamException(order)
 
-    @staticmethod
-    def _strict_filter(content, **kwargs):
-        def match(metadata):
-            for key, value in kwargs.items():
-                if metadata.get(key) != value:
+    def _strict_filter(self, items, positions, **kwargs):
+        fields = [(self._field(items, key), value) for key, value in kwargs.items()]
+
+        def match(position):
+            for field, value in fields:
+                if field(position) != value:
                     return False
             return True
 
-        return [metadata for metadata in content if match(metadata)]
+        return [position for position in positions if match(position)]
 
 
 class PluginDB:
-    def __init__(self, config):
+    """The plugins installed on the system
+
+    The installed plugins are listed once and kept until dpkg updates its database or the
+    registry is invalidated.
+    """
+
+    def __init__(self, config, debian_package_db=None):
         self._config = config
         self._debian_package_section = config['debian_package_section']
-        self._debian_package_db = debian.PackageDB()
+        self._debian_package_db = debian_package_db or debian.PackageDB()
+        self._lock = threading.Lock()
+        self._plugins = None
+        self._fingerprint = None
 
     def count(self):
-        return len(self.list_())
+        return len(self._get_plugins())
 
     def get_plugin(self, namespace, name):
         return Plugin(self._config, namespace, name)
@@ -237,22 +523,132 @@ class PluginDB:
     def is_installed(self, namespace, name, version=None):
         return Plugin(self._config, namespace, name).is_installed(version)
 
+    def installed_versions(self):
+        return {
+            key: metadata.get('version')
+            for key, metadata in self._get_plugins().items()
+            if isinstance(metadata, dict)
+        }
+
+    def invalidate(self):
+        with self._lock:
+            self._plugins = None
+
+    def state_fingerprint(self):
+        """Returns a value that changes when a plugin is installed, removed or modified
+
+        The dpkg database and the metadata files of the installed plugins are checked.
+        """
+        return (
+            self._debian_package_db.status_fingerprint(),
+            self._metadata_fingerprint(),
+        )
+
     def list_(self):
+        return list(self._get_plugins().values())
+
+    def _get_plugins(self):
+        with self._lock:
+            fingerprint = self._debian_package_db.status_fingerprint()
+            if self._plugins is None or fingerprint != self._fingerprint:
+                self._plugins = self._load_plugins()
+                self._fingerprint = fingerprint
+            return self._plugins
+
+    def _metadata_fingerprint(self):
+        metadata_dir = self._config['metadata_dir']
+        metadata_filename = self._config['default_metadata_filename']
         result = []
+        for namespace in _list_dir(metadata_dir):
+            for name in _list_dir(os.path.join(metadata_dir, namespace)):
+                filename = os.path.join(
+                    metadata_dir, namespace, name, metadata_filename
+                )
+                try:
+                    stat = os.stat(filename)
+                except OSError:
+                    continue
+                result.append(
+                    (namespace, name, stat.st_mtime_ns, stat.st_size, stat.st_ino)
+                )
+        return tuple(sorted(result))
+
+    def _load_plugins(self):
+        logger.debug('listing installed plugins')
+        result = {}
         debian_packages = self._debian_package_db.list_installed_packages(
             self._debian_package_section
         )
         for debian_package in debian_packages:
             try:
                 plugin = Plugin.from_debian_package(self._config, debian_package)
-                result.append(plugin.metadata())
-            except (OSError, InvalidPackageNameException):
+            except InvalidPackageNameException:
+                logger.info('invalid plugin package name %s', debian_package)
+                continue
+            try:
+                result[(plugin.namespace, plugin.name)] = plugin.metadata()
+            except OSError:
                 logger.info(
                     'no metadata file found for %s/%s', plugin.namespace, plugin.name
                 )
         return result
 
 
+def _list_dir(path):
+    try:
+        return os.listdir(path)
+    except OSError:
+        return []
+
+
+def get_plugin_db(config):
+    global _plugin_db
+    with _plugin_db_lock:
+        if not _plugin_db:
+            logger.debug('Creating a new plugin registry...')
+            _plugin_db = PluginDB(config)
+    return _plugin_db
+
+
+class MetadataCache:
+    """An LRU cache of the parsed plugin metadata files
+
+    A file is parsed again when its modification time, size or inode changes. The returned
+    metadata are shared and must not be modified.
+    """
+
+    def __init__(self, max_size=512):
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def load(self, filename):
+        stat = os.stat(filename)
+        fingerprint = stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+        with self._lock:
+            entry = self._entries.get(filename)
+            if entry and entry[0] == fingerprint:
+                self._entries.move_to_end(filename)
+                metrics.metadata_cache_requests.inc(result='hit')
+                return entry[1]
+
+        metrics.metadata_cache_requests.inc(result='miss')
+        with open(filename) as f, metrics.yaml_parse_duration.time(source='installed'):
+            metadata = yaml.load(f, Loader=SafeLoader)
+
+        with self._lock:
+            self._entries[filename] = fingerprint, metadata
+            self._entries.move_to_end(filename)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+        return metadata
+
+
+_metadata_cache = MetadataCache()
+
+
 class Plugin:
     def __init__(self, config, namespace, name):
         self.namespace = namespace
@@ -283,8 +679,7 @@ class Plugin:
 
     def metadata(self):
         if not self._metadata:
-            with open(self.metadata_filename) as f:
-                self._metadata = yaml.safe_load(f)
+            self._metadata = _metadata_cache.load(self.metadata_filename)
 
         return self._metadata
 
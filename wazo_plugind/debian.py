@@ -1,23 +1,35 @@
-# Copyright 2017-2025 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2017-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import copy
 import logging
 import os
 import subprocess
 
 import jinja2
 
+from . import metrics
+
 logger = logging.getLogger(__name__)
 
 
 class PackageDB:
     _package_and_section_format = "${binary:Package} ${Section}\n"
+    _status_filename = '/var/lib/dpkg/status'
 
     def __init__(self, package_section_generator=None):
         self._package_section_generator = (
             package_section_generator or self._list_packages
         )
 
+    def status_fingerprint(self):
+        """Returns a value that changes each time dpkg updates its database"""
+        try:
+            stat = os.stat(self._status_filename)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
     def list_installed_packages(self, selected_section=None):
         def filter_(name, section):
             if not selected_section:
@@ -33,8 +45,9 @@ class PackageDB:
     @classmethod
     def _list_packages(cls):
         cmd = ['dpkg-query', '-W', f'-f={cls._package_and_section_format}']
-        p = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-        out, _ = p.communicate()
+        with metrics.dpkg_query_duration.time():
+            p = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+            out, _ = p.communicate()
         yield from out.decode('utf-8').split('\n')
 
 
@@ -67,6 +80,15 @@ class Generator:
             ctx = self._generate_file(ctx, filename)
         return ctx
 
+    def render(self, ctx):
+        """Returns the content of the generated files, the context is left unchanged"""
+        ctx = copy.copy(ctx)
+        ctx.metadata = copy.deepcopy(ctx.metadata)
+        ctx = self._make_template_ctx(ctx)
+        return {
+            filename: self._render(ctx, filename) for filename in self._generated_files
+        }
+
     def _add_debian_depends_from_depends(self, ctx):
         depends = ctx.metadata.get('depends')
         if not isinstance(depends, (list, tuple)):
@@ -103,9 +125,8 @@ class Generator:
 
     def _generate_file(self, ctx, filename):
         file_path = os.path.join(ctx.debian_dir, filename)
-        template = self._env.get_template(self._template_files[filename])
         with open(file_path, 'w') as f:
-            content = template.render(ctx.template_context)
+            content = self._render(ctx, filename)
             ctx.log(logger.debug, 'generated %s\n%s', file_path, content)
             f.write(content)
 
@@ -115,6 +136,10 @@ class Generator:
 
         return ctx
 
+    def _render(self, ctx, filename):
+        template = self._env.get_template(self._template_files[filename])
+        return template.render(ctx.template_context)
+
     def _generate_rules_path(self, ctx):
         return os.path.join(
             self._metadata_dir, ctx.namespace, ctx.name, self._rules_path
@@ -1,4 +1,4 @@
-# Copyright 2017-2023 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2017-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import logging
@@ -7,13 +7,14 @@ import os
 from marshmallow import ValidationError
 
 from . import db
-from .db import PluginDB
 from .exceptions import (
     DependencyAlreadyInstalledException,
     InvalidInstallParamException,
     UnsupportedDownloadMethod,
 )
+from .git_cache import get_git_cache
 from .helpers import exec_and_log
+from .market import get_market_cache
 from .schema import PluginInstallSchema
 
 logger = logging.getLogger(__name__)
@@ -22,11 +23,20 @@ logger = logging.getLogger(__name__)
 class _GitDownloader:
     def __init__(self, config):
         self._download_dir = config['download_dir']
+        self._git_cache = (
+            get_git_cache(config) if config['git_cache']['enabled'] else None
+        )
 
     def download(self, ctx):
         url, ref = ctx.install_options['url'], ctx.install_options['ref']
         filename = os.path.join(self._download_dir, ctx.uuid)
 
+        if self._git_cache:
+            log_debug = ctx.get_logger(logger.debug)
+            commit = self._git_cache.export(url, ref, filename, log_debug=log_debug)
+            ctx.log(logger.debug, 'exported %s from %s at %s', commit, url, ref)
+            return ctx.with_fields(download_path=filename, source_commit=commit)
+
         cmd = ['git', 'clone', '--branch', ref, '--depth', '1', url, filename]
 
         proc = exec_and_log(logger.debug, logger.error, cmd)
@@ -40,7 +50,7 @@ class _MarketDownloader:
     _defaults = {'method': 'git'}
 
     def __init__(self, config, downloader):
-        self._market_config = config['market']
+        self._config = config
         self._downloader = downloader
 
     def download(self, ctx):
@@ -84,8 +94,8 @@ class _MarketDownloader:
         return installed_version == required_version
 
     def _find_matching_plugin(self, ctx):
-        plugin_db = PluginDB(ctx.config)
-        market_proxy = db.MarketProxy(self._market_config)
+        plugin_db = db.get_plugin_db(ctx.config)
+        market_proxy = db.MarketProxy(get_market_cache(self._config))
         market_db = db.MarketDB(market_proxy, ctx.wazo_version, plugin_db)
         required_version = ctx.install_options.get('version')
         search_params = dict(ctx.install_options)
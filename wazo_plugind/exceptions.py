@@ -1,13 +1,14 @@
-# Copyright 2017-2023 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2017-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 from xivo.rest_api_helpers import APIException
 
 
 class CommandExecutionFailed(Exception):
-    def __init__(self, command, return_code):
+    def __init__(self, command, return_code, output=None):
         self._command = command
         self._return_code = return_code
+        self.output = output or []
 
     def __str__(self):
         return f'{self._command} returned {self._return_code}'
@@ -114,6 +115,14 @@ class PluginValidationException(Exception, _MarshmallowDetailFormatter):
         self.details = self.format_details(errors)
 
 
+class DependencyCycleException(PluginValidationException):
+    error_id = 'dependency-cycle'
+    message = 'Dependency cycle'
+
+    def __init__(self, cycle):
+        self.details = {'cycle': cycle}
+
+
 class PluginNotFoundException(APIException):
     def __init__(self, namespace, name):
         super().__init__(
@@ -125,6 +134,28 @@ class PluginNotFoundException(APIException):
         )
 
 
+class InstallNotFoundException(APIException):
+    def __init__(self, uuid):
+        super().__init__(
+            status_code=404,
+            message=f'Installation not found {uuid}',
+            error_id='install-not-found',
+            resource='installs',
+            details={'uuid': uuid},
+        )
+
+
+class CacheNotFoundException(APIException):
+    def __init__(self, name):
+        super().__init__(
+            status_code=404,
+            message=f'Cache not found {name}',
+            error_id='cache-not-found',
+            resource='caches',
+            details={'name': name},
+        )
+
+
 class PluginAlreadyInstalled(Exception):
     _fmt = '{}/{} is already installed'
 
@@ -0,0 +1,212 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import contextlib
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from collections import defaultdict
+
+from .exceptions import CommandExecutionFailed
+from .helpers import exec_and_log
+
+logger = logging.getLogger(__name__)
+
+_git_cache = None
+_git_cache_lock = threading.Lock()
+
+# only the branches and tags are kept, not the other refs like GitHub's refs/pull/*
+_REFSPECS = ['+refs/heads/*:refs/heads/*', '+refs/tags/*:refs/tags/*']
+# .archive- files were left by the versions exporting the plugins with `git archive`
+_TEMPORARY_PREFIXES = ('.clone-', '.archive-')
+
+
+class GitMirrorCache:
+    """Keeps a bare copy of the branches and tags of each git repository plugins are
+    installed from
+
+    The first installation from a URL clones the repository, the next ones only fetch the
+    new objects. When the repository cannot be fetched the refs already in the mirror are
+    used. The requested ref is checked out, on a detached HEAD, in a local clone of the
+    mirror whose origin is the URL of the repository. The objects are hard linked when the
+    mirror and the destination are on the same filesystem, the clone does not depend on the
+    mirror once created.
+
+    When the mirrors use more than `max_size` bytes the least recently used ones are
+    removed. Mirrors being used and the last one used are never removed.
+    """
+
+    def __init__(self, directory, max_size):
+        self._directory = directory
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._mirror_locks = defaultdict(threading.Lock)
+        self._temporary_paths = set()
+
+    def export(self, url, ref, destination, log_debug=logger.debug):
+        """Checks out `ref` in a clone at `destination` and returns the checked out commit"""
+        key = self._key(url)
+        mirror_path = os.path.join(self._directory, key)
+        with self._mirror_lock(key):
+            fetch_error = None
+            if os.path.isdir(mirror_path):
+                try:
+                    self._fetch(mirror_path, log_debug)
+                except CommandExecutionFailed as e:
+                    logger.warning(
+                        'failed to fetch %s, using the cached mirror: %s', url, e
+                    )
+                    fetch_error = e
+            else:
+                self._clone(url, mirror_path, log_debug)
+            os.utime(mirror_path)
+
+            commit = self._resolve(mirror_path, ref)
+            if commit is None:
+                if fetch_error:
+                    raise fetch_error
+                raise Exception(f'Unknown git ref {ref}')
+            self._checkout(mirror_path, url, commit, destination, log_debug)
+
+        self.evict(keep=key)
+        return commit
+
+    def evict(self, keep=None):
+        self.remove_leftovers()
+        if not self._max_size:
+            return
+
+        mirrors = []
+        for key in self._list_keys():
+            mirror_path = os.path.join(self._directory, key)
+            with contextlib.suppress(OSError):
+                mirrors.append((os.stat(mirror_path).st_mtime, key, _size(mirror_path)))
+
+        total = sum(size for _, _, size in mirrors)
+        for _, key, size in sorted(mirrors):
+            if total <= self._max_size:
+                break
+            if key == keep:
+                continue
+
+            lock = self._mirror_lock(key)
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                logger.info('removing the git mirror %s from the cache', key)
+                shutil.rmtree(os.path.join(self._directory, key), ignore_errors=True)
+            finally:
+                lock.release()
+            total -= size
+
+    def purge(self):
+        self.remove_leftovers()
+        for key in self._list_keys():
+            with self._mirror_lock(key):
+                shutil.rmtree(os.path.join(self._directory, key), ignore_errors=True)
+        logger.info('git mirror cache purged')
+
+    def remove_leftovers(self):
+        """Removes the temporary files left by an interrupted clone or export"""
+        for name in _list_dir(self._directory):
+            if not name.startswith(_TEMPORARY_PREFIXES):
+                continue
+            path = os.path.join(self._directory, name)
+            with self._lock:
+                if path in self._temporary_paths:
+                    continue
+            logger.info('removing the leftover %s from the git cache', name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(path)
+
+    def _clone(self, url, mirror_path, log_debug):
+        os.makedirs(self._directory, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(dir=self._directory, prefix='.clone-')
+        self._track(tmp_path)
+        try:
+            cmd = ['git', 'clone', '--bare', '--quiet', url, tmp_path]
+            exec_and_log(log_debug, logger.error, cmd)
+            os.rename(tmp_path, mirror_path)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        finally:
+            self._untrack(tmp_path)
+
+    def _fetch(self, mirror_path, log_debug):
+        cmd = ['git', 'fetch', '--prune', '--quiet', 'origin', *_REFSPECS]
+        exec_and_log(log_debug, logger.error, cmd, cwd=mirror_path)
+
+    def _resolve(self, mirror_path, ref):
+        cmd = ['git', 'rev-parse', '--verify', '--quiet', f'{ref}^{{commit}}']
+        p = subprocess.run(cmd, cwd=mirror_path, capture_output=True, text=True)
+        if p.returncode:
+            return None
+        return p.stdout.strip()
+
+    def _checkout(self, mirror_path, url, commit, destination, log_debug):
+        cmd = ['git', 'clone', '--quiet', '--no-checkout', mirror_path, destination]
+        exec_and_log(log_debug, logger.error, cmd)
+        for cmd in (
+            ['git', 'checkout', '--quiet', '--detach', commit],
+            ['git', 'remote', 'set-url', 'origin', url],
+        ):
+            exec_and_log(log_debug, logger.error, cmd, cwd=destination)
+
+    def _track(self, path):
+        with self._lock:
+            self._temporary_paths.add(path)
+
+    def _untrack(self, path):
+        with self._lock:
+            self._temporary_paths.discard(path)
+
+    def _list_keys(self):
+        return [name for name in _list_dir(self._directory) if not name.startswith('.')]
+
+    def _mirror_lock(self, key):
+        with self._lock:
+            return self._mirror_locks[key]
+
+    @staticmethod
+    def _key(url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def from_config(cls, config):
+        git_cache_config = config['git_cache']
+        cache = cls(git_cache_config['directory'], git_cache_config['max_size'])
+        cache.remove_leftovers()
+        return cache
+
+
+def _list_dir(path):
+    try:
+        return os.listdir(path)
+    except FileNotFoundError:
+        return []
+
+
+def _size(path):
+    total = 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            with contextlib.suppress(OSError):
+                total += os.lstat(os.path.join(root, filename)).st_size
+    return total
+
+
+def get_git_cache(config):
+    global _git_cache
+    with _git_cache_lock:
+        if not _git_cache:
+            logger.debug('Creating a new git mirror cache...')
+            _git_cache = GitMirrorCache.from_config(config)
+    return _git_cache
@@ -1,9 +1,11 @@
-# Copyright 2017-2023 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2017-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import logging
 import os
+import selectors
 import subprocess
+from collections import deque
 
 from wazo_auth_client import Client as AuthClient
 from wazo_confd_client import Client as ConfdClient
@@ -12,22 +14,65 @@ from xivo.token_renewer import TokenRenewer
 from wazo_plugind.exceptions import CommandExecutionFailed
 
 _DEFAULT_PLUGIN_FORMAT_VERSION = 0
+_OUTPUT_TAIL_LINES = 50
+_MAX_LINE_LENGTH = 64 * 1024
 
 logger = logging.getLogger(__name__)
 
 
-def exec_and_log(stdout_logger, stderr_logger, *args, **kwargs):
+def exec_and_log(
+    stdout_logger,
+    stderr_logger,
+    *args,
+    on_line=None,
+    tail_lines=_OUTPUT_TAIL_LINES,
+    **kwargs,
+):
+    """Executes a command and logs its output line by line while it runs
+
+    `on_line` is called with the name of the stream and each line. Only the last `tail_lines`
+    lines are kept in memory, they are attached to the CommandExecutionFailed error.
+    """
     p = subprocess.Popen(
         *args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs
     )
-    out, err = p.communicate()
     cmd = ' '.join(args[0])
-    if out:
-        stdout_logger('%s\n==== STDOUT ====\n%s==== END ====', cmd, out.decode('utf8'))
-    if err:
-        stdout_logger('%s\n==== STDERR====\n%s==== END ====', cmd, err.decode('utf8'))
+    stdout_logger('%s', cmd)
+    tail = deque(maxlen=tail_lines)
+
+    def emit(stream, data):
+        line = data.decode('utf8', errors='replace')
+        stdout_logger('%s %s: %s', cmd, stream, line)
+        tail.append(line)
+        if on_line:
+            on_line(stream, line)
+
+    with selectors.DefaultSelector() as selector:
+        selector.register(p.stdout, selectors.EVENT_READ, ('STDOUT', bytearray()))
+        selector.register(p.stderr, selectors.EVENT_READ, ('STDERR', bytearray()))
+        while selector.get_map():
+            for key, _ in selector.select():
+                stream, buffer = key.data
+                data = os.read(key.fd, 65536)
+                if not data:
+                    if buffer:
+                        emit(stream, bytes(buffer))
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+                    continue
+
+                buffer.extend(data)
+                *lines, rest = buffer.split(b'\n')
+                for line in lines:
+                    emit(stream, line)
+                buffer[:] = rest
+                if len(buffer) > _MAX_LINE_LENGTH:
+                    emit(stream, bytes(buffer))
+                    buffer.clear()
+
+    p.wait()
     if p.returncode != 0:
-        raise CommandExecutionFailed(args[0], p.returncode)
+        raise CommandExecutionFailed(args[0], p.returncode, list(tail))
     return p
 
 
@@ -0,0 +1,56 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Runs a call once for all the callers asking for the same key at the same time
+
+    The first caller executes the function. The callers arriving while it runs wait for it
+    and receive the same result or exception instead of executing it again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._waiters = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                leader = False
+                self._waiters[key] += 1
+            else:
+                leader = True
+                future = self._calls[key] = Future()
+                self._waiters[key] = 0
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._done(key)
+            future.set_exception(e)
+            raise
+        self._done(key)
+        future.set_result(result)
+        return result
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+    def waiters(self, key):
+        """Returns the number of callers waiting for the running call of `key`"""
+        with self._lock:
+            return self._waiters.get(key, 0)
+
+    def _done(self, key):
+        with self._lock:
+            del self._calls[key]
+            del self._waiters[key]
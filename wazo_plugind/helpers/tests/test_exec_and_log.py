@@ -0,0 +1,54 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import sys
+from unittest import TestCase
+from unittest.mock import Mock
+
+from hamcrest import assert_that, contains_exactly, equal_to, has_length
+
+from ...exceptions import CommandExecutionFailed
+from .. import exec_and_log
+
+
+def python(code):
+    return [sys.executable, '-c', code]
+
+
+class TestExecAndLog(TestCase):
+    def test_that_each_line_is_received_while_the_command_runs(self):
+        code = (
+            'import sys\n'
+            'print("one", flush=True)\n'
+            'print("two", file=sys.stderr, flush=True)\n'
+            'sys.stdout.write("three")\n'
+        )
+        on_line = Mock()
+
+        p = exec_and_log(Mock(), Mock(), python(code), on_line=on_line)
+
+        assert_that(p.returncode, equal_to(0))
+        on_line.assert_any_call('STDOUT', 'one')
+        on_line.assert_any_call('STDERR', 'two')
+        on_line.assert_any_call('STDOUT', 'three')
+        assert_that(on_line.call_count, equal_to(3))
+
+    def test_that_the_tail_of_the_output_is_attached_to_the_error(self):
+        code = 'import sys\nfor i in range(1000): print(i)\nsys.exit(2)'
+
+        try:
+            exec_and_log(Mock(), Mock(), python(code), tail_lines=3)
+        except CommandExecutionFailed as e:
+            assert_that(e.output, contains_exactly('997', '998', '999'))
+        else:
+            self.fail('CommandExecutionFailed not raised')
+
+    def test_that_long_lines_are_split(self):
+        code = 'import sys\nsys.stdout.write("x" * 200000)'
+        on_line = Mock()
+
+        exec_and_log(Mock(), Mock(), python(code), on_line=on_line)
+
+        lines = [call.args[1] for call in on_line.call_args_list]
+        assert_that(''.join(lines), has_length(200000))
+        assert_that(max(len(line) for line in lines) < 200000, equal_to(True))
@@ -0,0 +1,81 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+from unittest.mock import Mock
+
+from hamcrest import assert_that, equal_to, same_instance
+
+from ..singleflight import SingleFlight
+
+
+class TestSingleFlight(TestCase):
+    def setUp(self):
+        self.single_flight = SingleFlight()
+
+    def test_that_concurrent_callers_share_one_call(self):
+        callers = 10
+        release = threading.Event()
+        fn = Mock(side_effect=lambda: release.wait(5) and 'result')
+
+        with ThreadPoolExecutor(callers) as executor:
+            futures = [
+                executor.submit(self.single_flight.do, 'key', fn)
+                for _ in range(callers)
+            ]
+            _wait_for(lambda: self.single_flight.waiters('key') == callers - 1)
+            release.set()
+            results = [future.result(5) for future in futures]
+
+        assert_that(results, equal_to(['result'] * callers))
+        fn.assert_called_once_with()
+
+    def test_that_the_exception_is_shared(self):
+        callers = 5
+        release = threading.Event()
+        error = ValueError('failed')
+
+        def fail():
+            release.wait(5)
+            raise error
+
+        fn = Mock(side_effect=fail)
+
+        with ThreadPoolExecutor(callers) as executor:
+            futures = [
+                executor.submit(self.single_flight.do, 'key', fn)
+                for _ in range(callers)
+            ]
+            _wait_for(lambda: self.single_flight.waiters('key') == callers - 1)
+            release.set()
+            errors = [future.exception(5) for future in futures]
+
+        for raised in errors:
+            assert_that(raised, same_instance(error))
+        fn.assert_called_once_with()
+        assert_that(self.single_flight.in_flight('key'), equal_to(False))
+
+    def test_that_sequential_calls_are_executed(self):
+        fn = Mock(return_value='result')
+
+        self.single_flight.do('key', fn)
+        self.single_flight.do('key', fn)
+
+        assert_that(fn.call_count, equal_to(2))
+
+    def test_that_keys_are_independent(self):
+        fn = Mock(side_effect=lambda value: value)
+
+        assert_that(self.single_flight.do('a', fn, 'a'), equal_to('a'))
+        assert_that(self.single_flight.do('b', fn, 'b'), equal_to('b'))
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('condition not met')
+        time.sleep(0.01)
@@ -1,9 +1,10 @@
-# Copyright 2018-2023 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2018-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 from unittest import TestCase
 
 from hamcrest import assert_that, equal_to
+from looseversion import LooseVersion
 
 from .. import version
 
@@ -18,3 +19,33 @@ class TestLessThan(TestCase):
         assert_that(version.less_than('1.0.0', '1.0.0-1'), equal_to(True))
         assert_that(version.less_than('1.0.1', '1.0.0-1'), equal_to(False))
         assert_that(version.less_than('1.0.0-2', '1.0.0-10'), equal_to(True))
+
+    def test_less_than_with_invalid_versions(self):
+        assert_that(version.less_than(5, 10), equal_to(False))
+        assert_that(version.less_than(5, '10'), equal_to(True))
+        assert_that(version.less_than('17.10', 18), equal_to(True))
+        assert_that(version.less_than(17.1, '17.10'), equal_to(True))
+
+    def test_less_than_same_as_loose_version(self):
+        versions = [
+            '0.1',
+            '0.1.0',
+            '0.10',
+            '1.0.0-1',
+            '17.12',
+            '18.01',
+            '2.0rc1',
+            '2.0',
+        ]
+        for left in versions:
+            for right in versions:
+                expected = LooseVersion(left) < LooseVersion(right)
+                result = version.less_than(left, right)
+                assert_that(result, equal_to(expected), f'{left} < {right}')
+
+
+class TestVersionKey(TestCase):
+    def test_version_key(self):
+        assert_that(version.version_key('17.10'), equal_to((17, 10)))
+        assert_that(version.version_key('1.0.0-2'), equal_to((1, 0, 0, '-', 2)))
+        assert_that(version.version_key('2.0rc1'), equal_to((2, 0, 'rc', 1)))
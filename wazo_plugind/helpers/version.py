@@ -1,6 +1,8 @@
-# Copyright 2018-2025 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2018-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+from functools import lru_cache
+
 from looseversion import LooseVersion
 
 
@@ -10,20 +12,14 @@ def less_than(left, right):
     if not right:
         return False
 
-    left = _make_comparable_version(left)
-    right = _make_comparable_version(right)
-
-    return left < right
+    if not isinstance(left, str) and not isinstance(right, str):
+        # Not a valid version number fallback to alphabetic ordering
+        return str(left) < str(right)
 
+    return version_key(str(left)) < version_key(str(right))
 
-def _make_comparable_version(version):
-    try:
-        value_tmp = LooseVersion(version)
-        value_tmp.version  # raise AttributeError if value is None
-        version = value_tmp
-    except (TypeError, AttributeError):
-        # Integer raise TypeError
-        # Not a valid version number fallback to alphabetic ordering
-        version = str(version)
 
-    return version
+@lru_cache(maxsize=1024)
+def version_key(version):
+    """Returns a tuple that compares like the LooseVersion of the version string"""
+    return tuple(LooseVersion(version).version)
@@ -1,15 +1,18 @@
 # Copyright 2017-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import hashlib
 import logging
+import time
 from importlib.resources import files
 
 import requests
 import yaml
-from flask import Flask, make_response, request
+from flask import Flask, g, make_response, request
 from flask_cors import CORS
 from flask_restful import Api, Resource
 from marshmallow import ValidationError
+from werkzeug.http import quote_etag
 from werkzeug.local import LocalProxy as Proxy
 from xivo import http_helpers
 from xivo.auth_verifier import required_acl, required_tenant
@@ -18,6 +21,7 @@ from xivo.http_helpers import add_logger, reverse_proxy_fix_api_spec
 from xivo.rest_api_helpers import handle_api_exception
 from xivo.status import Status
 
+from . import metrics
 from .exceptions import (
     InvalidInstallParamException,
     InvalidInstallQueryStringException,
@@ -72,6 +76,21 @@ def required_master_tenant():
     return required_tenant(master_tenant_uuid)
 
 
+def _conditional_response(fingerprint, make_body):
+    """Returns a 304 if the client already has the current version of the resource
+
+    The ETag is derived from the fingerprint of the data used to build the response and
+    from the requested URL. The body is only built when the ETag does not match.
+    """
+    state = f'{request.full_path}\0{fingerprint!r}'
+    etag = hashlib.sha256(state.encode('utf-8')).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+    return make_body(), 200, {'ETag': quote_etag(etag)}
+
+
 class _BaseResource(Resource):
     method_decorators = [handle_api_exception] + Resource.method_decorators
 
@@ -122,18 +141,20 @@ class Market(_AuthentificatedResource):
 
         market_proxy = self.plugin_service.new_market_proxy()
         try:
-            plugin_list = self.plugin_service.list_from_market(
-                market_proxy, **list_params
+            fingerprint = self.plugin_service.market_fingerprint(market_proxy)
+            return _conditional_response(
+                fingerprint, lambda: self._query(market_proxy, list_params)
             )
         except requests.exceptions.ConnectionError:
             raise MarketNotFoundException
-        items = MarketListResultSchema().load(plugin_list, many=True)
+
+    def _query(self, market_proxy, list_params):
+        result = self.plugin_service.query_market(market_proxy, **list_params)
+        items = MarketListResultSchema().load(result['items'], many=True)
         return {
             'items': items,
-            'total': self.plugin_service.count_from_market(market_proxy, **list_params),
-            'filtered': self.plugin_service.count_from_market(
-                market_proxy, filtered=True, **list_params
-            ),
+            'total': result['total'],
+            'filtered': result['filtered'],
         }
 
     @classmethod
@@ -149,7 +170,11 @@ class MarketItem(_AuthentificatedResource):
     @required_acl('plugind.market.read')
     def get(self, namespace, name):
         market_proxy = self.plugin_service.new_market_proxy()
-        return self.plugin_service.get_from_market(market_proxy, namespace, name)
+        fingerprint = self.plugin_service.market_fingerprint(market_proxy)
+        return _conditional_response(
+            fingerprint,
+            lambda: self.plugin_service.get_from_market(market_proxy, namespace, name),
+        )
 
     @classmethod
     def add_resource(cls, api, *args, **kwargs):
@@ -163,10 +188,13 @@ class Plugins(_AuthentificatedResource):
     @required_master_tenant()
     @required_acl('plugind.plugins.read')
     def get(self):
-        return {
-            'items': self.plugin_service.list_(),
-            'total': self.plugin_service.count(),
-        }
+        return _conditional_response(
+            self.plugin_service.plugins_fingerprint(),
+            lambda: {
+                'items': self.plugin_service.list_(),
+                'total': self.plugin_service.count(),
+            },
+        )
 
     @required_master_tenant()
     @required_acl('plugind.plugins.create')
@@ -203,8 +231,69 @@ class PluginsItem(_AuthentificatedResource):
     @required_master_tenant()
     @required_acl('plugind.plugins.{namespace}.{name}.read')
     def get(self, namespace, name):
-        plugin_metadata = self.plugin_service.get_plugin_metadata(namespace, name)
-        return plugin_metadata
+        return _conditional_response(
+            self.plugin_service.plugins_fingerprint(),
+            lambda: self.plugin_service.get_plugin_metadata(namespace, name),
+        )
+
+    @classmethod
+    def add_resource(cls, api, *args, **kwargs):
+        cls.plugin_service = kwargs['plugin_service']
+        super().add_resource(api, *args, **kwargs)
+
+
+class Installs(_AuthentificatedResource):
+    api_path = '/installs'
+
+    @required_master_tenant()
+    @required_acl('plugind.installs.read')
+    def get(self):
+        items = self.plugin_service.list_jobs()
+        return {'items': items, 'total': len(items)}
+
+    @classmethod
+    def add_resource(cls, api, *args, **kwargs):
+        cls.plugin_service = kwargs['plugin_service']
+        super().add_resource(api, *args, **kwargs)
+
+
+class InstallsItem(_AuthentificatedResource):
+    api_path = '/installs/<uuid>'
+
+    @required_master_tenant()
+    @required_acl('plugind.installs.{uuid}.read')
+    def get(self, uuid):
+        return self.plugin_service.get_job(uuid)
+
+    @classmethod
+    def add_resource(cls, api, *args, **kwargs):
+        cls.plugin_service = kwargs['plugin_service']
+        super().add_resource(api, *args, **kwargs)
+
+
+class InstallsLog(_AuthentificatedResource):
+    api_path = '/installs/<uuid>/log'
+
+    @required_master_tenant()
+    @required_acl('plugind.installs.{uuid}.log.read')
+    def get(self, uuid):
+        items = self.plugin_service.get_install_log(uuid)
+        return {'items': items, 'total': len(items)}
+
+    @classmethod
+    def add_resource(cls, api, *args, **kwargs):
+        cls.plugin_service = kwargs['plugin_service']
+        super().add_resource(api, *args, **kwargs)
+
+
+class CachesItem(_AuthentificatedResource):
+    api_path = '/caches/<name>'
+
+    @required_master_tenant()
+    @required_acl('plugind.caches.{name}.delete')
+    def delete(self, name):
+        self.plugin_service.purge_cache(name)
+        return '', 204
 
     @classmethod
     def add_resource(cls, api, *args, **kwargs):
@@ -225,6 +314,16 @@ class StatusChecker(_AuthentificatedResource):
         super().add_resource(api, *args, **kwargs)
 
 
+class Metrics(_AuthentificatedResource):
+    api_path = '/metrics'
+
+    @required_master_tenant()
+    @required_acl('plugind.metrics.read')
+    def get(self):
+        body = metrics.REGISTRY.render()
+        return make_response(body, 200, {'Content-Type': metrics.CONTENT_TYPE})
+
+
 class Swagger(_BaseResource):
     api_package = 'wazo_plugind.openapi'
     api_filename = 'api.yml'
@@ -269,12 +368,30 @@ class MultiAPI:
                 api.add_resource(resource)
 
 
+def _start_request_timer():
+    g.request_started_at = time.monotonic()
+
+
+def _observe_request_duration(response):
+    started_at = g.pop('request_started_at', None)
+    if started_at is not None:
+        metrics.http_request_duration.observe(
+            time.monotonic() - started_at,
+            method=request.method,
+            resource=request.endpoint or 'unknown',
+            status=response.status_code,
+        )
+    return response
+
+
 def new_app(config, *args, **kwargs):
     cors_config = config['rest_api']['cors']
     app = Flask('wazo_plugind')
     add_logger(app, logger)
     app.config.update(config)
+    app.before_request(_start_request_timer)
     app.after_request(http_helpers.log_request)
+    app.after_request(_observe_request_duration)
     master_tenant.init_app(app)
 
     APIv02 = PlugindAPI(
@@ -286,7 +403,12 @@ def new_app(config, *args, **kwargs):
     MultiAPI(APIv02).add_resource(MarketItem)
     MultiAPI(APIv02).add_resource(PluginsItem)
     MultiAPI(APIv02).add_resource(Plugins)
+    MultiAPI(APIv02).add_resource(Installs)
+    MultiAPI(APIv02).add_resource(InstallsItem)
+    MultiAPI(APIv02).add_resource(InstallsLog)
+    MultiAPI(APIv02).add_resource(CachesItem)
     MultiAPI(APIv02).add_resource(StatusChecker)
+    MultiAPI(APIv02).add_resource(Metrics)
 
     if cors_config.pop('enabled', False):
         CORS(app, **cors_config)
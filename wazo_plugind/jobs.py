@@ -0,0 +1,253 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import contextlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+_job_registry = None
+_job_registry_lock = threading.Lock()
+
+PENDING = 'pending'
+RUNNING = 'running'
+COMPLETED = 'completed'
+ERROR = 'error'
+INTERRUPTED = 'interrupted'
+
+_FINISHED_STATES = (COMPLETED, ERROR, INTERRUPTED)
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class JobRegistry:
+    """Keeps the state of the recent install and uninstall tasks
+
+    Each job records its state, the steps it went through with their duration and its
+    errors. Only the last `max_jobs` jobs are kept. When a `persist_file` is configured the
+    jobs are written to disk on each change and loaded back at startup, the jobs that were
+    running when the service stopped are marked as interrupted.
+    """
+
+    def __init__(self, max_jobs=100, persist_file=None, clock=time.monotonic):
+        self._max_jobs = max_jobs
+        self._persist_file = persist_file
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._persist_lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._step_started_at = {}
+        self._version = 0
+        self._persisted_version = 0
+
+    def create(self, uuid, action, **fields):
+        with self._lock:
+            self._create(uuid, action, fields)
+            snapshot = self._snapshot()
+        self._persist(snapshot)
+
+    def update(self, uuid, action, step, errors=None):
+        with self._lock:
+            job = self._jobs.get(uuid) or self._create(uuid, action, {})
+            self._end_current_step(uuid, job)
+
+            job['step'] = step
+            job['updated_at'] = _now()
+            if step == ERROR:
+                job['state'] = ERROR
+                job['errors'] = errors
+            elif step == COMPLETED:
+                job['state'] = COMPLETED
+            else:
+                job['state'] = RUNNING
+                job['steps'].append({'step': step, 'started_at': job['updated_at']})
+                self._step_started_at[uuid] = self._clock()
+            snapshot = self._snapshot()
+        self._persist(snapshot)
+
+    def set_step_timing(self, uuid, step, timing):
+        with self._lock:
+            job = self._jobs.get(uuid)
+            if not job:
+                return
+            for job_step in reversed(job['steps']):
+                if job_step['step'] == step:
+                    job_step['duration'] = timing['wall_time']
+                    job_step.update(timing)
+                    break
+            snapshot = self._snapshot()
+        self._persist(snapshot)
+
+    def get(self, uuid):
+        with self._lock:
+            job = self._jobs.get(uuid)
+            return _copy_job(job) if job else None
+
+    def list_(self):
+        with self._lock:
+            return [_copy_job(job) for job in reversed(self._jobs.values())]
+
+    def load(self):
+        if not self._persist_file:
+            return
+
+        try:
+            with open(self._persist_file) as f:
+                jobs = json.load(f)
+            if not isinstance(jobs, list):
+                raise TypeError(f'expected a list of jobs, got {type(jobs).__name__}')
+        except (OSError, ValueError, TypeError) as e:
+            logger.info('No usable job file %s: %s', self._persist_file, e)
+            return
+
+        with self._lock:
+            for job in jobs:
+                if not _is_valid_job(job):
+                    logger.info(
+                        'Ignoring an invalid job in %s: %r', self._persist_file, job
+                    )
+                    continue
+                if job.get('state') not in _FINISHED_STATES:
+                    job['state'] = INTERRUPTED
+                self._jobs[job['uuid']] = job
+            self._trim()
+
+    def _create(self, uuid, action, fields):
+        created_at = _now()
+        job = {
+            'uuid': uuid,
+            'action': action,
+            'state': PENDING,
+            'step': None,
+            'steps': [],
+            'errors': None,
+            'created_at': created_at,
+            'updated_at': created_at,
+            **fields,
+        }
+        self._jobs[uuid] = job
+        self._trim()
+        return job
+
+    def _end_current_step(self, uuid, job):
+        started_at = self._step_started_at.pop(uuid, None)
+        if started_at is None or not job['steps']:
+            return
+        job['steps'][-1].setdefault('duration', self._clock() - started_at)
+
+    def _trim(self):
+        while len(self._jobs) > self._max_jobs:
+            for uuid, job in self._jobs.items():
+                if job['state'] in _FINISHED_STATES:
+                    break
+            else:
+                return
+            del self._jobs[uuid]
+            self._step_started_at.pop(uuid, None)
+
+    def _snapshot(self):
+        if not self._persist_file:
+            return None
+        self._version += 1
+        return self._version, [_copy_job(job) for job in self._jobs.values()]
+
+    def _persist(self, snapshot):
+        if snapshot is None:
+            return
+
+        version, jobs = snapshot
+        with self._persist_lock:
+            # a concurrent update may already have written a more recent snapshot
+            if version <= self._persisted_version:
+                return
+            self._write(jobs)
+            self._persisted_version = version
+
+    def _write(self, jobs):
+        directory = os.path.dirname(self._persist_file)
+        try:
+            fd, tmp_filename = tempfile.mkstemp(dir=directory, prefix='.jobs-')
+        except OSError as e:
+            logger.info('Failed to write the job file: %s', e)
+            return
+
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(jobs, f)
+            os.replace(tmp_filename, self._persist_file)
+        except (OSError, TypeError, ValueError) as e:
+            logger.info('Failed to write the job file: %s', e)
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_filename)
+
+    @classmethod
+    def from_config(cls, config):
+        jobs_config = config['jobs']
+        registry = cls(jobs_config['max_jobs'], jobs_config['persist_file'])
+        registry.load()
+        return registry
+
+
+class JobPublisher:
+    """Records the progress of the tasks in the job registry and publishes it on the bus"""
+
+    def __init__(self, publisher, job_registry):
+        self._publisher = publisher
+        self._job_registry = job_registry
+
+    def install(self, ctx, status):
+        self._job_registry.update(ctx.uuid, 'install', status)
+        self._publisher.install(ctx, status)
+
+    def install_error(self, ctx, error_id, message, details=None):
+        errors = _errors(error_id, message, details)
+        self._job_registry.update(ctx.uuid, 'install', ERROR, errors=errors)
+        self._publisher.install_error(ctx, error_id, message, details=details)
+
+    def step_timing(self, ctx, action, step, timing):
+        self._job_registry.set_step_timing(ctx.uuid, step, timing)
+        self._publisher.step_timing(ctx, action, step, timing)
+
+    def uninstall(self, ctx, status):
+        self._job_registry.update(ctx.uuid, 'uninstall', status)
+        self._publisher.uninstall(ctx, status)
+
+    def uninstall_error(self, ctx, error_id, message, details=None):
+        errors = _errors(error_id, message, details)
+        self._job_registry.update(ctx.uuid, 'uninstall', ERROR, errors=errors)
+        self._publisher.uninstall_error(ctx, error_id, message, details=details)
+
+
+def _errors(error_id, message, details):
+    return {'error_id': error_id, 'message': message, 'details': details or {}}
+
+
+def _is_valid_job(job):
+    return (
+        isinstance(job, dict)
+        and isinstance(job.get('uuid'), str)
+        and isinstance(job.get('steps'), list)
+        and all(isinstance(step, dict) for step in job['steps'])
+    )
+
+
+def _copy_job(job):
+    return {**job, 'steps': [dict(step) for step in job['steps']]}
+
+
+def get_job_registry(config):
+    global _job_registry
+    with _job_registry_lock:
+        if not _job_registry:
+            logger.debug('Creating a new job registry...')
+            _job_registry = JobRegistry.from_config(config)
+    return _job_registry
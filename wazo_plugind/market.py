@@ -0,0 +1,242 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import contextlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from wazo_market_client import Client as MarketClient
+from xivo.status import Status
+
+from . import metrics
+from .db import MarketCatalog
+from .helpers.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+_market_cache = None
+_market_cache_lock = threading.Lock()
+
+
+class MarketCache:
+    """A process wide cache of the content of the plugin market
+
+    The content is considered fresh for `ttl` seconds. Once expired it is still served for
+    `stale_while_revalidate` seconds while a background thread fetches a new version. Past
+    that delay, the next caller fetches the content from the market.
+
+    Concurrent fetches are coalesced, the callers arriving while the market is being fetched
+    wait for that request and share its result.
+
+    When a `snapshot_file` is configured, each fetched content is written to disk and loaded
+    back at startup. The last known content is served when the market cannot be reached.
+    """
+
+    def __init__(
+        self,
+        client,
+        ttl,
+        stale_while_revalidate=0,
+        snapshot_file=None,
+        clock=time.monotonic,
+    ):
+        self._client = client
+        self._ttl = ttl
+        self._stale_while_revalidate = stale_while_revalidate
+        self._snapshot_file = snapshot_file
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._catalog = None
+        self._fetched_at = None
+        self._refreshing = False
+        self._single_flight = SingleFlight()
+
+    def get_catalog(self):
+        with self._lock:
+            catalog, age = self._catalog, self._age()
+
+        if catalog is not None:
+            if age < self._ttl:
+                metrics.market_cache_requests.inc(result='fresh')
+                return catalog
+            if age < self._ttl + self._stale_while_revalidate:
+                metrics.market_cache_requests.inc(result='stale')
+                self._refresh_in_background()
+                return catalog
+
+        try:
+            catalog = self._refresh()
+        except Exception as e:
+            if catalog is None:
+                raise
+            logger.info(
+                'Failed to fetch the market, using the last known content: %s', e
+            )
+            metrics.market_cache_requests.inc(result='fallback')
+            return catalog
+        metrics.market_cache_requests.inc(result='miss')
+        return catalog
+
+    def refresh(self):
+        return self._refresh()
+
+    def invalidate(self):
+        with self._lock:
+            self._catalog = None
+            self._fetched_at = None
+
+    def _age(self):
+        if self._fetched_at is None:
+            return None
+        return self._clock() - self._fetched_at
+
+    def load_snapshot(self):
+        if not self._snapshot_file:
+            return
+
+        try:
+            with open(self._snapshot_file) as f:
+                snapshot = json.load(f)
+            content, fetched_at = snapshot['items'], snapshot['fetched_at']
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.info('No usable market snapshot %s: %s', self._snapshot_file, e)
+            return
+
+        age = max(time.time() - fetched_at, 0)
+        with self._lock:
+            if self._catalog is not None:
+                return
+            self._catalog = MarketCatalog(content)
+            self._fetched_at = self._clock() - age
+        logger.debug(
+            'Loaded the market snapshot %s (%ds old)', self._snapshot_file, age
+        )
+
+    def provide_status(self, status):
+        with self._lock:
+            catalog, age = self._catalog, self._age()
+        status['market']['status'] = Status.ok if catalog is not None else Status.fail
+        status['market']['snapshot_age'] = int(age) if age is not None else None
+
+    def _refresh(self):
+        return self._single_flight.do('market', self._fetch)
+
+    def _fetch(self):
+        start = time.monotonic()
+        try:
+            content = self._client.plugins.list()['items']
+        except Exception:
+            duration = time.monotonic() - start
+            metrics.market_fetch_duration.observe(duration, result='error')
+            raise
+        duration = time.monotonic() - start
+        metrics.market_fetch_duration.observe(duration, result='ok')
+
+        catalog = MarketCatalog(content)
+        with self._lock:
+            self._catalog = catalog
+            self._fetched_at = self._clock()
+        self._write_snapshot(catalog.items)
+        return catalog
+
+    def _write_snapshot(self, content):
+        if not self._snapshot_file:
+            return
+
+        snapshot = {'fetched_at': time.time(), 'items': content}
+        directory = os.path.dirname(self._snapshot_file)
+        try:
+            fd, tmp_filename = tempfile.mkstemp(dir=directory, prefix='.market-')
+        except OSError as e:
+            logger.info('Failed to write the market snapshot: %s', e)
+            return
+
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_filename, self._snapshot_file)
+        except (OSError, TypeError, ValueError) as e:
+            logger.info('Failed to write the market snapshot: %s', e)
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_filename)
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        thread = threading.Thread(
+            target=self._background_refresh, name='market-cache-refresh', daemon=True
+        )
+        thread.start()
+
+    def _background_refresh(self):
+        try:
+            self._refresh()
+        except Exception as e:
+            logger.info('Failed to refresh the market content: %s', e)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    @classmethod
+    def from_config(cls, config):
+        cache_config = config['market_cache']
+        cache = cls(
+            MarketClient(**config['market']),
+            cache_config['ttl'],
+            cache_config['stale_while_revalidate'],
+            cache_config['snapshot_file'],
+        )
+        cache.load_snapshot()
+        return cache
+
+
+class MarketPrefetcher:
+    """Refreshes the market cache on a schedule in a background thread"""
+
+    def __init__(self, market_cache, interval):
+        self._market_cache = market_cache
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name='market-prefetcher', daemon=True
+        )
+
+    def start(self):
+        if not self._interval:
+            logger.debug('market prefetching is disabled')
+            return
+        logger.debug('starting the market prefetcher every %ss', self._interval)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self._market_cache.refresh()
+            except Exception as e:
+                logger.info('Failed to prefetch the market content: %s', e)
+            self._stopped.wait(self._interval)
+
+    @classmethod
+    def from_config(cls, config, market_cache):
+        return cls(market_cache, config['market_cache']['prefetch_interval'])
+
+
+def get_market_cache(config):
+    global _market_cache
+    with _market_cache_lock:
+        if not _market_cache:
+            logger.debug('Creating a new market cache...')
+            _market_cache = MarketCache.from_config(config)
+    return _market_cache
@@ -0,0 +1,311 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import bisect
+import math
+import resource
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STEP_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+class Registry:
+    """Holds the metrics of the process and renders them in the Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'duplicate metric {metric.name}')
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class _Metric:
+    type_ = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self._documentation = documentation
+        self._labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def render(self):
+        yield f'# HELP {self.name} {self._documentation}'
+        yield f'# TYPE {self.name} {self.type_}'
+        yield from self._render_samples()
+
+    def _key(self, labels):
+        if set(labels) != set(self._labelnames):
+            raise ValueError(f'{self.name} expects the labels {self._labelnames}')
+        return tuple(str(labels[name]) for name in self._labelnames)
+
+    def _format_labels(self, key, **extra):
+        pairs = list(zip(self._labelnames, key)) + list(extra.items())
+        if not pairs:
+            return ''
+        labels = ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+        return '{' + labels + '}'
+
+
+class Counter(_Metric):
+    type_ = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f'{self.name}_total{self._format_labels(key)} {_format(value)}'
+
+
+class Gauge(_Metric):
+    type_ = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f'{self.name}{self._format_labels(key)} {_format(value)}'
+
+
+class Histogram(_Metric):
+    type_ = 'histogram'
+
+    def __init__(self, *args, buckets=DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._buckets = tuple(sorted(buckets))
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            counts, count, total = self._values.get(
+                key, ([0] * len(self._buckets), 0, 0)
+            )
+            if index < len(counts):
+                counts[index] += 1
+            self._values[key] = counts, count + 1, total + value
+
+    def time(self, **labels):
+        return _HistogramTimer(self, labels)
+
+    def count(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), (None, 0, 0))[1]
+
+    def _render_samples(self):
+        with self._lock:
+            values = sorted(
+                (key, (list(counts), count, total))
+                for key, (counts, count, total) in self._values.items()
+            )
+
+        for key, (counts, count, total) in values:
+            cumulative = 0
+            for bucket, bucket_count in zip(self._buckets, counts):
+                cumulative += bucket_count
+                labels = self._format_labels(key, le=_format(bucket))
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = self._format_labels(key, le='+Inf')
+            yield f'{self.name}_bucket{labels} {count}'
+            yield f'{self.name}_sum{self._format_labels(key)} {_format(total)}'
+            yield f'{self.name}_count{self._format_labels(key)} {count}'
+
+
+class _HistogramTimer:
+    def __init__(self, histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.monotonic()
+        return self
+
+    def __exit__(self, *args):
+        self._histogram.observe(time.monotonic() - self._start, **self._labels)
+
+
+class StepTimer:
+    """Measures the wall clock time, the CPU time of the current thread and the resources
+    used by the child processes that terminated while the step ran.
+
+    The child processes resources are counted for the whole process, they include the
+    commands of the other tasks running at the same time.
+    """
+
+    def __enter__(self):
+        self._wall = time.monotonic()
+        self._cpu = time.thread_time()
+        self._children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return self
+
+    def __exit__(self, *args):
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.wall_time = time.monotonic() - self._wall
+        self.cpu_time = time.thread_time() - self._cpu
+        self.children_user_time = children.ru_utime - self._children.ru_utime
+        self.children_system_time = children.ru_stime - self._children.ru_stime
+
+    def as_dict(self):
+        return {
+            'wall_time': round(self.wall_time, 6),
+            'cpu_time': round(self.cpu_time, 6),
+            'children_user_time': round(self.children_user_time, 6),
+            'children_system_time': round(self.children_system_time, 6),
+        }
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+REGISTRY = Registry()
+
+task_step_duration = REGISTRY.register(
+    Histogram(
+        'wazo_plugind_task_step_duration_seconds',
+        'Wall clock duration of the install and uninstall steps',
+        ['action', 'step'],
+        buckets=STEP_BUCKETS,
+    )
+)
+task_step_cpu = REGISTRY.register(
+    Histogram(
+        'wazo_plugind_task_step_cpu_seconds',
+        'CPU time used by wazo-plugind during the install and uninstall steps',
+        ['action', 'step'],
+        buckets=STEP_BUCKETS,
+    )
+)
+task_step_children_cpu = REGISTRY.register(
+    Histogram(
+        'wazo_plugind_task_step_children_cpu_seconds',
+        'CPU time used by the commands run during the install and uninstall steps',
+        ['action', 'step'],
+        buckets=STEP_BUCKETS,
+    )
+)
+task_queue_depth = REGISTRY.register(
+    Gauge(
+        'wazo_plugind_task_queue_depth',
+        'Install and uninstall tasks waiting for a worker thread',
+    )
+)
+tasks_running = REGISTRY.register(
+    Gauge('wazo_plugind_tasks_running', 'Install and uninstall tasks being executed')
+)
+market_cache_requests = REGISTRY.register(
+    Counter(
+        'wazo_plugind_market_cache_requests',
+        'Market cache lookups, by result: fresh, stale, miss or fallback',
+        ['result'],
+    )
+)
+market_fetch_duration = REGISTRY.register(
+    Histogram(
+        'wazo_plugind_market_fetch_duration_seconds',
+        'Duration of the requests to the market, by result: ok or error',
+        ['result'],
+    )
+)
+dpkg_query_duration = REGISTRY.register(
+    Histogram(
+        'wazo_plugind_dpkg_query_duration_seconds',
+        'Duration of the dpkg-query calls listing the installed packages',
+    )
+)
+yaml_parse_duration = REGISTRY.register(
+    Histogram(
+        'wazo_plugind_yaml_parse_duration_seconds',
+        'Duration of the plugin metadata parsing, by source: installed or build',
+        ['source'],
+    )
+)
+metadata_cache_requests = REGISTRY.register(
+    Counter(
+        'wazo_plugind_metadata_cache_requests',
+        'Installed plugin metadata lookups, by result: hit or miss',
+        ['result'],
+    )
+)
+root_worker_queue_wait = REGISTRY.register(
+    Histogram(
+        'wazo_plugind_root_worker_queue_wait_seconds',
+        'Time spent by the root worker commands waiting for their resource',
+        ['command'],
+        buckets=STEP_BUCKETS,
+    )
+)
+root_worker_command_duration = REGISTRY.register(
+    Histogram(
+        'wazo_plugind_root_worker_command_duration_seconds',
+        'Duration of the root worker commands, from the request to the result',
+        ['command'],
+        buckets=STEP_BUCKETS,
+    )
+)
+http_request_duration = REGISTRY.register(
+    Histogram(
+        'wazo_plugind_http_request_duration_seconds',
+        'Duration of the HTTP requests',
+        ['method', 'resource', 'status'],
+    )
+)
@@ -1,30 +1,48 @@
-# Copyright 2017-2023 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2017-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import contextlib
+import itertools
 import logging
 import os
 import signal
 import sys
-from multiprocessing import Event, Process, Queue
-from queue import Empty
-from threading import Lock
-
+import time
+from collections import defaultdict
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from multiprocessing import Pipe, Process
+from threading import Event, Lock, Thread
+
+from . import metrics
+from .exceptions import CommandExecutionFailed
 from .helpers import exec_and_log
+from .helpers.singleflight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
+_STOP = 'stop'
+
 
 class BaseWorker:
+    """Sends commands to a worker process and dispatches its results
+
+    Each command is tagged with a request ID, several commands can be in flight and each
+    result completes the future of the matching request. The worker reports when each
+    command starts, the commands using the same resource wait for each other in its queue.
+    """
+
     name = 'base'
 
-    def __init__(self):
-        self._command_queue = Queue()
-        self._result_queue = Queue()
-        self._stop_requested = Event()
-        self._command_queue_lock = Lock()
-        self._process = Process(
-            target=_run,
-            args=(self._command_queue, self._result_queue, self._stop_requested),
+    def __init__(self, timeouts=None):
+        self._connection, self._worker_connection = Pipe()
+        self._send_lock = Lock()
+        self._pending_lock = Lock()
+        self._pending = {}
+        self._request_ids = itertools.count(1)
+        self._timeouts = dict(timeouts or {})
+        self._process = Process(target=_run, args=(self._worker_connection,))
+        self._reader = Thread(
+            target=self._read_results, name=f'{self.name}-worker-results', daemon=True
         )
 
     def __enter__(self):
@@ -37,25 +55,29 @@ class BaseWorker:
     def run(self):
         logger.info('starting %s worker', self.name)
         self._process.start()
+        # the worker process has its own copy, the results reader gets an EOF when it exits
+        self._worker_connection.close()
+        self._reader.start()
 
     def stop(self):
         logger.info('stopping %s worker', self.name)
-        # unblock the command_queue in the worker
-        self._stop_requested.set()
-
-        # close both queues
-        self._command_queue.close()
-        self._command_queue.join_thread()
-        self._result_queue.close()
-        self._result_queue.join_thread()
+        # the worker stops after the commands it is executing
+        try:
+            self._send(_STOP)
+        except OSError:
+            logger.debug('%s worker is already stopped', self.name)
 
         # wait for the worker process to stop
         if self._process.is_alive():
             self._process.join()
+        if self._reader.is_alive():
+            self._reader.join()
+
+        self._connection.close()
 
         logger.info('%s worker stopped', self.name)
 
-    def send_cmd_and_wait(self, cmd, *args, **kwargs):
+    def send_cmd(self, cmd, *args, **kwargs):
         if not self._process.is_alive():
             logger.info('%s process is dead quitting', self.name)
             # kill the main thread
@@ -63,29 +85,214 @@ class BaseWorker:
             # shutdown the current thread execution so that executor.shutdown does not block
             sys.exit(1)
 
-        with self._command_queue_lock:
-            self._command_queue.put((cmd, args, kwargs))
-            return self._result_queue.get()
+        future = Future()
+        future.request_id = next(self._request_ids)
+        future.cmd = cmd
+        future.sent_at = time.monotonic()
+        future.started = Event()
+        with self._pending_lock:
+            self._pending[future.request_id] = future
+
+        try:
+            self._send(('command', future.request_id, cmd, args, kwargs))
+        except OSError:
+            with self._pending_lock:
+                self._pending.pop(future.request_id, None)
+            raise
+        return future
+
+    def send_cmd_and_wait(self, cmd, *args, timeout=None, **kwargs):
+        """Sends a command and returns its result
+
+        The timeout starts when the command starts, not while it is queued behind the
+        previous commands. A command still running after the timeout is reported and its
+        result is awaited, it cannot be interrupted safely. A queued command is cancelled
+        when the caller stops waiting.
+        """
+        if timeout is None:
+            timeout = self._timeouts.get(cmd)
+
+        future = self.send_cmd(cmd, *args, **kwargs)
+        try:
+            future.started.wait()
+        except BaseException:
+            self.cancel(future)
+            raise
+
+        while True:
+            try:
+                return future.result(timeout)
+            except TimeoutError:
+                logger.warning(
+                    '%s worker: %s is still running after %ds',
+                    self.name,
+                    cmd,
+                    time.monotonic() - future.started_at,
+                )
+
+    def cancel(self, future):
+        """Stops waiting for the result of a command
+
+        A command that did not start is not executed. A command that is already running is
+        left to complete, interrupting dpkg could leave the system in a broken state.
+        """
+        with self._pending_lock:
+            self._pending.pop(future.request_id, None)
+        future.cancel()
+
+        with contextlib.suppress(OSError):
+            self._send(('cancel', future.request_id))
+
+    def _send(self, message):
+        with self._send_lock:
+            self._connection.send(message)
+
+    def _read_results(self):
+        while True:
+            try:
+                message = self._connection.recv()
+            except (EOFError, OSError):
+                break
+            self._handle_message(message)
+
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            with contextlib.suppress(InvalidStateError):
+                future.set_exception(RuntimeError(f'{self.name} worker stopped'))
+            _set_started(future)
+
+    def _handle_message(self, message):
+        kind, request_id, *payload = message
+        if kind == 'started':
+            with self._pending_lock:
+                future = self._pending.get(request_id)
+            if future is not None:
+                _set_started(future)
+            return
+
+        result, queue_wait = payload
+        with self._pending_lock:
+            future = self._pending.pop(request_id, None)
+        if future is None:
+            logger.debug('%s worker: ignoring result of %s', self.name, request_id)
+            return
+
+        duration = time.monotonic() - future.sent_at
+        metrics.root_worker_queue_wait.observe(queue_wait, command=future.cmd)
+        metrics.root_worker_command_duration.observe(duration, command=future.cmd)
+        with contextlib.suppress(InvalidStateError):
+            future.set_result(result)
+        # a command cancelled in the queue returns a result without starting
+        _set_started(future)
+
+
+def _set_started(future):
+    if not future.started.is_set():
+        future.started_at = time.monotonic()
+        future.started.set()
+
+
+class _Batcher:
+    """Groups the requests received while a command is running into a single command
+
+    The first caller sends its request alone. The requests received while it runs are sent
+    together by the next caller and each caller receives the result of its own request.
+    """
+
+    def __init__(self, send_batch):
+        self._send_batch = send_batch
+        self._pending_lock = Lock()
+        self._send_lock = Lock()
+        self._pending = []
+
+    def submit(self, *args):
+        future = Future()
+        with self._pending_lock:
+            self._pending.append((args, future))
+
+        with self._send_lock:
+            if not future.done():
+                with self._pending_lock:
+                    batch, self._pending = self._pending, []
+                self._send(batch)
+
+        return future.result()
+
+    def _send(self, batch):
+        try:
+            results = self._send_batch([args for args, _ in batch])
+        except BaseException as e:
+            for _, future in batch:
+                future.set_exception(e)
+            raise
+
+        if not isinstance(results, (list, tuple)) or len(results) != len(batch):
+            results = [None] * len(batch)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
 
 
 class RootWorker(BaseWorker):
+    """Executes the commands that need to be run as root
+
+    The package lists are not updated again when the last update started less than
+    `update_freshness` seconds ago and the update requests received while an update is
+    running share its result.
+    """
+
     name = 'root'
 
-    def apt_get_update(self, *args, **kwargs):
-        return self.send_cmd_and_wait('update', *args, **kwargs)
+    def __init__(self, timeouts=None, update_freshness=0, clock=time.monotonic):
+        super().__init__(timeouts)
+        self._update_freshness = update_freshness
+        self._clock = clock
+        self._lists_updated_at = None
+        self._update_single_flight = SingleFlight()
+        self._install_batcher = _Batcher(self._install_batch)
+        self._uninstall_batcher = _Batcher(self._uninstall_batch)
+
+    def apt_get_update(self, uuid):
+        updated_at = self._lists_updated_at
+        if (
+            updated_at is not None
+            and self._clock() - updated_at < self._update_freshness
+        ):
+            logger.debug('[%s] package lists are up to date, skipping the update', uuid)
+            return True
+        return self._update_single_flight.do('update', self._apt_get_update, uuid)
+
+    def _apt_get_update(self, uuid):
+        started_at = self._clock()
+        result = self.send_cmd_and_wait('update', uuid)
+        if result is True:
+            self._lists_updated_at = started_at
+        return result
+
+    def install(self, uuid, deb):
+        return self._install_batcher.submit(uuid, deb)
 
-    def install(self, *args, **kwargs):
-        return self.send_cmd_and_wait('install', *args, **kwargs)
+    def uninstall(self, uuid, package_name):
+        return self._uninstall_batcher.submit(uuid, package_name)
+
+    def _install_batch(self, requests):
+        timeout = self._timeouts.get('install')
+        if len(requests) == 1:
+            return [self.send_cmd_and_wait('install', *requests[0], timeout=timeout)]
+        return self.send_cmd_and_wait('install_batch', requests, timeout=timeout)
 
-    def uninstall(self, *args, **kwargs):
-        return self.send_cmd_and_wait('uninstall', *args, **kwargs)
+    def _uninstall_batch(self, requests):
+        timeout = self._timeouts.get('uninstall')
+        if len(requests) == 1:
+            return [self.send_cmd_and_wait('uninstall', *requests[0], timeout=timeout)]
+        return self.send_cmd_and_wait('uninstall_batch', requests, timeout=timeout)
 
 
 class _CommandExecutor:
     def execute(self, cmd, *args, **kwargs):
         fn = getattr(self, cmd, None)
         if not fn:
-            logger.info('root worker received an unknown command "%s"', cmd.name)
+            logger.info('root worker received an unknown command "%s"', cmd)
             return
 
         try:
@@ -105,30 +312,155 @@ class _CommandExecutor:
         p = exec_and_log(logger.debug, logger.error, cmd)
         return p.returncode == 0
 
+    def install_batch(self, requests):
+        debs = [os.path.abspath(deb) for _, deb in requests]
+        for uuid_, deb in requests:
+            logger.debug('[%s] installing %s in a batch...', uuid_, deb)
+        cmd = [
+            'apt-get',
+            'install',
+            '--quiet',
+            '--yes',
+            '--reinstall',
+            '--allow-downgrades',
+            '-o',
+            'Dpkg::Options::=--force-confdef',
+            '-o',
+            'Dpkg::Options::=--force-confold',
+            *debs,
+        ]
+        # same as gdebi --non-interactive, no debconf or configuration file prompt
+        env = {**os.environ, 'DEBIAN_FRONTEND': 'noninteractive'}
+        if self._succeeded(exec_and_log, logger.debug, logger.error, cmd, env=env):
+            return [True] * len(requests)
+
+        logger.info('batch installation failed, installing each package')
+        return [self._succeeded(self.install, uuid_, deb) for uuid_, deb in requests]
+
     def uninstall(self, uuid, package_name):
         logger.debug('[%s] uninstalling %s', uuid, package_name)
         cmd = ['apt-get', 'remove', '--yes', package_name]
         p = exec_and_log(logger.debug, logger.error, cmd)
         return p.returncode == 0
 
+    def uninstall_batch(self, requests):
+        package_names = [package_name for _, package_name in requests]
+        for uuid, package_name in requests:
+            logger.debug('[%s] uninstalling %s in a batch', uuid, package_name)
+        cmd = ['apt-get', 'remove', '--yes', *package_names]
+        if self._succeeded(exec_and_log, logger.debug, logger.error, cmd):
+            return [True] * len(requests)
+
+        logger.info('batch removal failed, removing each package')
+        return [
+            self._succeeded(self.uninstall, uuid, package_name)
+            for uuid, package_name in requests
+        ]
+
+    @staticmethod
+    def _succeeded(fn, *args, **kwargs):
+        try:
+            return bool(fn(*args, **kwargs))
+        except CommandExecutionFailed as e:
+            logger.info('%s', e)
+            return False
+
+
+class _CommandDispatcher:
+    """Executes the commands received by the worker process
+
+    Commands using the same resource run one after the other. The apt and dpkg commands all
+    use the package lists and the dpkg database and are never run concurrently, the callers
+    only wait for their own result.
+    """
+
+    _resources = {
+        'update': 'apt',
+        'install': 'apt',
+        'install_batch': 'apt',
+        'uninstall': 'apt',
+        'uninstall_batch': 'apt',
+    }
+
+    def __init__(self, connection, executor, max_workers=4):
+        self._connection = connection
+        self._executor = executor
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix='root-worker')
+        self._resource_locks = defaultdict(Lock)
+        self._send_lock = Lock()
+        self._queued_lock = Lock()
+        self._queued = set()
+
+    def dispatch(self, request_id, cmd, args, kwargs):
+        resource_lock = self._resource_locks[self._resources.get(cmd, cmd)]
+        with self._queued_lock:
+            self._queued.add(request_id)
+        queued_at = time.monotonic()
+        self._pool.submit(
+            self._execute, resource_lock, queued_at, request_id, cmd, args, kwargs
+        )
+
+    def cancel(self, request_id):
+        with self._queued_lock:
+            self._queued.discard(request_id)
+
+    def stop(self):
+        self._pool.shutdown(wait=True)
+
+    def _execute(self, resource_lock, queued_at, request_id, cmd, args, kwargs):
+        with resource_lock:
+            queue_wait = time.monotonic() - queued_at
+            with self._queued_lock:
+                cancelled = request_id not in self._queued
+                self._queued.discard(request_id)
+
+            if cancelled:
+                logger.info('root worker: %s was cancelled before it started', cmd)
+                result = None
+            else:
+                self._send(('started', request_id), cmd)
+                result = self._executor.execute(cmd, *args, **kwargs)
+
+        self._send(('result', request_id, result, queue_wait), cmd)
+
+    def _send(self, message, cmd):
+        try:
+            with self._send_lock:
+                self._connection.send(message)
+        except OSError:
+            logger.info(
+                'root worker: failed to send the %s message of %s', message[0], cmd
+            )
+
 
 def _ignore_sigterm(signum, frame):
     logger.info('root worker is ignoring a SIGTERM')
 
 
-def _run(command_queue, result_queue, stop_requested):
+def _run(connection):
     logger.info('root worker started')
     os.setsid()
     signal.signal(signal.SIGTERM, _ignore_sigterm)
 
-    executor = _CommandExecutor()
-    while not stop_requested.is_set():
+    dispatcher = _CommandDispatcher(connection, _CommandExecutor())
+    while True:
         try:
-            cmd, args, kwargs = command_queue.get(timeout=0.1)
-        except (KeyboardInterrupt, Empty, Exception):
+            # blocks until a command or the stop sentinel is received
+            message = connection.recv()
+        except KeyboardInterrupt:
             continue
+        except EOFError:
+            logger.info('root worker connection closed')
+            break
+
+        if message == _STOP:
+            break
 
-        result = executor.execute(cmd, *args, **kwargs)
-        result_queue.put(result)
+        kind, request_id, *command = message
+        if kind == 'cancel':
+            dispatcher.cancel(request_id)
+        else:
+            dispatcher.dispatch(request_id, *command)
 
+    dispatcher.stop()
     logger.info('root worker done')
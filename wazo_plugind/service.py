@@ -1,13 +1,21 @@
-# Copyright 2017-2023 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2017-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import logging
 
-from . import db
+from . import db, metrics
+from .artifact_cache import get_artifact_cache
 from .context import Context
-from .exceptions import PluginNotFoundException
+from .exceptions import (
+    CacheNotFoundException,
+    InstallNotFoundException,
+    PluginNotFoundException,
+)
+from .git_cache import get_git_cache
 from .helpers import WazoVersionFinder, exec_and_log
-from .tasks import PackageAndInstallTask, UninstallTask
+from .jobs import get_job_registry
+from .market import get_market_cache
+from .tasks import PackageAndInstallTask, UninstallTask, get_build_log
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +29,8 @@ class PluginService:
         executor,
         plugin_db,
         wazo_version_finder,
+        job_registry,
+        caches=None,
     ):
         self._build_dir = config['build_dir']
         self._deb_file = f'{self._build_dir}.deb'
@@ -30,6 +40,8 @@ class PluginService:
         self._root_worker = root_worker
         self._executor = executor
         self._wazo_version_finder = wazo_version_finder
+        self._job_registry = job_registry
+        self._caches = caches or {}
 
     def _exec(self, ctx, *args, **kwargs):
         log_debug = ctx.get_logger(logger.debug)
@@ -39,10 +51,6 @@ class PluginService:
     def count(self):
         return self._plugin_db.count()
 
-    def count_from_market(self, market_proxy, *args, **kwargs):
-        market_db = self._new_market_db(market_proxy)
-        return market_db.count(*args, **kwargs)
-
     def create(self, method, params, options):
         task = PackageAndInstallTask(self._config, self._root_worker)
         wazo_version = self._wazo_version_finder.get_version()
@@ -54,31 +62,67 @@ class PluginService:
             wazo_version=wazo_version,
         )
         ctx.log(logger.info, 'installing %s with params %s...', options, params)
-        self._executor.submit(task.execute, ctx)
+        self._job_registry.create(
+            ctx.uuid, 'install', method=method, options=options, params=params
+        )
+        self._submit(task, ctx)
         return ctx.uuid
 
+    def get_job(self, uuid):
+        job = self._job_registry.get(uuid)
+        if not job:
+            raise InstallNotFoundException(uuid)
+        return job
+
+    def list_jobs(self):
+        return self._job_registry.list_()
+
+    def get_install_log(self, uuid):
+        lines = get_build_log(self._config).get_lines(uuid)
+        if lines is None:
+            raise InstallNotFoundException(uuid)
+        return lines
+
+    def purge_cache(self, name):
+        cache = self._caches.get(name)
+        if not cache:
+            raise CacheNotFoundException(name)
+        cache.purge()
+
     def get_plugin_metadata(self, namespace, name):
         plugin = self._plugin_db.get_plugin(namespace, name)
         if not plugin.is_installed():
             raise PluginNotFoundException(namespace, name)
         return plugin.metadata()
 
+    def market_fingerprint(self, market_proxy):
+        """Returns a value that changes when the result of a market query may change"""
+        return (
+            market_proxy.get_digest(),
+            self._plugin_db.state_fingerprint(),
+            self._wazo_version_finder.get_version(),
+        )
+
+    def plugins_fingerprint(self):
+        """Returns a value that changes when the installed plugins change"""
+        return self._plugin_db.state_fingerprint()
+
     def new_market_proxy(self):
-        return db.MarketProxy(self._config['market'])
+        return db.MarketProxy(get_market_cache(self._config))
 
     def list_(self):
         return self._plugin_db.list_()
 
     def get_from_market(self, market_proxy, namespace, name):
         market_db = self._new_market_db(market_proxy)
-        results = market_db.list_(namespace=namespace, name=name)
-        for result in results:
-            return result
-        raise PluginNotFoundException(namespace, name)
+        try:
+            return market_db.get(namespace, name)
+        except LookupError:
+            raise PluginNotFoundException(namespace, name)
 
-    def list_from_market(self, market_proxy, *args, **kwargs):
+    def query_market(self, market_proxy, *args, **kwargs):
         market_db = self._new_market_db(market_proxy)
-        return market_db.list_(*args, **kwargs)
+        return market_db.query(*args, **kwargs)
 
     def delete(self, namespace, name):
         ctx = Context(self._config, namespace=namespace, name=name)
@@ -89,15 +133,34 @@ class PluginService:
 
         task = UninstallTask(self._config, self._root_worker)
         ctx = ctx.with_fields(package_name=plugin.debian_package_name)
-        self._executor.submit(task.execute, ctx)
+        self._job_registry.create(ctx.uuid, 'uninstall', namespace=namespace, name=name)
+        self._submit(task, ctx)
         return ctx.uuid
 
+    def _submit(self, task, ctx):
+        metrics.task_queue_depth.inc()
+        future = self._executor.submit(self._execute, task, ctx)
+        future.add_done_callback(lambda _: self._plugin_db.invalidate())
+
+    def _execute(self, task, ctx):
+        metrics.task_queue_depth.dec()
+        metrics.tasks_running.inc()
+        try:
+            return task.execute(ctx)
+        finally:
+            metrics.tasks_running.dec()
+
     def _new_market_db(self, market_proxy):
         current_wazo_version = self._wazo_version_finder.get_version()
         return db.MarketDB(market_proxy, current_wazo_version, self._plugin_db)
 
     @classmethod
     def from_config(cls, config, *args, **kwargs):
-        kwargs['plugin_db'] = db.PluginDB(config)
+        kwargs['plugin_db'] = db.get_plugin_db(config)
         kwargs['wazo_version_finder'] = WazoVersionFinder(config)
+        kwargs['job_registry'] = get_job_registry(config)
+        kwargs['caches'] = {
+            'git': get_git_cache(config),
+            'deb': get_artifact_cache(config),
+        }
         return cls(config, *args, **kwargs)
@@ -1,38 +1,56 @@
-# Copyright 2017-2025 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2017-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import logging
 import os
 import shutil
+import threading
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
 
 import yaml
 from marshmallow import ValidationError
 
-from . import bus, debian, download, schema
+from . import artifact_cache, bus, db, debian, download, metrics, schema
+from .artifact_cache import get_artifact_cache
+from .build_log import BuildLog
 from .context import Context
 from .exceptions import (
     CommandExecutionFailed,
     DependencyAlreadyInstalledException,
+    DependencyCycleException,
     PluginAlreadyInstalled,
     PluginValidationException,
 )
 from .helpers import exec_and_log
 from .helpers.validator import Validator
+from .jobs import JobPublisher, get_job_registry
 
 logger = logging.getLogger(__name__)
 
 _publisher = None
+_build_log = None
+# Not reentrant: an installation never locks the same plugin twice, a dependency on the
+# plugin itself is rejected as a cycle before any dependency is locked
+_plugin_locks = defaultdict(threading.Lock)
+_plugin_locks_lock = threading.Lock()
+
+_DONE = 'done'
+_SKIPPED = 'skipped'
+_FAILED = 'failed'
 
 
 class UninstallTask:
     def __init__(self, config, root_worker):
         self._root_worker = root_worker
         self._remover = _PackageRemover(config, root_worker)
-        self._publisher = get_publisher(config)
+        self._publisher = JobPublisher(get_publisher(config), get_job_registry(config))
         self._debug_enabled = config['debug']
 
     def execute(self, ctx):
-        return self._uninstall_and_publish(ctx)
+        with get_plugin_lock(ctx.namespace, ctx.name):
+            return self._uninstall_and_publish(ctx)
 
     def _uninstall_and_publish(self, ctx):
         try:
@@ -44,7 +62,7 @@ class UninstallTask:
             ]
             for step, fn in steps:
                 self._publisher.uninstall(ctx, step)
-                ctx = fn(ctx)
+                ctx = _run_step(self._publisher, ctx, 'uninstall', step, fn)
         except Exception:
             ctx.log(
                 logger.error,
@@ -59,36 +77,105 @@ class UninstallTask:
 
 class PackageAndInstallTask:
     def __init__(self, config, root_worker):
+        self._config = config
         self._root_worker = root_worker
-        self._builder = _PackageBuilder(
-            config, self._root_worker, self._package_and_install_impl
+        self._builder = _PackageBuilder(config, self._root_worker)
+        self._dependency_resolver = _DependencyResolver(
+            self._prepare_dependency,
+            self._install_dependency,
+            self._cancel_dependency,
+            config['max_concurrent_dependency_builds'],
         )
-        self._publisher = get_publisher(config)
+        self._publisher = JobPublisher(get_publisher(config), get_job_registry(config))
 
     def execute(self, ctx):
-        return self._package_and_install_impl(ctx)
-
-    def _package_and_install_impl(self, ctx):
+        get_build_log(ctx.config).open(ctx.uuid)
         try:
-            step = 'initializing'
+            self._run_steps(
+                ctx,
+                [
+                    ('starting', lambda ctx: ctx),
+                    ('downloading', self._builder.download),
+                    ('extracting', self._builder.extract),
+                    ('validating', self._builder.validate),
+                    ('installing dependencies', self._dependency_resolver.install),
+                    ('building', self._builder.build),
+                    ('packaging', self._builder.package),
+                    ('updating', self._builder.update),
+                    ('installing', self._builder.install),
+                    ('cleaning', self._builder.clean),
+                    ('completed', lambda ctx: ctx),
+                ],
+            )
+        finally:
+            self._builder.unlock(ctx)
 
-            steps = [
+    def _prepare_dependency(self, dependency, wazo_version):
+        ctx = Context(
+            self._config,
+            method='market',
+            install_options=dependency,
+            install_params={'reinstall': False},
+            wazo_version=wazo_version,
+        )
+        ctx.log(logger.info, 'preparing dependency %s', dependency)
+        state, ctx = self._run_steps(
+            ctx,
+            [
                 ('starting', lambda ctx: ctx),
                 ('downloading', self._builder.download),
-                ('extracting', self._builder.extract),
+                ('extracting', partial(self._builder.extract, lock=False)),
                 ('validating', self._builder.validate),
-                ('installing dependencies', self._builder.install_dependencies),
                 ('building', self._builder.build),
                 ('packaging', self._builder.package),
-                ('updating', self._builder.update),
-                ('installing', self._builder.install),
-                ('cleaning', self._builder.clean),
-                ('completed', lambda ctx: ctx),
-            ]
+            ],
+        )
+        if state == _FAILED:
+            # as when the dependencies were installed one by one, the error is published
+            # for the dependency and the installation of the plugin carries on
+            ctx.log(logger.info, 'failed to prepare the dependency %s', dependency)
+        return ctx if state == _DONE else None
+
+    def _install_dependency(self, ctx):
+        self._builder.lock(ctx)
+        try:
+            state, ctx = self._run_steps(
+                ctx,
+                [
+                    # another installation may have installed it while it was prepared
+                    ('validating', self._builder.check_not_installed),
+                    ('updating', self._builder.update),
+                    ('installing', self._builder.install),
+                    ('cleaning', self._builder.clean),
+                    ('completed', lambda ctx: ctx),
+                ],
+            )
+        finally:
+            self._builder.unlock(ctx)
+        if state == _FAILED:
+            ctx.log(
+                logger.info, 'failed to install the dependency %s', ctx.install_options
+            )
+
+    def _cancel_dependency(self, ctx):
+        ctx.log(logger.info, 'dependency %s will not be installed', ctx.install_options)
+        self._builder.clean(ctx)
+        self._publisher.install_error(
+            ctx, 'install-cancelled', 'Installation cancelled'
+        )
 
+    def _run_steps(self, ctx, steps):
+        """Runs the steps of an installation and publishes its progress
+
+        Returns the state of the installation and its context. The installation is skipped
+        when the plugin is already installed.
+        """
+        try:
+            step = 'initializing'
             for step, fn in steps:
                 self._publisher.install(ctx, step)
-                ctx = fn(ctx)
+                ctx = _run_step(self._publisher, ctx, 'install', step, fn)
+            return _DONE, ctx
 
         except CommandExecutionFailed as e:
             ctx.log(
@@ -97,7 +184,7 @@ class PackageAndInstallTask:
                 e,
             )
             self._builder.clean(ctx)
-            details = {'step': step}
+            details = {'step': step, 'output': e.output}
             self._publisher.install_error(
                 ctx, 'install-error', 'Installation error', details=details
             )
@@ -110,14 +197,17 @@ class PackageAndInstallTask:
             )
             self._builder.clean(ctx)
             self._publisher.install(ctx, 'completed')
+            return _SKIPPED, ctx
         except PluginValidationException as e:
             ctx.log(logger.info, 'Plugin validation exception %s', e.details)
             details = dict(e.details)
             details['install_options'] = dict(ctx.install_options)
             self._publisher.install_error(ctx, e.error_id, e.message, details=e.details)
+            self._builder.clean(ctx)
         except DependencyAlreadyInstalledException:
             self._builder.clean(ctx)
             self._publisher.install(ctx, 'completed')
+            return _SKIPPED, ctx
         except Exception:
             debug_enabled = ctx.config['debug']
             ctx.log(
@@ -128,6 +218,170 @@ class PackageAndInstallTask:
             details = {'install_options': dict(ctx.install_options)}
             self._publisher.install_error(ctx, error_id, message, details=details)
             self._builder.clean(ctx)
+        return _FAILED, ctx
+
+
+class _DependencyResolver:
+    """Installs the dependencies of a plugin
+
+    The dependencies of a plugin are listed in its metadata, the graph is discovered while
+    the dependencies are downloaded. Each dependency is prepared once, even when several
+    plugins depend on it, and up to `max_workers` dependencies are built at the same time.
+    The dependencies are then installed in topological order, the ones that do not depend on
+    each other at the same time.
+    """
+
+    def __init__(self, prepare, install, cancel, max_workers):
+        self._prepare = prepare
+        self._install = install
+        self._cancel = cancel
+        self._max_workers = max_workers
+
+    def install(self, ctx):
+        if not ctx.metadata.get('depends'):
+            return ctx
+
+        root = _dependency_key(ctx.metadata)
+        graph = {root: set()}
+        prepared = {}
+        with ThreadPoolExecutor(
+            self._max_workers, thread_name_prefix='dependencies'
+        ) as executor:
+            try:
+                self._prepare_all(ctx, graph, prepared, executor)
+                for level in _topological_levels(graph):
+                    self._install_level(level, prepared, executor)
+            finally:
+                for dependency_ctx in prepared.values():
+                    if dependency_ctx is not None:
+                        self._cancel(dependency_ctx)
+        return ctx
+
+    def _prepare_all(self, ctx, graph, prepared, executor):
+        futures = {}
+
+        def schedule(key, metadata):
+            for dependency in metadata.get('depends') or []:
+                try:
+                    schema.DependencyMetadataSchema().load(dependency)
+                except ValidationError:
+                    ctx.log(logger.info, 'invalid dependency %s skipping', dependency)
+                    continue
+
+                dependency_key = _dependency_key(dependency)
+                graph[key].add(dependency_key)
+                if dependency_key in graph:
+                    continue
+                graph[dependency_key] = set()
+                future = executor.submit(self._prepare, dependency, ctx.wazo_version)
+                futures[future] = dependency_key
+
+        schedule(_dependency_key(ctx.metadata), ctx.metadata)
+        error = None
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = futures.pop(future)
+                try:
+                    prepared[key] = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                if prepared[key] is not None and error is None:
+                    schedule(key, prepared[key].metadata)
+
+        if error:
+            raise error
+
+    def _install_level(self, level, prepared, executor):
+        # the contexts are cleaned by their installation, whether it succeeds or not
+        contexts = [prepared.pop(key, None) for key in level]
+        futures = [executor.submit(self._install, ctx) for ctx in contexts if ctx]
+        for future in futures:
+            future.result()
+
+
+def _dependency_key(metadata):
+    return metadata['namespace'], metadata['name']
+
+
+def _topological_levels(graph):
+    """Groups the dependencies in levels, each level only depends on the previous ones
+
+    All the dependencies are reachable from the plugin being installed, it is alone in the
+    last level which is not returned.
+    """
+    remaining = {key: set(dependencies) for key, dependencies in graph.items()}
+    levels = []
+    while remaining:
+        level = sorted(
+            key
+            for key, dependencies in remaining.items()
+            if not dependencies & remaining.keys()
+        )
+        if not level:
+            raise DependencyCycleException(_find_cycle(remaining))
+        levels.append(level)
+        for key in level:
+            del remaining[key]
+    return levels[:-1]
+
+
+def _find_cycle(graph):
+    path, position = [], {}
+    key = next(iter(graph))
+    while key not in position:
+        position[key] = len(path)
+        path.append(key)
+        key = next(
+            dependency for dependency in sorted(graph[key]) if dependency in graph
+        )
+    return [f'{namespace}/{name}' for namespace, name in path[position[key] :] + [key]]
+
+
+def _run_step(publisher, ctx, action, step, fn):
+    timer = metrics.StepTimer()
+    try:
+        with timer:
+            return fn(ctx)
+    finally:
+        timing = timer.as_dict()
+        children_cpu_time = (
+            timing['children_user_time'] + timing['children_system_time']
+        )
+        ctx.log(
+            logger.info,
+            '%s step "%s" took %.3fs (cpu %.3fs, commands cpu %.3fs)',
+            action,
+            step,
+            timing['wall_time'],
+            timing['cpu_time'],
+            children_cpu_time,
+        )
+        metrics.task_step_duration.observe(
+            timing['wall_time'], action=action, step=step
+        )
+        metrics.task_step_cpu.observe(timing['cpu_time'], action=action, step=step)
+        metrics.task_step_children_cpu.observe(
+            children_cpu_time, action=action, step=step
+        )
+        try:
+            publisher.step_timing(ctx, action, step, timing)
+        except Exception as e:
+            ctx.log(logger.info, 'failed to publish the step timing: %s', e)
+
+
+def get_plugin_lock(namespace, name):
+    with _plugin_locks_lock:
+        return _plugin_locks[(namespace, name)]
+
+
+def get_build_log(config):
+    global _build_log
+    if not _build_log:
+        logger.debug('Creating a new build log...')
+        _build_log = BuildLog.from_config(config, get_publisher(config))
+    return _build_log
 
 
 def get_publisher(config):
@@ -151,24 +405,37 @@ class _PackageRemover:
 
 
 class _PackageBuilder:
-    def __init__(self, config, root_worker, package_install_fn):
+    def __init__(self, config, root_worker):
         self._config = config
         self._downloader = download.Downloader(config)
         self._debian_file_generator = debian.Generator.from_config(config)
+        self._artifact_cache = (
+            get_artifact_cache(config) if config['artifact_cache']['enabled'] else None
+        )
         self._root_worker = root_worker
-        self._package_install_fn = package_install_fn
 
     def build(self, ctx):
         namespace, name = ctx.metadata['namespace'], ctx.metadata['name']
         installer_path = os.path.join(
             ctx.extract_path, self._config['default_install_filename']
         )
+        ctx = ctx.with_fields(
+            installer_path=installer_path, namespace=namespace, name=name
+        )
+        if self._artifact_cache:
+            artifact_key = self._artifact_key(ctx)
+            deb_path = self._deb_path(ctx)
+            if self._artifact_cache.get(artifact_key, deb_path):
+                ctx.log(
+                    logger.info, 'using the cached package of %s/%s', namespace, name
+                )
+                return ctx.with_fields(package_deb_file=deb_path)
+            ctx = ctx.with_fields(artifact_key=artifact_key)
+
         ctx.log(logger.debug, 'building %s/%s', namespace, name)
         cmd = [installer_path, 'build']
         self._exec(ctx, cmd, cwd=ctx.extract_path)
-        return ctx.with_fields(
-            installer_path=installer_path, namespace=namespace, name=name
-        )
+        return ctx
 
     def clean(self, ctx):
         extract_path = getattr(ctx, 'extract_path', None)
@@ -183,13 +450,36 @@ class _PackageBuilder:
         ctx = self._debian_file_generator.generate(ctx)
         cmd = ['dpkg-deb', '--build', ctx.pkgdir]
         self._exec(ctx, cmd, cwd=ctx.extract_path)
-        deb_path = os.path.join(ctx.extract_path, f'{self._config["build_dir"]}.deb')
+        deb_path = self._deb_path(ctx)
+        self._store_artifact(ctx, deb_path)
         return ctx.with_fields(package_deb_file=deb_path)
 
+    def _deb_path(self, ctx):
+        return os.path.join(ctx.extract_path, f'{self._config["build_dir"]}.deb')
+
+    def _artifact_key(self, ctx):
+        source_commit = getattr(ctx, 'source_commit', None)
+        if source_commit:
+            subdirectory = ctx.install_options.get('subdirectory') or ''
+            source = f'{source_commit}:{subdirectory}'
+        else:
+            source = artifact_cache.tree_digest(ctx.extract_path)
+        rendered_files = self._debian_file_generator.render(ctx)
+        return artifact_cache.artifact_key(source, rendered_files, ctx.wazo_version)
+
+    def _store_artifact(self, ctx, deb_path):
+        artifact_key = getattr(ctx, 'artifact_key', None)
+        if not artifact_key:
+            return
+        try:
+            self._artifact_cache.put(artifact_key, deb_path)
+        except OSError as e:
+            ctx.log(logger.info, 'failed to store the package in the cache: %s', e)
+
     def download(self, ctx):
         return self._downloader.download(ctx)
 
-    def extract(self, ctx):
+    def extract(self, ctx, lock=True):
         extract_path = os.path.join(self._config['extract_dir'], ctx.uuid)
         ctx.log(logger.debug, 'extracting to %s', extract_path)
         shutil.rmtree(extract_path, ignore_errors=True)
@@ -200,12 +490,35 @@ class _PackageBuilder:
         metadata_filename = os.path.join(
             extract_path, self._config['default_metadata_filename']
         )
-        with open(metadata_filename) as f:
+        with open(metadata_filename) as f, metrics.yaml_parse_duration.time(
+            source='build'
+        ):
             metadata = yaml.safe_load(f)
-        return ctx.with_fields(
+        ctx = ctx.with_fields(
             metadata=metadata,
             extract_path=extract_path,
         )
+        return self.lock(ctx) if lock else ctx
+
+    def lock(self, ctx):
+        namespace, name = ctx.metadata['namespace'], ctx.metadata['name']
+        plugin_lock = get_plugin_lock(namespace, name)
+        if not plugin_lock.acquire(blocking=False):
+            ctx.log(
+                logger.info,
+                'waiting for another installation of %s/%s to complete',
+                namespace,
+                name,
+            )
+            plugin_lock.acquire()
+        return ctx.with_fields(plugin_lock=plugin_lock)
+
+    def unlock(self, ctx):
+        plugin_lock = getattr(ctx, 'plugin_lock', None)
+        if plugin_lock:
+            plugin_lock.release()
+            ctx.plugin_lock = None
+        return ctx
 
     def validate(self, ctx):
         validator = Validator.new_from_config(
@@ -215,36 +528,21 @@ class _PackageBuilder:
         ctx.install_params['reinstall'] = False
         return ctx
 
+    def check_not_installed(self, ctx):
+        metadata = ctx.metadata
+        plugin_db = db.PluginDB(ctx.config)
+        if plugin_db.is_installed(
+            metadata['namespace'], metadata['name'], metadata['version']
+        ):
+            raise PluginAlreadyInstalled(metadata['namespace'], metadata['name'])
+        return ctx
+
     def install(self, ctx):
         result = self._root_worker.install(ctx.uuid, ctx.package_deb_file)
         if result is not True:
             raise Exception('Installation failed')
         return ctx
 
-    def install_dependencies(self, ctx):
-        dependencies = ctx.metadata.get('depends', [])
-        current_wazo_version = ctx.wazo_version
-        for dependency in dependencies:
-            ctx.log(logger.info, 'installing dependency %s', dependency)
-            self.install_dependency(ctx, dependency, current_wazo_version)
-        return ctx
-
-    def install_dependency(self, ctx, dep, current_wazo_version):
-        try:
-            schema.DependencyMetadataSchema().load(dep)
-        except ValidationError:
-            ctx.log(logger.info, 'invalid dependency %s skipping', dep)
-            return
-
-        ctx = Context(
-            self._config,
-            method='market',
-            install_options=dep,
-            install_params={'reinstall': False},
-            wazo_version=current_wazo_version,
-        )
-        self._package_install_fn(ctx)
-
     def update(self, ctx):
         if not ctx.metadata.get('debian_depends'):
             return ctx
@@ -255,6 +553,9 @@ class _PackageBuilder:
         return ctx
 
     def package(self, ctx):
+        if getattr(ctx, 'package_deb_file', None):
+            return ctx
+
         ctx.log(logger.debug, 'packaging %s/%s', ctx.namespace, ctx.name)
         pkgdir = os.path.join(ctx.extract_path, self._config['build_dir'])
         os.makedirs(pkgdir)
@@ -274,4 +575,5 @@ class _PackageBuilder:
     def _exec(self, ctx, *args, **kwargs):
         log_debug = ctx.get_logger(logger.debug)
         log_error = ctx.get_logger(logger.error)
-        exec_and_log(log_debug, log_error, *args, **kwargs)
+        on_line = partial(get_build_log(self._config).append, ctx.uuid)
+        exec_and_log(log_debug, log_error, *args, on_line=on_line, **kwargs)
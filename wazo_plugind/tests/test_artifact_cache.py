@@ -0,0 +1,94 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from hamcrest import assert_that, contains_exactly, equal_to, is_not
+
+from ..artifact_cache import ArtifactCache, artifact_key, tree_digest
+
+
+class TestArtifactCache(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self.cache = ArtifactCache(self.cache_dir, max_size=0)
+        self.deb = self.write('built.deb', 'package')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, filename, content):
+        path = os.path.join(self.tmp_dir, filename)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_get_unknown_key(self):
+        destination = os.path.join(self.tmp_dir, 'installed.deb')
+
+        assert_that(self.cache.get('unknown', destination), equal_to(False))
+        assert_that(os.path.exists(destination), equal_to(False))
+
+    def test_that_a_stored_package_is_returned(self):
+        self.cache.put('key', self.deb)
+        destination = os.path.join(self.tmp_dir, 'installed.deb')
+
+        result = self.cache.get('key', destination)
+
+        assert_that(result, equal_to(True))
+        with open(destination) as f:
+            assert_that(f.read(), equal_to('package'))
+
+    def test_that_the_least_recently_used_packages_are_evicted(self):
+        self.cache.put('first', self.deb)
+        os.utime(os.path.join(self.cache_dir, 'first.deb'), (0, 0))
+        self.cache._max_size = len('package') + 1
+
+        self.cache.put('second', self.deb)
+
+        assert_that(os.listdir(self.cache_dir), contains_exactly('second.deb'))
+
+    def test_purge(self):
+        self.cache.put('key', self.deb)
+
+        self.cache.purge()
+
+        assert_that(os.listdir(self.cache_dir), equal_to([]))
+
+
+class TestArtifactKey(TestCase):
+    def test_that_the_key_depends_on_each_part(self):
+        key = artifact_key('abcd', {'control': 'Version: 1'}, '26.15')
+
+        assert_that(
+            artifact_key('abcd', {'control': 'Version: 1'}, '26.15'), equal_to(key)
+        )
+        assert_that(
+            artifact_key('efgh', {'control': 'Version: 1'}, '26.15'), is_not(key)
+        )
+        assert_that(
+            artifact_key('abcd', {'control': 'Version: 2'}, '26.15'), is_not(key)
+        )
+        assert_that(
+            artifact_key('abcd', {'control': 'Version: 1'}, '26.16'), is_not(key)
+        )
+
+    def test_tree_digest(self):
+        with tempfile.TemporaryDirectory() as path:
+            os.makedirs(os.path.join(path, 'wazo'))
+            os.makedirs(os.path.join(path, '.git'))
+            with open(os.path.join(path, 'wazo', 'plugin.yml'), 'w') as f:
+                f.write('version: 1')
+            digest = tree_digest(path)
+
+            with open(os.path.join(path, '.git', 'index'), 'w') as f:
+                f.write('ignored')
+            assert_that(tree_digest(path), equal_to(digest))
+
+            with open(os.path.join(path, 'wazo', 'plugin.yml'), 'w') as f:
+                f.write('version: 2')
+            assert_that(tree_digest(path), is_not(digest))
@@ -0,0 +1,63 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from unittest import TestCase
+from unittest.mock import Mock
+
+from hamcrest import assert_that, contains_exactly, equal_to, has_entries
+
+from ..build_log import BuildLog
+
+
+class TestBuildLog(TestCase):
+    def setUp(self):
+        self.publisher = Mock()
+        self.build_log = BuildLog(
+            self.publisher, max_lines=3, max_installs=2, max_event_lines=2
+        )
+
+    def test_that_only_the_last_lines_are_kept(self):
+        for i in range(5):
+            self.build_log.append('uuid', 'STDOUT', str(i))
+
+        lines = self.build_log.get_lines('uuid')
+
+        assert_that([line['line'] for line in lines], contains_exactly('2', '3', '4'))
+
+    def test_that_only_the_last_installs_are_kept(self):
+        self.build_log.open('first')
+        self.build_log.open('second')
+        self.build_log.append('third', 'STDOUT', 'line')
+
+        assert_that(self.build_log.get_lines('first'), equal_to(None))
+        assert_that(self.build_log.get_lines('second'), equal_to([]))
+        assert_that(
+            self.build_log.get_lines('third'),
+            contains_exactly(has_entries(line='line')),
+        )
+
+    def test_that_new_lines_are_published_in_a_single_event(self):
+        self.build_log.append('uuid', 'STDOUT', 'one')
+        self.build_log.append('uuid', 'STDERR', 'two')
+        self.build_log.append('uuid', 'STDOUT', 'three')
+
+        self.build_log.flush()
+        self.build_log.flush()
+
+        self.publisher.install_log.assert_called_once_with(
+            'uuid',
+            [
+                {'stream': 'STDERR', 'line': 'two'},
+                {'stream': 'STDOUT', 'line': 'three'},
+            ],
+        )
+
+    def test_that_publishing_errors_are_ignored(self):
+        self.publisher.install_log.side_effect = Exception
+        self.build_log.append('uuid', 'STDOUT', 'one')
+
+        self.build_log.flush()
+
+        assert_that(
+            self.build_log.get_lines('uuid'), contains_exactly(has_entries(line='one'))
+        )
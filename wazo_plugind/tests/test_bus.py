@@ -1,4 +1,4 @@
-# Copyright 2017-2024 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2017-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 from unittest import TestCase
@@ -10,7 +10,7 @@ from wazo_bus.resources.plugins.events import (
     PluginUninstallProgressEvent,
 )
 
-from wazo_plugind.bus import Publisher
+from wazo_plugind.bus import PluginInstallLogEvent, Publisher
 
 
 @patch.object(Publisher, 'publish')
@@ -42,6 +42,15 @@ class TestPublisher(TestCase):
 
         publish.assert_called_once_with(expected_event)
 
+    def test_that_install_log_publishes_the_lines(self, publish):
+        lines = [{'stream': 'STDOUT', 'line': 'building'}]
+
+        self.publisher.install_log(s.uuid, lines)
+
+        expected_event = PluginInstallLogEvent(s.uuid, lines)
+
+        publish.assert_called_once_with(expected_event)
+
     def test_that_uninstall_publishes_the_right_event(self, publish):
         ctx = Mock(uuid=s.uuid)
 
@@ -1,30 +1,42 @@
-# Copyright 2017-2023 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2017-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import copy
+import os
+import tempfile
 from contextlib import contextmanager
 from unittest import TestCase
 from unittest.mock import Mock, patch
 
+import yaml
 from hamcrest import (
     assert_that,
     calling,
     contains_exactly,
+    contains_inanyorder,
     empty,
     equal_to,
     has_entries,
+    none,
     raises,
+    same_instance,
 )
 
 from ..config import _DEFAULT_CONFIG
 from ..db import (
+    MarketCatalog,
     MarketDB,
     MarketPluginUpdater,
     MarketProxy,
+    MetadataCache,
     Plugin,
     PluginDB,
+    SearchIndex,
+    get_plugin_db,
     iin,
     normalize_caseless,
 )
+from ..debian import PackageDB
 from ..exceptions import InvalidSortParamException
 
 CURRENT_WAZO_VERSION = '17.12'
@@ -32,10 +44,9 @@ CURRENT_WAZO_VERSION = '17.12'
 
 class TestMarketPluginUpdater(TestCase):
     def setUp(self):
-        self.uninstalled_plugin = Mock()
-        self.uninstalled_plugin.is_installed.return_value = False
+        self.installed_versions = {}
         self.plugin_db = Mock(PluginDB)
-        self.plugin_db.get_plugin.return_value = self.uninstalled_plugin
+        self.plugin_db.installed_versions.return_value = self.installed_versions
         self.updater = MarketPluginUpdater(
             self.plugin_db, current_wazo_version=CURRENT_WAZO_VERSION
         )
@@ -152,18 +163,19 @@ class TestMarketPluginUpdater(TestCase):
             has_entries('versions', contains_exactly(has_entries('upgradable', True))),
         )
 
-    @contextmanager
-    def installed_plugin(self, namespace, name, version):
-        metadata = {'name': name, 'namespace': namespace, 'version': version}
+    def test_that_the_installed_versions_are_fetched_once(self):
+        for name in ('foo', 'bar', 'baz'):
+            self.updater.update({'namespace': 'foobar', 'name': name})
 
-        mocked_plugin = Mock(Plugin, namespace=namespace, name=name)
-        mocked_plugin.metadata.return_value = metadata
+        self.plugin_db.installed_versions.assert_called_once_with()
 
-        self.plugin_db.get_plugin.return_value = mocked_plugin
+    @contextmanager
+    def installed_plugin(self, namespace, name, version):
+        self.installed_versions[(namespace, name)] = version
 
         yield
 
-        self.plugin_db.get_plugin.return_value = self.uninstalled_plugin
+        del self.installed_versions[(namespace, name)]
 
 
 class TestPlugin(TestCase):
@@ -196,6 +208,161 @@ class TestPlugin(TestCase):
             assert_that(plugin.is_installed('0.0.1-5'), equal_to(False))
 
 
+class TestPluginDB(TestCase):
+    def setUp(self):
+        self.metadata_dir = tempfile.TemporaryDirectory()
+        self.config = dict(_DEFAULT_CONFIG, metadata_dir=self.metadata_dir.name)
+        self.debian_package_db = Mock(PackageDB)
+        self.debian_package_db.status_fingerprint.return_value = 1
+        self.debian_package_db.list_installed_packages.return_value = [
+            'wazo-plugind-foo-bar',
+            'wazo-plugind-nometadata-bar',
+            'invalid',
+        ]
+        self.add_metadata('bar', 'foo', '0.0.1')
+        self.plugin_db = PluginDB(self.config, self.debian_package_db)
+
+    def tearDown(self):
+        self.metadata_dir.cleanup()
+
+    def test_list(self):
+        result = self.plugin_db.list_()
+
+        assert_that(
+            result,
+            contains_exactly(has_entries(namespace='bar', name='foo', version='0.0.1')),
+        )
+        assert_that(self.plugin_db.count(), equal_to(1))
+
+    def test_that_the_installed_packages_are_listed_once(self):
+        self.plugin_db.list_()
+        self.plugin_db.list_()
+        self.plugin_db.count()
+
+        self.debian_package_db.list_installed_packages.assert_called_once()
+
+    def test_that_a_dpkg_database_change_reloads_the_plugins(self):
+        self.plugin_db.list_()
+        self.add_metadata('bar', 'nometadata', '1.0.0')
+        self.debian_package_db.status_fingerprint.return_value = 2
+
+        result = self.plugin_db.list_()
+
+        assert_that(
+            result,
+            contains_inanyorder(
+                has_entries(name='foo'), has_entries(name='nometadata')
+            ),
+        )
+
+    def test_installed_versions(self):
+        result = self.plugin_db.installed_versions()
+
+        assert_that(result, equal_to({('bar', 'foo'): '0.0.1'}))
+
+    def test_installed_versions_with_an_empty_metadata_file(self):
+        directory = os.path.join(self.metadata_dir.name, 'bar', 'empty', 'wazo')
+        os.makedirs(directory)
+        open(os.path.join(directory, 'plugin.yml'), 'w').close()
+        self.debian_package_db.list_installed_packages.return_value = [
+            'wazo-plugind-foo-bar',
+            'wazo-plugind-empty-bar',
+        ]
+
+        result = self.plugin_db.installed_versions()
+
+        assert_that(result, equal_to({('bar', 'foo'): '0.0.1'}))
+
+    def test_state_fingerprint(self):
+        fingerprint = self.plugin_db.state_fingerprint()
+        assert_that(self.plugin_db.state_fingerprint(), equal_to(fingerprint))
+
+        self.add_metadata('bar', 'other', '1.0.0')
+        assert_that(self.plugin_db.state_fingerprint() == fingerprint, equal_to(False))
+
+        fingerprint = self.plugin_db.state_fingerprint()
+        self.debian_package_db.status_fingerprint.return_value = 2
+        assert_that(self.plugin_db.state_fingerprint() == fingerprint, equal_to(False))
+
+    def test_that_the_registry_is_shared(self):
+        with patch('wazo_plugind.db._plugin_db', None):
+            plugin_db = get_plugin_db(self.config)
+
+            assert_that(get_plugin_db(self.config), same_instance(plugin_db))
+
+    def test_invalidate(self):
+        self.plugin_db.list_()
+
+        self.plugin_db.invalidate()
+        self.plugin_db.list_()
+
+        assert_that(
+            self.debian_package_db.list_installed_packages.call_count, equal_to(2)
+        )
+
+    def add_metadata(self, namespace, name, version):
+        directory = os.path.join(self.metadata_dir.name, namespace, name, 'wazo')
+        os.makedirs(directory)
+        with open(os.path.join(directory, 'plugin.yml'), 'w') as f:
+            f.write(f'namespace: {namespace}\nname: {name}\nversion: {version}\n')
+
+
+class TestMetadataCache(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = MetadataCache(max_size=2)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_that_an_unchanged_file_is_parsed_once(self):
+        filename = self.write('foo.yml', 'version: 0.0.1\n')
+
+        with patch('wazo_plugind.db.yaml.load', wraps=yaml.load) as load:
+            first = self.cache.load(filename)
+            second = self.cache.load(filename)
+
+        assert_that(first, equal_to({'version': '0.0.1'}))
+        assert_that(second, equal_to(first))
+        load.assert_called_once()
+
+    def test_that_a_modified_file_is_parsed_again(self):
+        filename = self.write('foo.yml', 'version: 0.0.1\n')
+        self.cache.load(filename)
+
+        self.write('foo.yml', 'version: 0.0.10\n')
+        result = self.cache.load(filename)
+
+        assert_that(result, equal_to({'version': '0.0.10'}))
+
+    def test_that_the_least_recently_used_file_is_evicted(self):
+        foo = self.write('foo.yml', 'name: foo\n')
+        bar = self.write('bar.yml', 'name: bar\n')
+        baz = self.write('baz.yml', 'name: baz\n')
+        self.cache.load(foo)
+        self.cache.load(bar)
+        self.cache.load(foo)
+
+        self.cache.load(baz)
+
+        with patch('wazo_plugind.db.yaml.load', wraps=yaml.load) as load:
+            self.cache.load(foo)
+            self.cache.load(baz)
+            self.cache.load(bar)
+        load.assert_called_once()
+
+    def test_missing_file(self):
+        filename = os.path.join(self.directory.name, 'missing.yml')
+
+        assert_that(calling(self.cache.load).with_args(filename), raises(OSError))
+
+    def write(self, filename, content):
+        filename = os.path.join(self.directory.name, filename)
+        with open(filename, 'w') as f:
+            f.write(content)
+        return filename
+
+
 class TestIIn(TestCase):
     def test_iin(self):
         truth = [
@@ -266,9 +433,27 @@ class TestMarketDB(TestCase):
             },
         ]
         self.market_proxy = Mock(MarketProxy)
-        self.market_proxy.get_content.return_value = self.content
+        self.market_proxy.get_items.return_value = self.content
+        self.market_proxy.copy_item.side_effect = lambda position: copy.deepcopy(
+            self.content[position]
+        )
+        self.market_proxy.get_search_index.return_value = SearchIndex(self.content)
+        self.market_proxy.get_sorted_positions.side_effect = MarketCatalog(
+            self.content
+        ).sorted_positions
+        self.market_proxy.get_position.side_effect = MarketCatalog(
+            self.content
+        ).position
         self.db = MarketDB(self.market_proxy, CURRENT_WAZO_VERSION)
         self.db._updater = Mock(MarketPluginUpdater)
+        self._set_installed_versions()
+
+    def _set_installed_versions(self):
+        self.db._updater.installed_versions.return_value = {
+            (metadata.get('namespace'), metadata.get('name')): version
+            for metadata in self.content
+            if (version := metadata.get('installed_version'))
+        }
 
     def test_the_installed_param(self):
         a, b, c = self.content
@@ -291,23 +476,19 @@ class TestMarketDB(TestCase):
         assert_that(results, empty())
 
     def test_get(self):
-        self.market_proxy.get_content.return_value = expected_result = [
-            {
-                'namespace': 'foo',
-                'name': 'bar',
-                'verions': [
-                    {'version': '0.1.1'},
-                    {'version': '0.0.1'},
-                    {'version': '0.2.0'},
-                ],
-            },
-        ]
+        a = self.content[0]
+        self.market_proxy.get_item.side_effect = lambda namespace, name: (
+            a if (namespace, name) == ('c', 'a') else None
+        )
+        self.db._updater.update.side_effect = lambda metadata: metadata
 
-        result = self.db.get('foo', 'bar')
-        assert_that(result, expected_result)
+        result = self.db.get('c', 'a')
+        assert_that(result, same_instance(a))
+        self.db._updater.update.assert_called_once_with(a)
 
         # Unknown name
-        assert_that(calling(self.db.get).with_args('foo', 'BAZ'), raises(Exception))
+        assert_that(calling(self.db.get).with_args('c', 'BAZ'), raises(LookupError))
+        self.market_proxy.get_items.assert_not_called()
 
     def test_search(self):
         a, b, c = self.content
@@ -321,6 +502,47 @@ class TestMarketDB(TestCase):
         results = self.db.list_(search='pe')
         assert_that(results, contains_exactly(b))
 
+    def test_search_on_the_installed_version(self):
+        a, b, c = self.content
+        a['installed_version'] = '0.0.1-custom'
+        self.db._updater.installed_versions.return_value = {
+            ('c', 'a'): '0.0.1-custom',
+            ('unknown', 'plugin'): 'custom',
+        }
+
+        results = self.db.list_(search='custom')
+
+        assert_that(results, contains_exactly(a))
+
+    def test_search_with_strict_filter(self):
+        a, b, c = self.content
+
+        results = self.db.list_(search='you', namespace='a')
+        assert_that(results, contains_exactly(c))
+
+        result = self.db.count(filtered=True, search='you', namespace='a')
+        assert_that(result, equal_to(1))
+
+    def test_query(self):
+        a, b, c = self.content
+
+        result = self.db.query(search='you', order='name', limit=1)
+
+        assert_that(
+            result,
+            has_entries(items=contains_exactly(b), total=3, filtered=2),
+        )
+
+    def test_query_copies_and_updates_only_the_returned_entries(self):
+        a, b, c = self.content
+
+        result = self.db.query(order='name', offset=1, limit=1)
+
+        assert_that(result['items'], contains_exactly(b))
+        assert_that(result['items'][0] is b, equal_to(False))
+        self.market_proxy.copy_item.assert_called_once_with(1)
+        self.db._updater.update.assert_called_once_with(result['items'][0])
+
     def test_sort_direction(self):
         a, b, c = self.content
 
@@ -344,6 +566,36 @@ class TestMarketDB(TestCase):
             raises(InvalidSortParamException),
         )
 
+    def test_sort_on_a_field_computed_at_each_request(self):
+        a, b, c = self.content
+        b['installed_version'] = '0.0.5'
+        others = [{'name': str(i), 'installed_version': f'1.{i:02}'} for i in range(20)]
+        self.content.extend(others)
+        self._set_installed_versions()
+
+        results = self.db.list_(order='installed_version', limit=2)
+        assert_that(results, contains_exactly(a, b))
+
+        results = self.db.list_(order='installed_version', direction='desc', limit=2)
+        assert_that(results, contains_exactly(others[19], others[18]))
+
+    def test_sort_on_uncomparable_values_does_not_depend_on_the_limit(self):
+        self.content[:] = [
+            {'name': str(i), 'installed_version': '1'} for i in range(30)
+        ]
+        del self.content[0]['installed_version']
+        del self.content[1]['installed_version']
+        self.content[-1]['installed_version'] = 2
+        self._set_installed_versions()
+
+        for limit in (2, 30):
+            assert_that(
+                calling(self.db.list_).with_args(
+                    order='installed_version', direction='desc', limit=limit
+                ),
+                raises(InvalidSortParamException),
+            )
+
     def test_limit(self):
         a, b, c = self.content
 
@@ -367,3 +619,128 @@ class TestMarketDB(TestCase):
 
         results = self.db.list_(limit=1, offset=1)
         assert_that(results, contains_exactly(b))
+
+
+class TestMarketCatalog(TestCase):
+    def setUp(self):
+        self.items = [
+            {'namespace': 'foo', 'name': 'b', 'd': {}},
+            {'namespace': 'foo', 'name': 'c', 'd': {42: 'bar'}},
+            {'namespace': 'foo', 'name': 'a'},
+        ]
+        self.catalog = MarketCatalog(self.items)
+
+    def test_sorted_positions(self):
+        result = self.catalog.sorted_positions('name')
+
+        assert_that(result, contains_exactly(2, 0, 1))
+        assert_that(self.catalog.sorted_positions('name'), same_instance(result))
+        assert_that(
+            self.catalog.sorted_positions('name', reverse=True),
+            contains_exactly(1, 0, 2),
+        )
+
+    def test_digest(self):
+        digest = self.catalog.digest
+
+        assert_that(MarketCatalog(list(self.items)).digest, equal_to(digest))
+        self.items[0] = {'namespace': 'foo', 'name': 'b', 'd': {'changed': True}}
+        assert_that(MarketCatalog(self.items).digest == digest, equal_to(False))
+
+    def test_sorted_positions_not_shared(self):
+        assert_that(self.catalog.sorted_positions('installed_version'), none())
+        assert_that(self.catalog.sorted_positions('d'), none())
+
+
+class TestMarketProxy(TestCase):
+    def setUp(self):
+        self.items = [
+            {'namespace': 'foo', 'name': 'bar', 'versions': []},
+            {'namespace': 'foo', 'name': 'baz', 'versions': []},
+            {'namespace': 'foo', 'name': 'bar', 'versions': [{'version': '1'}]},
+        ]
+        self.market_cache = Mock()
+        self.market_cache.get_catalog.return_value = MarketCatalog(self.items)
+        self.proxy = MarketProxy(self.market_cache)
+
+    def test_get_item(self):
+        result = self.proxy.get_item('foo', 'bar')
+
+        assert_that(result, equal_to(self.items[0]))
+        assert_that(result is self.items[0], equal_to(False))
+        assert_that(self.proxy.get_item('foo', 'bar'), same_instance(result))
+        assert_that(self.proxy.get_item('foo', 'unknown'), none())
+
+    def test_copy_item(self):
+        result = self.proxy.copy_item(1)
+
+        assert_that(result, equal_to(self.items[1]))
+        assert_that(result is self.items[1], equal_to(False))
+        assert_that(self.proxy.get_item('foo', 'baz'), same_instance(result))
+        assert_that(self.proxy.get_items(), same_instance(self.items))
+
+
+class TestSearchIndex(TestCase):
+    def setUp(self):
+        self.content = [
+            {
+                'name': 'François',
+                'namespace': 'foobar',
+                'tags': ['Pépé', 'voip', ['nested']],
+                'd': {'key': 'value', 42: 'bar'},
+                'versions': [{'version': '0.1.0', 'min_wazo_version': '17.12'}],
+                'installed_version': 'ignored',
+            },
+            {
+                'name': 'bar',
+                'namespace': 'baz',
+                'display_name': 'The Bar Plugin',
+                'tags': [],
+                'count': 42,
+                'author': None,
+            },
+            {'name': 'abc', 'namespace': 'x', 'description': 'Çà et là'},
+        ]
+        self.index = SearchIndex(self.content)
+
+    def test_matches(self):
+        assert_that(self.index.matches('franc'), equal_to({0}))
+        assert_that(self.index.matches('PEPE'), equal_to({0}))
+        assert_that(self.index.matches('ba'), equal_to({0, 1}))
+        assert_that(self.index.matches('bar plug'), equal_to({1}))
+        assert_that(self.index.matches('ca et la'), equal_to({2}))
+        assert_that(self.index.matches('nope'), equal_to(set()))
+
+    def test_that_keys_and_nested_elements_match_exactly(self):
+        assert_that(self.index.matches('key'), equal_to({0}))
+        assert_that(self.index.matches('value'), equal_to(set()))
+        assert_that(self.index.matches('min_wazo_version'), equal_to({0}))
+        assert_that(self.index.matches('upgradable'), equal_to({0}))
+        assert_that(self.index.matches('nested'), equal_to({0}))
+        assert_that(self.index.matches('neste'), equal_to(set()))
+
+    def test_that_the_installed_version_is_not_indexed(self):
+        assert_that(self.index.matches('ignored'), equal_to(set()))
+
+    def test_same_results_as_iin(self):
+        def linear_search(search):
+            result = set()
+            for position, item in enumerate(self.content):
+                for key, value in item.items():
+                    if key == 'installed_version':
+                        continue
+                    if key == 'versions':
+                        value = [{**v, 'upgradable': True} for v in value]
+                    if iin(search, value):
+                        result.add(position)
+                    elif isinstance(value, (list, tuple)) and any(
+                        iin(search, element) for element in value
+                    ):
+                        result.add(position)
+            return result
+
+        searches = ['a', 'A', 'ç', 'e', '42', 'bar', 'tags', 'version', '0.1', 'là', '']
+        for search in searches:
+            assert_that(
+                self.index.matches(search), equal_to(linear_search(search)), search
+            )
@@ -1,4 +1,4 @@
-# Copyright 2017-2023 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2017-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import os
@@ -126,3 +126,29 @@ class TestDebianGenerator(TestCase):
             expected_path = os.path.join(debian_dir, filename)
             with open(expected_path) as f:
                 assert_that(f.read(), equal_to('SUCCESS'))
+
+    def test_that_render_does_not_change_the_context(self):
+        depends = [{'namespace': 'foobar', 'name': 'baz'}]
+        loader = DictLoader(
+            {f'{filename}.jinja': '{{ debian_depends }}' for filename in _FILENAMES}
+        )
+        metadata = {'depends': depends}
+        ctx = Context(
+            _DEFAULT_CONFIG, namespace='foobar', name='foo', metadata=metadata
+        )
+        generator = Generator(
+            Environment(loader=loader),
+            {filename: f'{filename}.jinja' for filename in _FILENAMES},
+            metadata_dir='/usr/lib/wazo-plugind',
+            rules_path='wazo/rules',
+            backup_rules_dir='/var/lib/wazo-plugind/rules',
+        )
+
+        result = generator.render(ctx)
+
+        assert_that(result['control'], equal_to("['wazo-plugind-baz-foobar']"))
+        assert_that(ctx.metadata, equal_to({'depends': depends}))
+        assert_that(hasattr(ctx, 'template_context'), equal_to(False))
+
+
+_FILENAMES = ('control', 'postinst', 'prerm', 'postrm')
@@ -0,0 +1,180 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import shutil
+import subprocess
+import tempfile
+from unittest import TestCase
+
+from hamcrest import (
+    assert_that,
+    calling,
+    contains_exactly,
+    contains_inanyorder,
+    equal_to,
+    raises,
+)
+
+from ..exceptions import CommandExecutionFailed
+from ..git_cache import GitMirrorCache
+
+
+def _git(*args, cwd):
+    env = {
+        **os.environ,
+        'GIT_AUTHOR_NAME': 'test',
+        'GIT_AUTHOR_EMAIL': 'test@example.com',
+        'GIT_COMMITTER_NAME': 'test',
+        'GIT_COMMITTER_EMAIL': 'test@example.com',
+    }
+    p = subprocess.run(
+        ['git', *args], cwd=cwd, env=env, check=True, capture_output=True, text=True
+    )
+    return p.stdout.strip()
+
+
+class TestGitMirrorCache(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.repository = os.path.join(self.tmp_dir, 'repository')
+        os.makedirs(self.repository)
+        _git('init', '--quiet', '--initial-branch=master', cwd=self.repository)
+        self.commit('plugin.yml', 'version: 1')
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self.cache = GitMirrorCache(self.cache_dir, max_size=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def commit(self, filename, content, repository=None):
+        repository = repository or self.repository
+        with open(os.path.join(repository, filename), 'w') as f:
+            f.write(content)
+        _git('add', filename, cwd=repository)
+        _git('commit', '--quiet', '--message', filename, cwd=repository)
+        return _git('rev-parse', 'HEAD', cwd=repository)
+
+    def read(self, destination, filename):
+        with open(os.path.join(self.tmp_dir, destination, filename)) as f:
+            return f.read()
+
+    def export(self, destination, ref='master', url=None):
+        path = os.path.join(self.tmp_dir, destination)
+        return self.cache.export(url or self.repository, ref, path)
+
+    def test_that_the_ref_is_exported(self):
+        commit = self.commit('rules', 'build')
+
+        result = self.export('first')
+
+        assert_that(result, equal_to(commit))
+        assert_that(self.read('first', 'rules'), equal_to('build'))
+        assert_that(os.listdir(self.cache_dir), contains_exactly(_any_key()))
+
+    def test_that_the_ref_is_checked_out_in_a_clone(self):
+        self.commit('.gitattributes', 'rules export-ignore')
+        commit = self.commit('rules', 'build')
+
+        self.export('first')
+        self.cache.purge()
+
+        destination = os.path.join(self.tmp_dir, 'first')
+        assert_that(self.read('first', 'rules'), equal_to('build'))
+        assert_that(_git('rev-parse', 'HEAD', cwd=destination), equal_to(commit))
+        assert_that(
+            _git('remote', 'get-url', 'origin', cwd=destination),
+            equal_to(self.repository),
+        )
+        assert_that(_git('status', '--porcelain', cwd=destination), equal_to(''))
+
+    def test_that_new_commits_are_fetched(self):
+        self.export('first')
+        _git('tag', 'v1', cwd=self.repository)
+        commit = self.commit('plugin.yml', 'version: 2')
+
+        result = self.export('second')
+
+        assert_that(result, equal_to(commit))
+        assert_that(self.read('second', 'plugin.yml'), equal_to('version: 2'))
+        self.export('third', ref='v1')
+        assert_that(self.read('third', 'plugin.yml'), equal_to('version: 1'))
+
+    def test_unknown_ref(self):
+        assert_that(
+            calling(self.export).with_args('first', ref='unknown'), raises(Exception)
+        )
+
+    def test_unknown_url(self):
+        url = os.path.join(self.tmp_dir, 'unknown')
+
+        assert_that(
+            calling(self.export).with_args('first', url=url),
+            raises(CommandExecutionFailed),
+        )
+        assert_that(os.listdir(self.cache_dir), equal_to([]))
+
+    def test_that_the_cached_mirror_is_used_when_the_fetch_fails(self):
+        commit = self.commit('rules', 'build')
+        self.export('first')
+        shutil.move(self.repository, os.path.join(self.tmp_dir, 'moved'))
+
+        result = self.export('second')
+
+        assert_that(result, equal_to(commit))
+        assert_that(self.read('second', 'rules'), equal_to('build'))
+        assert_that(
+            calling(self.export).with_args('third', ref='unknown'),
+            raises(CommandExecutionFailed),
+        )
+
+    def test_that_the_least_recently_used_mirrors_are_evicted(self):
+        other = os.path.join(self.tmp_dir, 'other')
+        os.makedirs(other)
+        _git('init', '--quiet', '--initial-branch=master', cwd=other)
+        self.commit('plugin.yml', 'version: 1', repository=other)
+
+        self.export('first')
+        self.cache._max_size = 1
+        self.export('second', url=other)
+
+        assert_that(
+            os.listdir(self.cache_dir), contains_exactly(self.cache._key(other))
+        )
+
+    def test_that_only_branches_and_tags_are_fetched(self):
+        commit = _git('rev-parse', 'HEAD', cwd=self.repository)
+        _git('update-ref', 'refs/pull/1/head', commit, cwd=self.repository)
+        _git('tag', 'v1', cwd=self.repository)
+
+        self.export('first')
+        self.commit('plugin.yml', 'version: 2')
+        _git('update-ref', 'refs/pull/2/head', 'HEAD', cwd=self.repository)
+        self.export('second')
+
+        mirror = os.path.join(self.cache_dir, self.cache._key(self.repository))
+        refs = _git('for-each-ref', '--format=%(refname)', cwd=mirror).split()
+        assert_that(refs, contains_inanyorder('refs/heads/master', 'refs/tags/v1'))
+
+    def test_that_leftovers_are_removed(self):
+        os.makedirs(os.path.join(self.cache_dir, '.clone-abcd'))
+        open(os.path.join(self.cache_dir, '.archive-abcd'), 'w').close()
+
+        self.export('first')
+
+        assert_that(
+            os.listdir(self.cache_dir),
+            contains_exactly(self.cache._key(self.repository)),
+        )
+
+    def test_purge(self):
+        self.export('first')
+
+        self.cache.purge()
+
+        assert_that(os.listdir(self.cache_dir), equal_to([]))
+
+
+class _any_key:
+    def __eq__(self, other):
+        return len(other) == 64
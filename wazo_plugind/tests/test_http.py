@@ -1,4 +1,4 @@
-# Copyright 2017-2025 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2017-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import json
@@ -6,10 +6,14 @@ from functools import wraps
 from unittest import TestCase
 from unittest.mock import ANY, Mock, patch, sentinel
 
-from hamcrest import assert_that, equal_to, has_entries
+from hamcrest import assert_that, contains_string, equal_to, has_entries, starts_with
 from xivo.status import StatusAggregator
 
-from ..exceptions import PluginNotFoundException
+from ..exceptions import (
+    CacheNotFoundException,
+    InstallNotFoundException,
+    PluginNotFoundException,
+)
 from ..service import PluginService
 
 API_VERSION = '0.2'
@@ -41,6 +45,8 @@ class HTTPAppTestCase(TestCase):
         self.status_aggregator = Mock(StatusAggregator)
         self.plugin_service = Mock(PluginService)
         self.plugin_service.create.return_value = {'create': 'return_value'}
+        self.plugin_service.market_fingerprint.return_value = ('market', 1)
+        self.plugin_service.plugins_fingerprint.return_value = ('plugins', 1)
         self.app = new_app(
             config,
             plugin_service=self.plugin_service,
@@ -63,34 +69,40 @@ class HTTPAppTestCase(TestCase):
 
 class TestMarket(HTTPAppTestCase):
     def test_that_get_returns_results_from_the_service(self):
-        self.plugin_service.count_from_market.return_value = 0
-        self.plugin_service.list_from_market.return_value = []
+        self.plugin_service.query_market.return_value = {
+            'items': [],
+            'total': 3,
+            'filtered': 0,
+        }
 
         status_code, body = self.get()
 
-        expected = {
-            'total': self.plugin_service.count_from_market.return_value,
-            'filtered': self.plugin_service.count_from_market.return_value,
-            'items': self.plugin_service.list_from_market.return_value,
-        }
+        expected = {'total': 3, 'filtered': 0, 'items': []}
         assert_that(body, equal_to(expected))
         assert_that(status_code, equal_to(200))
+        self.plugin_service.query_market.assert_called_once()
 
     def test_errors_on_invalid_limit(self):
-        self.plugin_service.count_from_market.return_value = 0
-        self.plugin_service.list_from_market.return_value = []
+        self.plugin_service.query_market.return_value = {
+            'items': [],
+            'total': 0,
+            'filtered': 0,
+        }
 
         status_code, body = self.get(limit=-1)
 
         assert_that(status_code, equal_to(400))
 
     def test_that_extra_fields_are_used(self):
-        self.plugin_service.list_from_market.return_value = []
-        self.plugin_service.count_from_market.return_value = 0
+        self.plugin_service.query_market.return_value = {
+            'items': [],
+            'total': 0,
+            'filtered': 0,
+        }
 
         status_code, body = self.get(namespace='foobar')
 
-        self.plugin_service.list_from_market.assert_called_once_with(
+        self.plugin_service.query_market.assert_called_once_with(
             ANY,
             namespace='foobar',
             direction=ANY,
@@ -141,6 +153,52 @@ class TestPlugins(HTTPAppTestCase):
 
         assert_that(status_code, equal_to(404))
 
+    def test_list_installs(self):
+        self.plugin_service.list_jobs.return_value = [{'uuid': 'abcd'}]
+
+        result = self.app.get(f'/{API_VERSION}/installs')
+
+        assert_that(result.status_code, equal_to(200))
+        assert_that(result.json, equal_to({'items': [{'uuid': 'abcd'}], 'total': 1}))
+
+    def test_get_install(self):
+        self.plugin_service.get_job.return_value = {'uuid': 'abcd', 'state': 'running'}
+
+        result = self.app.get(f'/{API_VERSION}/installs/abcd')
+
+        assert_that(result.status_code, equal_to(200))
+        assert_that(result.json, equal_to({'uuid': 'abcd', 'state': 'running'}))
+
+    def test_that_a_plugin_named_like_a_job_route_is_fetched(self):
+        self.plugin_service.get_plugin_metadata.return_value = {'name': 'abcd'}
+
+        status_code, response = self.get_plugin('installs', 'abcd')
+
+        assert_that(status_code, equal_to(200))
+        self.plugin_service.get_plugin_metadata.assert_called_once_with(
+            'installs', 'abcd'
+        )
+        self.plugin_service.get_job.assert_not_called()
+
+    def test_get_install_log(self):
+        lines = [{'stream': 'STDOUT', 'line': 'building'}]
+        self.plugin_service.get_install_log.return_value = lines
+
+        result = self.app.get(f'/{API_VERSION}/installs/abcd/log')
+
+        assert_that(result.status_code, equal_to(200))
+        assert_that(result.json, equal_to({'items': lines, 'total': 1}))
+        self.plugin_service.get_install_log.assert_called_once_with('abcd')
+
+    def test_get_install_log_not_found(self):
+        self.plugin_service.get_install_log.side_effect = InstallNotFoundException(
+            'abcd'
+        )
+
+        result = self.app.get(f'/{API_VERSION}/installs/abcd/log')
+
+        assert_that(result.status_code, equal_to(404))
+
     def test_install_with_no_method(self):
         status_code, response = self.post({'options': {'url': 'http://'}})
 
@@ -296,6 +354,91 @@ class TestPlugins(HTTPAppTestCase):
         )
 
 
+class TestConditionalRequests(HTTPAppTestCase):
+    def test_that_an_unchanged_market_is_not_sent_again(self):
+        self.plugin_service.query_market.return_value = {
+            'items': [],
+            'total': 0,
+            'filtered': 0,
+        }
+        etag = self.app.get('/0.2/market').headers['ETag']
+
+        result = self.app.get('/0.2/market', headers={'If-None-Match': etag})
+
+        assert_that(result.status_code, equal_to(304))
+        assert_that(result.headers['ETag'], equal_to(etag))
+        assert_that(result.data, equal_to(b''))
+        self.plugin_service.query_market.assert_called_once()
+
+    def test_that_the_etag_changes_with_the_market(self):
+        self.plugin_service.get_from_market.return_value = {'name': 'bar'}
+        etag = self.app.get('/0.2/market/foo/bar').headers['ETag']
+        self.plugin_service.market_fingerprint.return_value = ('market', 2)
+
+        result = self.app.get('/0.2/market/foo/bar', headers={'If-None-Match': etag})
+
+        assert_that(result.status_code, equal_to(200))
+        assert_that(result.headers['ETag'] == etag, equal_to(False))
+
+    def test_that_the_etag_depends_on_the_url(self):
+        self.plugin_service.get_plugin_metadata.return_value = {'meta': 'data'}
+        etag = self.app.get('/0.2/plugins/foo/bar').headers['ETag']
+
+        result = self.app.get('/0.2/plugins/foo/baz', headers={'If-None-Match': etag})
+
+        assert_that(result.status_code, equal_to(200))
+
+    def test_that_unchanged_plugins_are_not_sent_again(self):
+        self.plugin_service.list_.return_value = []
+        self.plugin_service.count.return_value = 0
+        etag = self.app.get('/0.2/plugins').headers['ETag']
+
+        result = self.app.get('/0.2/plugins', headers={'If-None-Match': etag})
+
+        assert_that(result.status_code, equal_to(304))
+        self.plugin_service.list_.assert_called_once()
+
+
+class TestCaches(HTTPAppTestCase):
+    def test_purge(self):
+        result = self.app.delete(f'/{API_VERSION}/caches/git')
+
+        assert_that(result.status_code, equal_to(204))
+        self.plugin_service.purge_cache.assert_called_once_with('git')
+
+    def test_purge_unknown_cache(self):
+        self.plugin_service.purge_cache.side_effect = CacheNotFoundException('foo')
+
+        result = self.app.delete(f'/{API_VERSION}/caches/foo')
+
+        assert_that(result.status_code, equal_to(404))
+
+
+class TestMetrics(HTTPAppTestCase):
+    def test_that_metrics_are_rendered_as_text(self):
+        result = self.app.get(f'/{API_VERSION}/metrics')
+
+        assert_that(result.status_code, equal_to(200))
+        assert_that(result.content_type, starts_with('text/plain'))
+        assert_that(
+            result.data.decode(),
+            contains_string('# TYPE wazo_plugind_task_step_duration_seconds histogram'),
+        )
+
+    def test_that_the_requests_duration_is_recorded(self):
+        self.app.get(f'/{API_VERSION}/metrics')
+
+        result = self.app.get(f'/{API_VERSION}/metrics')
+
+        assert_that(
+            result.data.decode(),
+            contains_string(
+                'wazo_plugind_http_request_duration_seconds_count'
+                '{method="GET",resource="v02Metrics",status="200"}'
+            ),
+        )
+
+
 class TestMultiAPI(TestCase):
     def test_given_no_apis_when_add_resource_then_nothing(self):
         multi = MultiAPI()
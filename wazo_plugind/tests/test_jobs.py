@@ -0,0 +1,178 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import json
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import Mock
+
+from hamcrest import assert_that, contains_exactly, equal_to, has_entries
+
+from ..jobs import JobPublisher, JobRegistry
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestJobRegistry(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.registry = JobRegistry(max_jobs=2, clock=self.clock)
+
+    def test_that_steps_are_timed(self):
+        self.registry.create('uuid', 'install', method='git')
+        self.registry.update('uuid', 'install', 'downloading')
+        self.clock.now = 3
+        self.registry.update('uuid', 'install', 'building')
+        self.clock.now = 10
+        self.registry.update('uuid', 'install', 'completed')
+
+        job = self.registry.get('uuid')
+
+        assert_that(
+            job,
+            has_entries(
+                uuid='uuid',
+                action='install',
+                method='git',
+                state='completed',
+                step='completed',
+                steps=contains_exactly(
+                    has_entries(step='downloading', duration=3),
+                    has_entries(step='building', duration=7),
+                ),
+            ),
+        )
+
+    def test_that_the_step_timing_is_recorded(self):
+        self.registry.update('uuid', 'install', 'building')
+        timing = {'wall_time': 2.5, 'cpu_time': 0.1}
+        self.registry.set_step_timing('uuid', 'building', timing)
+        self.clock.now = 3
+        self.registry.update('uuid', 'install', 'completed')
+
+        assert_that(
+            self.registry.get('uuid')['steps'],
+            contains_exactly(
+                has_entries(step='building', duration=2.5, wall_time=2.5, cpu_time=0.1)
+            ),
+        )
+
+    def test_that_errors_are_recorded(self):
+        self.registry.update('uuid', 'uninstall', 'removing')
+        self.registry.update('uuid', 'uninstall', 'error', errors={'error_id': 'e'})
+
+        assert_that(
+            self.registry.get('uuid'),
+            has_entries(state='error', errors={'error_id': 'e'}),
+        )
+
+    def test_that_running_jobs_are_not_evicted(self):
+        self.registry.update('running', 'install', 'building')
+        self.registry.create('first', 'install')
+        self.registry.update('first', 'install', 'completed')
+        self.registry.create('second', 'install')
+
+        uuids = [job['uuid'] for job in self.registry.list_()]
+
+        assert_that(uuids, contains_exactly('second', 'running'))
+
+    def test_that_the_jobs_are_persisted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            persist_file = os.path.join(directory, 'jobs.json')
+            registry = JobRegistry(persist_file=persist_file)
+            registry.update('done', 'install', 'completed')
+            registry.update('running', 'install', 'building')
+
+            loaded = JobRegistry(persist_file=persist_file)
+            loaded.load()
+
+        assert_that(loaded.get('done'), has_entries(state='completed'))
+        assert_that(loaded.get('running'), has_entries(state='interrupted'))
+
+    def test_that_the_step_timing_is_persisted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            persist_file = os.path.join(directory, 'jobs.json')
+            registry = JobRegistry(persist_file=persist_file)
+            registry.update('uuid', 'install', 'building')
+            registry.set_step_timing('uuid', 'building', {'wall_time': 2.5})
+
+            loaded = JobRegistry(persist_file=persist_file)
+            loaded.load()
+
+        assert_that(
+            loaded.get('uuid')['steps'],
+            contains_exactly(has_entries(step='building', wall_time=2.5)),
+        )
+
+    def test_that_invalid_jobs_are_not_loaded(self):
+        jobs = [
+            {'uuid': 'valid', 'state': 'completed', 'steps': []},
+            'not a job',
+            {'state': 'completed', 'steps': []},
+            {'uuid': 'no-steps', 'state': 'completed'},
+            {'uuid': 'bad-steps', 'state': 'completed', 'steps': ['building']},
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            persist_file = os.path.join(directory, 'jobs.json')
+            with open(persist_file, 'w') as f:
+                json.dump(jobs, f)
+
+            loaded = JobRegistry(persist_file=persist_file)
+            loaded.load()
+
+        uuids = [job['uuid'] for job in loaded.list_()]
+        assert_that(uuids, contains_exactly('valid'))
+
+    def test_that_an_unusable_job_file_is_ignored(self):
+        with tempfile.TemporaryDirectory() as directory:
+            persist_file = os.path.join(directory, 'jobs.json')
+            for content in ('{"uuid": "abcd"}', '42', 'not json'):
+                with open(persist_file, 'w') as f:
+                    f.write(content)
+
+                loaded = JobRegistry(persist_file=persist_file)
+                loaded.load()
+
+                assert_that(loaded.list_(), equal_to([]))
+
+    def test_that_an_unknown_job_is_none(self):
+        assert_that(self.registry.get('unknown'), equal_to(None))
+
+
+class TestJobPublisher(TestCase):
+    def setUp(self):
+        self.publisher = Mock()
+        self.registry = Mock(JobRegistry)
+        self.job_publisher = JobPublisher(self.publisher, self.registry)
+
+    def test_install(self):
+        ctx = Mock(uuid='uuid')
+
+        self.job_publisher.install(ctx, 'building')
+
+        self.registry.update.assert_called_once_with('uuid', 'install', 'building')
+        self.publisher.install.assert_called_once_with(ctx, 'building')
+
+    def test_uninstall_error(self):
+        ctx = Mock(uuid='uuid')
+
+        self.job_publisher.uninstall_error(ctx, 'removing-error', 'Removing Error')
+
+        expected = {
+            'error_id': 'removing-error',
+            'message': 'Removing Error',
+            'details': {},
+        }
+        self.registry.update.assert_called_once_with(
+            'uuid', 'uninstall', 'error', errors=expected
+        )
+        self.publisher.uninstall_error.assert_called_once_with(
+            ctx, 'removing-error', 'Removing Error', details=None
+        )
@@ -0,0 +1,230 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from hamcrest import assert_that, calling, equal_to, has_entries, raises
+from requests import HTTPError
+
+from ..market import MarketCache, MarketPrefetcher
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestMarketCache(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.client = Mock()
+        self.client.plugins.list.return_value = {'items': [{'name': 'foo'}]}
+        self.cache = MarketCache(
+            self.client, ttl=10, stale_while_revalidate=20, clock=self.clock
+        )
+
+    def test_that_the_content_is_fetched_once_while_fresh(self):
+        first = self.cache.get_catalog().items
+        self.clock.now = 9
+        second = self.cache.get_catalog().items
+
+        assert_that(first, equal_to([{'name': 'foo'}]))
+        assert_that(second, equal_to(first))
+        self.client.plugins.list.assert_called_once_with()
+
+    def test_that_stale_content_is_served_while_revalidating(self):
+        self.cache.get_catalog()
+        self.client.plugins.list.return_value = {'items': [{'name': 'bar'}]}
+        self.clock.now = 15
+
+        with patch.object(self.cache, '_refresh_in_background') as refresh:
+            result = self.cache.get_catalog().items
+
+        assert_that(result, equal_to([{'name': 'foo'}]))
+        refresh.assert_called_once_with()
+
+    def test_that_expired_content_is_fetched_synchronously(self):
+        self.cache.get_catalog()
+        self.client.plugins.list.return_value = {'items': [{'name': 'bar'}]}
+        self.clock.now = 30
+
+        result = self.cache.get_catalog().items
+
+        assert_that(result, equal_to([{'name': 'bar'}]))
+
+    def test_background_refresh(self):
+        self.cache.get_catalog()
+        self.client.plugins.list.return_value = {'items': [{'name': 'bar'}]}
+        self.clock.now = 15
+
+        self.cache._background_refresh()
+
+        assert_that(self.cache.get_catalog().items, equal_to([{'name': 'bar'}]))
+
+    def test_that_background_refresh_errors_keep_the_current_content(self):
+        self.cache.get_catalog()
+        self.client.plugins.list.side_effect = HTTPError(response=Mock())
+        self.clock.now = 15
+
+        self.cache._background_refresh()
+
+        assert_that(self.cache.get_catalog().items, equal_to([{'name': 'foo'}]))
+
+    def test_invalidate(self):
+        self.cache.get_catalog()
+        self.client.plugins.list.side_effect = HTTPError(response=Mock())
+
+        self.cache.invalidate()
+
+        assert_that(calling(self.cache.get_catalog), raises(HTTPError))
+
+    def test_that_the_last_known_content_is_used_when_the_market_is_down(self):
+        self.cache.get_catalog()
+        self.client.plugins.list.side_effect = HTTPError(response=Mock())
+        self.clock.now = 100
+
+        result = self.cache.get_catalog().items
+
+        assert_that(result, equal_to([{'name': 'foo'}]))
+
+    def test_that_concurrent_misses_fetch_the_market_once(self):
+        callers = 10
+        release = threading.Event()
+
+        def list_():
+            release.wait(5)
+            return {'items': [{'name': 'foo'}]}
+
+        self.client.plugins.list.side_effect = list_
+
+        with ThreadPoolExecutor(callers) as executor:
+            futures = [executor.submit(self.cache.get_catalog) for _ in range(callers)]
+            _wait_for(
+                lambda: self.cache._single_flight.waiters('market') == callers - 1
+            )
+            release.set()
+            results = [future.result(5).items for future in futures]
+
+        assert_that(results, equal_to([[{'name': 'foo'}]] * callers))
+        self.client.plugins.list.assert_called_once_with()
+
+    def test_that_cache_lookups_are_counted_by_result(self):
+        with patch('wazo_plugind.market.metrics') as metrics:
+            self.cache.get_catalog()
+            self.cache.get_catalog()
+
+        metrics.market_cache_requests.inc.assert_any_call(result='miss')
+        metrics.market_cache_requests.inc.assert_any_call(result='fresh')
+        metrics.market_fetch_duration.observe.assert_called_once()
+
+    def test_provide_status(self):
+        status = defaultdict(dict)
+        self.cache.provide_status(status)
+        assert_that(status['market'], has_entries(status='fail', snapshot_age=None))
+
+        self.cache.get_catalog()
+        self.clock.now = 5
+        self.cache.provide_status(status)
+        assert_that(status['market'], has_entries(status='ok', snapshot_age=5))
+
+
+class TestMarketCacheSnapshot(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.snapshot_file = os.path.join(self.directory.name, 'market.json')
+        self.client = Mock()
+        self.client.plugins.list.return_value = {'items': [{'name': 'foo'}]}
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_that_the_fetched_content_is_written_to_the_snapshot(self):
+        cache = MarketCache(self.client, ttl=10, snapshot_file=self.snapshot_file)
+
+        cache.get_catalog()
+
+        with open(self.snapshot_file) as f:
+            snapshot = json.load(f)
+        assert_that(snapshot, has_entries(items=[{'name': 'foo'}]))
+        assert_that(os.listdir(self.directory.name), equal_to(['market.json']))
+
+    def test_that_the_snapshot_is_loaded(self):
+        with open(self.snapshot_file, 'w') as f:
+            json.dump({'fetched_at': time.time(), 'items': [{'name': 'bar'}]}, f)
+        cache = MarketCache(self.client, ttl=10, snapshot_file=self.snapshot_file)
+
+        cache.load_snapshot()
+
+        assert_that(cache.get_catalog().items, equal_to([{'name': 'bar'}]))
+        self.client.plugins.list.assert_not_called()
+
+    def test_that_an_invalid_snapshot_is_ignored(self):
+        with open(self.snapshot_file, 'w') as f:
+            f.write('{')
+        cache = MarketCache(self.client, ttl=10, snapshot_file=self.snapshot_file)
+
+        cache.load_snapshot()
+
+        assert_that(cache.get_catalog().items, equal_to([{'name': 'foo'}]))
+
+
+class TestMarketPrefetcher(TestCase):
+    def setUp(self):
+        self.market_cache = Mock(MarketCache)
+        self.prefetcher = MarketPrefetcher(self.market_cache, interval=0.01)
+
+    def test_that_the_cache_is_refreshed_until_stopped(self):
+        self.market_cache.refresh.side_effect = self.stop_after([None, None, None])
+
+        self.prefetcher._run()
+
+        assert_that(self.market_cache.refresh.call_count, equal_to(3))
+
+    def test_that_errors_do_not_stop_the_prefetcher(self):
+        self.market_cache.refresh.side_effect = self.stop_after(
+            [HTTPError(response=Mock()), None]
+        )
+
+        self.prefetcher._run()
+
+        assert_that(self.market_cache.refresh.call_count, equal_to(2))
+
+    def test_that_a_disabled_prefetcher_does_not_start(self):
+        prefetcher = MarketPrefetcher(self.market_cache, interval=0)
+
+        prefetcher.start()
+        prefetcher.stop()
+
+        self.market_cache.refresh.assert_not_called()
+
+    def stop_after(self, results):
+        results = list(results)
+
+        def side_effect():
+            result = results.pop(0)
+            if not results:
+                self.prefetcher._stopped.set()
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        return side_effect
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('condition not met')
+        time.sleep(0.01)
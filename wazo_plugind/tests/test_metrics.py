@@ -0,0 +1,91 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import subprocess
+from unittest import TestCase
+
+from hamcrest import (
+    assert_that,
+    calling,
+    contains_string,
+    equal_to,
+    greater_than,
+    raises,
+)
+
+from ..metrics import Counter, Gauge, Histogram, Registry, StepTimer
+
+
+class TestRegistry(TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_render_counter(self):
+        counter = self.registry.register(Counter('calls', 'Calls', ['kind']))
+        counter.inc(kind='a')
+        counter.inc(2, kind='a')
+
+        text = self.registry.render()
+
+        assert_that(text, contains_string('# TYPE calls counter\n'))
+        assert_that(text, contains_string('calls_total{kind="a"} 3\n'))
+
+    def test_render_gauge(self):
+        gauge = self.registry.register(Gauge('running', 'Running'))
+        gauge.inc(3)
+        gauge.dec()
+
+        text = self.registry.render()
+
+        assert_that(text, contains_string('# TYPE running gauge\n'))
+        assert_that(text, contains_string('running 2\n'))
+
+    def test_render_histogram(self):
+        histogram = self.registry.register(
+            Histogram('latency', 'Latency', buckets=(0.1, 1))
+        )
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+
+        text = self.registry.render()
+
+        assert_that(text, contains_string('latency_bucket{le="0.1"} 1\n'))
+        assert_that(text, contains_string('latency_bucket{le="1"} 2\n'))
+        assert_that(text, contains_string('latency_bucket{le="+Inf"} 3\n'))
+        assert_that(text, contains_string('latency_sum 5.55\n'))
+        assert_that(text, contains_string('latency_count 3\n'))
+
+    def test_that_label_values_are_escaped(self):
+        counter = self.registry.register(Counter('calls', 'Calls', ['kind']))
+        counter.inc(kind='a"b')
+
+        assert_that(self.registry.render(), contains_string('kind="a\\"b"'))
+
+    def test_that_labels_are_validated(self):
+        counter = Counter('calls', 'Calls', ['kind'])
+
+        assert_that(calling(counter.inc).with_args(other='a'), raises(ValueError))
+
+    def test_that_names_are_unique(self):
+        self.registry.register(Counter('calls', 'Calls'))
+
+        assert_that(
+            calling(self.registry.register).with_args(Counter('calls', 'Calls')),
+            raises(ValueError),
+        )
+
+
+class TestStepTimer(TestCase):
+    def test_that_the_commands_are_measured(self):
+        with StepTimer() as timer:
+            subprocess.run(['true'], check=True)
+
+        timing = timer.as_dict()
+        assert_that(timing['wall_time'], greater_than(0))
+        assert_that(
+            sorted(timing),
+            equal_to(
+                ['children_system_time', 'children_user_time', 'cpu_time', 'wall_time']
+            ),
+        )
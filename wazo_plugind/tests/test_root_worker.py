@@ -0,0 +1,327 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from unittest import TestCase
+from unittest.mock import ANY, Mock, patch
+
+from hamcrest import (
+    assert_that,
+    calling,
+    contains_exactly,
+    equal_to,
+    has_entries,
+    has_items,
+    raises,
+)
+
+from ..exceptions import CommandExecutionFailed
+from ..root_worker import (
+    BaseWorker,
+    RootWorker,
+    _Batcher,
+    _CommandDispatcher,
+    _CommandExecutor,
+)
+
+
+class TestBatcher(TestCase):
+    def test_that_a_single_request_is_sent_alone(self):
+        send_batch = Mock(return_value=[True])
+        batcher = _Batcher(send_batch)
+
+        result = batcher.submit('uuid', 'foo.deb')
+
+        assert_that(result, equal_to(True))
+        send_batch.assert_called_once_with([('uuid', 'foo.deb')])
+
+    def test_that_requests_received_while_sending_are_grouped(self):
+        first_sent, release = threading.Event(), threading.Event()
+        batches = []
+
+        def send_batch(requests):
+            batches.append(requests)
+            if len(batches) == 1:
+                first_sent.set()
+                release.wait()
+            return [name for _, name in requests]
+
+        batcher = _Batcher(send_batch)
+        results = {}
+
+        def submit(name):
+            results[name] = batcher.submit('uuid', name)
+
+        first = threading.Thread(target=submit, args=('a',))
+        first.start()
+        first_sent.wait()
+        others = [threading.Thread(target=submit, args=(n,)) for n in ('b', 'c')]
+        for thread in others:
+            thread.start()
+        while len(batcher._pending) < 2:
+            threading.Event().wait(0.001)
+        release.set()
+        for thread in [first] + others:
+            thread.join()
+
+        assert_that(len(batches), equal_to(2))
+        assert_that(batches[0], equal_to([('uuid', 'a')]))
+        assert_that(sorted(batches[1]), equal_to([('uuid', 'b'), ('uuid', 'c')]))
+        assert_that(results, equal_to({'a': 'a', 'b': 'b', 'c': 'c'}))
+
+    def test_that_errors_are_raised_to_the_caller(self):
+        batcher = _Batcher(Mock(side_effect=RuntimeError))
+
+        assert_that(
+            calling(batcher.submit).with_args('uuid', 'a'), raises(RuntimeError)
+        )
+
+
+@patch('wazo_plugind.root_worker.exec_and_log')
+class TestCommandExecutor(TestCase):
+    def setUp(self):
+        self.executor = _CommandExecutor()
+
+    def test_install_batch_uses_a_single_transaction(self, exec_and_log):
+        requests = [('u1', '/tmp/a.deb'), ('u2', '/tmp/b.deb')]
+
+        result = self.executor.install_batch(requests)
+
+        assert_that(result, contains_exactly(True, True))
+        exec_and_log.assert_called_once()
+        cmd = exec_and_log.call_args[0][2]
+        assert_that(cmd[:2], equal_to(['apt-get', 'install']))
+        assert_that(cmd[-2:], equal_to(['/tmp/a.deb', '/tmp/b.deb']))
+
+    def test_install_batch_is_not_interactive(self, exec_and_log):
+        requests = [('u1', '/tmp/a.deb'), ('u2', '/tmp/b.deb')]
+
+        self.executor.install_batch(requests)
+
+        cmd = exec_and_log.call_args[0][2]
+        assert_that(
+            cmd,
+            has_items(
+                '--yes',
+                'Dpkg::Options::=--force-confdef',
+                'Dpkg::Options::=--force-confold',
+            ),
+        )
+        env = exec_and_log.call_args[1]['env']
+        assert_that(env, has_entries(DEBIAN_FRONTEND='noninteractive'))
+
+    def test_install_batch_falls_back_to_each_package(self, exec_and_log):
+        def fake_exec(stdout, stderr, cmd, **kwargs):
+            if cmd[0] == 'apt-get' or cmd[-1] == '/tmp/b.deb':
+                raise CommandExecutionFailed(cmd, 1)
+            return Mock(returncode=0)
+
+        exec_and_log.side_effect = fake_exec
+        requests = [('u1', '/tmp/a.deb'), ('u2', '/tmp/b.deb')]
+
+        result = self.executor.install_batch(requests)
+
+        assert_that(result, contains_exactly(True, False))
+
+    def test_uninstall_batch(self, exec_and_log):
+        exec_and_log.return_value = Mock(returncode=0)
+
+        result = self.executor.uninstall_batch([('u1', 'foo'), ('u2', 'bar')])
+
+        assert_that(result, contains_exactly(True, True))
+        exec_and_log.assert_called_once()
+        cmd = exec_and_log.call_args[0][2]
+        assert_that(cmd, equal_to(['apt-get', 'remove', '--yes', 'foo', 'bar']))
+
+
+class TestBaseWorker(TestCase):
+    def test_that_commands_are_executed_until_stopped(self):
+        worker = BaseWorker()
+
+        with worker:
+            result = worker.send_cmd_and_wait('unknown')
+
+        assert_that(result, equal_to(None))
+        assert_that(worker._process.is_alive(), equal_to(False))
+        assert_that(worker._process.exitcode, equal_to(0))
+
+    def test_that_the_timeout_starts_when_the_command_starts(self):
+        worker = BaseWorker()
+        worker._process = Mock(is_alive=Mock(return_value=True))
+        worker._send = Mock()
+
+        with ThreadPoolExecutor(1) as executor, patch(
+            'wazo_plugind.root_worker.logger'
+        ) as logger:
+            future = executor.submit(worker.send_cmd_and_wait, 'update', timeout=0.01)
+            _wait_for(lambda: 1 in worker._pending)
+            assert_that(wait([future], timeout=0.05).done, equal_to(set()))
+            logger.warning.assert_not_called()
+
+            worker._handle_message(('started', 1))
+            _wait_for(lambda: logger.warning.called)
+            worker._handle_message(('result', 1, True, 0.5))
+
+            assert_that(future.result(5), equal_to(True))
+        worker._send.assert_called_once_with(('command', 1, 'update', (), {}))
+
+    def test_that_a_queued_command_is_cancelled_when_the_caller_stops_waiting(self):
+        worker = BaseWorker()
+        worker._process = Mock(is_alive=Mock(return_value=True))
+        worker._send = Mock()
+
+        with patch('wazo_plugind.root_worker.Event') as Event:
+            Event.return_value.wait.side_effect = KeyboardInterrupt
+            assert_that(
+                calling(worker.send_cmd_and_wait).with_args('update'),
+                raises(KeyboardInterrupt),
+            )
+
+        assert_that(worker._pending, equal_to({}))
+        worker._send.assert_called_with(('cancel', 1))
+
+    def test_that_results_are_matched_by_request_id(self):
+        worker = BaseWorker()
+        worker._process = Mock(is_alive=Mock(return_value=True))
+        worker._send = Mock()
+        worker._connection = Mock()
+        first, second = worker.send_cmd('update'), worker.send_cmd('install')
+        worker._connection.recv.side_effect = [
+            ('started', 2),
+            ('result', 2, 'installed', 0.1),
+            ('result', 1, 'updated', 0.2),
+            EOFError,
+        ]
+
+        worker._read_results()
+
+        assert_that(first.result(), equal_to('updated'))
+        assert_that(second.result(), equal_to('installed'))
+
+    def test_that_the_queue_wait_is_recorded_by_command(self):
+        worker = BaseWorker()
+        worker._process = Mock(is_alive=Mock(return_value=True))
+        worker._send = Mock()
+        worker._connection = Mock()
+        worker.send_cmd('update')
+        worker._connection.recv.side_effect = [('result', 1, True, 0.5), EOFError]
+
+        with patch('wazo_plugind.root_worker.metrics') as metrics:
+            worker._read_results()
+
+        metrics.root_worker_queue_wait.observe.assert_called_once_with(
+            0.5, command='update'
+        )
+        metrics.root_worker_command_duration.observe.assert_called_once_with(
+            ANY, command='update'
+        )
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000
+
+    def __call__(self):
+        return self.now
+
+
+class TestRootWorkerUpdate(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.worker = RootWorker(update_freshness=60, clock=self.clock)
+        self.worker.send_cmd_and_wait = Mock(return_value=True)
+
+    def test_that_fresh_package_lists_are_not_updated(self):
+        self.worker.apt_get_update('first')
+        self.clock.now += 59
+
+        result = self.worker.apt_get_update('second')
+
+        assert_that(result, equal_to(True))
+        self.worker.send_cmd_and_wait.assert_called_once_with('update', 'first')
+
+    def test_that_expired_package_lists_are_updated(self):
+        self.worker.apt_get_update('first')
+        self.clock.now += 60
+
+        self.worker.apt_get_update('second')
+
+        assert_that(self.worker.send_cmd_and_wait.call_count, equal_to(2))
+
+    def test_that_a_failed_update_is_not_considered_fresh(self):
+        self.worker.send_cmd_and_wait.return_value = False
+        self.worker.apt_get_update('first')
+
+        self.worker.apt_get_update('second')
+
+        assert_that(self.worker.send_cmd_and_wait.call_count, equal_to(2))
+
+    def test_that_overlapping_updates_share_one_execution(self):
+        callers = 5
+        release = threading.Event()
+        self.worker.send_cmd_and_wait.side_effect = lambda *args: release.wait(5)
+
+        with ThreadPoolExecutor(callers) as executor:
+            futures = [
+                executor.submit(self.worker.apt_get_update, str(i))
+                for i in range(callers)
+            ]
+            single_flight = self.worker._update_single_flight
+            _wait_for(lambda: single_flight.waiters('update') == callers - 1)
+            release.set()
+            results = [future.result(5) for future in futures]
+
+        assert_that(results, equal_to([True] * callers))
+        self.worker.send_cmd_and_wait.assert_called_once()
+
+
+class TestCommandDispatcher(TestCase):
+    def setUp(self):
+        self.connection = Mock()
+        self.executor = Mock()
+        self.dispatcher = _CommandDispatcher(self.connection, self.executor)
+
+    def test_that_apt_commands_do_not_run_concurrently(self):
+        running, overlaps = [], []
+        lock = threading.Lock()
+
+        def execute(cmd, *args):
+            with lock:
+                running.append(cmd)
+                overlaps.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(cmd)
+            return True
+
+        self.executor.execute.side_effect = execute
+
+        self.dispatcher.dispatch(1, 'update', ('uuid',), {})
+        self.dispatcher.dispatch(2, 'install', ('uuid', 'foo.deb'), {})
+        self.dispatcher.dispatch(3, 'uninstall', ('uuid', 'foo'), {})
+        self.dispatcher.stop()
+
+        assert_that(overlaps, equal_to([1, 1, 1]))
+        for request_id in (1, 2, 3):
+            self.connection.send.assert_any_call(('started', request_id))
+            self.connection.send.assert_any_call(('result', request_id, True, ANY))
+
+    def test_that_a_cancelled_command_is_not_executed(self):
+        lock = self.dispatcher._resource_locks['apt']
+        with lock:
+            self.dispatcher.dispatch(1, 'install', ('uuid', 'foo.deb'), {})
+            self.dispatcher.cancel(1)
+        self.dispatcher.stop()
+
+        self.executor.execute.assert_not_called()
+        self.connection.send.assert_called_once_with(('result', 1, None, ANY))
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('condition not met')
+        time.sleep(0.01)
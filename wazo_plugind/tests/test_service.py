@@ -1,4 +1,4 @@
-# Copyright 2017-2023 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2017-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 from unittest import TestCase
@@ -21,6 +21,8 @@ class TestPluginService(TestCase):
         self._executor = Mock()
         self._plugin_db = Mock()
         self._version_finder = Mock()
+        self._job_registry = Mock()
+        self._git_cache = Mock()
         self._service = PluginService(
             _DEFAULT_CONFIG,
             self._publisher,
@@ -28,21 +30,23 @@ class TestPluginService(TestCase):
             self._executor,
             plugin_db=self._plugin_db,
             wazo_version_finder=self._version_finder,
+            job_registry=self._job_registry,
+            caches={'git': self._git_cache},
         )
 
     def test_get_from_market(self):
         market_db = Mock(MarketDB)
-        market_db.list_.return_value = [s.expected_result]
+        market_db.get.return_value = s.expected_result
 
         with patch.object(self._service, '_new_market_db', return_value=market_db):
             result = self._service.get_from_market(s.market_proxy, 'namespace', 'name')
 
         assert_that(result, equal_to(s.expected_result))
-        market_db.list_.assert_called_once_with(namespace='namespace', name='name')
+        market_db.get.assert_called_once_with('namespace', 'name')
 
     def test_get_from_market_no_matching_plugin(self):
         market_db = Mock(MarketDB)
-        market_db.list_.return_value = []
+        market_db.get.side_effect = LookupError
 
         with patch.object(self._service, '_new_market_db', return_value=market_db):
             assert_that(
@@ -74,3 +78,26 @@ class TestPluginService(TestCase):
                 )
             ),
         )
+
+    def test_market_fingerprint(self):
+        market_proxy = Mock()
+        market_proxy.get_digest.return_value = 'digest'
+        self._plugin_db.state_fingerprint.return_value = 'installed'
+        self._version_finder.get_version.return_value = '26.15'
+
+        result = self._service.market_fingerprint(market_proxy)
+
+        assert_that(result, equal_to(('digest', 'installed', '26.15')))
+
+    def test_purge_cache(self):
+        self._service.purge_cache('git')
+
+        self._git_cache.purge.assert_called_once_with()
+
+    def test_purge_unknown_cache(self):
+        assert_that(
+            calling(self._service.purge_cache).with_args('unknown'),
+            raises(APIException).matching(
+                has_properties('status_code', 404, 'id_', 'cache-not-found')
+            ),
+        )
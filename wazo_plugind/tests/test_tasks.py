@@ -0,0 +1,307 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import threading
+from unittest import TestCase
+from unittest.mock import ANY, Mock, patch
+
+from hamcrest import (
+    assert_that,
+    calling,
+    equal_to,
+    has_entries,
+    is_,
+    none,
+    raises,
+    same_instance,
+)
+
+from ..config import _DEFAULT_CONFIG
+from ..context import Context
+from ..exceptions import (
+    CommandExecutionFailed,
+    DependencyCycleException,
+    PluginAlreadyInstalled,
+)
+from ..tasks import (
+    PackageAndInstallTask,
+    _DependencyResolver,
+    _PackageBuilder,
+    _run_step,
+    _topological_levels,
+    get_plugin_lock,
+)
+
+
+class TestPluginLock(TestCase):
+    def test_get_plugin_lock(self):
+        lock = get_plugin_lock('foo', 'bar')
+
+        assert_that(get_plugin_lock('foo', 'bar'), same_instance(lock))
+        assert_that(get_plugin_lock('foo', 'baz') is lock, equal_to(False))
+
+
+class TestPackageBuilderLock(TestCase):
+    def setUp(self):
+        with patch('wazo_plugind.tasks.debian.Generator'):
+            self.builder = _PackageBuilder(_DEFAULT_CONFIG, Mock())
+
+    def test_that_the_same_plugin_is_not_installed_concurrently(self):
+        metadata = {'namespace': 'foo', 'name': 'locked'}
+        first = Context(_DEFAULT_CONFIG, metadata=metadata)
+        second = Context(_DEFAULT_CONFIG, metadata=metadata)
+        acquired = threading.Event()
+
+        def install_second():
+            self.builder.lock(second)
+            acquired.set()
+            self.builder.unlock(second)
+
+        self.builder.lock(first)
+        thread = threading.Thread(target=install_second)
+        thread.start()
+
+        assert_that(acquired.wait(0.1), equal_to(False))
+        self.builder.unlock(first)
+        thread.join()
+        assert_that(acquired.is_set(), equal_to(True))
+
+    def test_that_a_lock_taken_on_a_pool_thread_can_be_released(self):
+        ctx = Context(_DEFAULT_CONFIG, metadata={'namespace': 'foo', 'name': 'pool'})
+        result = []
+
+        thread = threading.Thread(target=lambda: result.append(self.builder.lock(ctx)))
+        thread.start()
+        thread.join()
+        self.builder.unlock(result[0])
+
+        assert_that(get_plugin_lock('foo', 'pool').locked(), equal_to(False))
+
+    def test_check_not_installed(self):
+        metadata = {'namespace': 'foo', 'name': 'bar', 'version': '1.0.0'}
+        ctx = Context(_DEFAULT_CONFIG, metadata=metadata)
+
+        with patch('wazo_plugind.tasks.db.PluginDB') as PluginDB:
+            PluginDB.return_value.is_installed.return_value = True
+            assert_that(
+                calling(self.builder.check_not_installed).with_args(ctx),
+                raises(PluginAlreadyInstalled),
+            )
+            PluginDB.return_value.is_installed.return_value = False
+            assert_that(self.builder.check_not_installed(ctx), same_instance(ctx))
+
+        PluginDB.return_value.is_installed.assert_called_with('foo', 'bar', '1.0.0')
+
+    def test_unlock_without_lock(self):
+        ctx = Context(_DEFAULT_CONFIG)
+
+        result = self.builder.unlock(ctx)
+
+        assert_that(getattr(result, 'plugin_lock', None), is_(none()))
+
+
+class TestPackageBuilderArtifactCache(TestCase):
+    def setUp(self):
+        self.artifact_cache = Mock()
+        with patch('wazo_plugind.tasks.debian.Generator') as Generator, patch(
+            'wazo_plugind.tasks.get_artifact_cache', return_value=self.artifact_cache
+        ):
+            Generator.from_config.return_value.render.return_value = {'control': ''}
+            self.builder = _PackageBuilder(_DEFAULT_CONFIG, Mock())
+        self.builder._exec = Mock()
+        self.ctx = Context(
+            _DEFAULT_CONFIG,
+            metadata={'namespace': 'foo', 'name': 'bar'},
+            extract_path='/tmp/extract',
+            install_options={'url': 'http://', 'ref': 'master'},
+            source_commit='abcd',
+            wazo_version='26.15',
+        )
+
+    def test_that_a_cached_package_is_not_built(self):
+        self.artifact_cache.get.return_value = True
+
+        ctx = self.builder.package(self.builder.build(self.ctx))
+
+        self.builder._exec.assert_not_called()
+        assert_that(ctx.package_deb_file, equal_to('/tmp/extract/_pkg.deb'))
+        self.artifact_cache.get.assert_called_once_with(ANY, '/tmp/extract/_pkg.deb')
+
+    def test_that_a_built_package_is_stored(self):
+        self.artifact_cache.get.return_value = False
+        ctx = self.builder.build(self.ctx)
+
+        self.builder._store_artifact(ctx, '/tmp/extract/_pkg.deb')
+
+        self.builder._exec.assert_called_once()
+        self.artifact_cache.put.assert_called_once_with(
+            ctx.artifact_key, '/tmp/extract/_pkg.deb'
+        )
+
+    def test_that_the_key_depends_on_the_commit(self):
+        key = self.builder._artifact_key(self.ctx)
+
+        self.ctx.source_commit = 'efgh'
+
+        assert_that(self.builder._artifact_key(self.ctx) == key, equal_to(False))
+
+
+def _depends(*names):
+    return [{'namespace': 'foo', 'name': name} for name in names]
+
+
+class TestDependencyResolver(TestCase):
+    def setUp(self):
+        self.depends = {}
+        self.prepared, self.installed, self.cancelled = [], [], []
+        self.lock = threading.Lock()
+        self.resolver = _DependencyResolver(
+            self.prepare, self.install, self.cancelled.append, max_workers=4
+        )
+
+    def prepare(self, dependency, wazo_version):
+        with self.lock:
+            self.prepared.append(dependency['name'])
+        metadata = {**dependency, 'depends': self.depends.get(dependency['name'], [])}
+        return Context(_DEFAULT_CONFIG, metadata=metadata)
+
+    def install(self, ctx):
+        with self.lock:
+            self.installed.append(ctx.metadata['name'])
+
+    def resolve(self, *names):
+        metadata = {'namespace': 'foo', 'name': 'root', 'depends': _depends(*names)}
+        ctx = Context(_DEFAULT_CONFIG, metadata=metadata, wazo_version='26.15')
+        return self.resolver.install(ctx)
+
+    def test_that_shared_dependencies_are_prepared_once(self):
+        self.depends = {'a': _depends('c'), 'b': _depends('c')}
+
+        self.resolve('a', 'b')
+
+        assert_that(sorted(self.prepared), equal_to(['a', 'b', 'c']))
+        assert_that(self.installed[0], equal_to('c'))
+        assert_that(sorted(self.installed[1:]), equal_to(['a', 'b']))
+
+    def test_that_independent_dependencies_are_prepared_in_parallel(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def prepare(dependency, wazo_version):
+            barrier.wait()
+            return None
+
+        self.resolver._prepare = prepare
+
+        self.resolve('a', 'b')
+
+        assert_that(self.installed, equal_to([]))
+
+    def test_that_cycles_are_detected(self):
+        self.depends = {'a': _depends('b'), 'b': _depends('a')}
+
+        assert_that(
+            calling(self.resolve).with_args('a'),
+            raises(DependencyCycleException),
+        )
+        assert_that(self.installed, equal_to([]))
+        assert_that(len(self.cancelled), equal_to(2))
+
+    def test_that_a_dependency_on_the_plugin_is_a_cycle(self):
+        self.depends = {'a': _depends('root')}
+
+        assert_that(
+            calling(self.resolve).with_args('a'),
+            raises(DependencyCycleException),
+        )
+
+    def test_that_an_unexpected_error_cancels_the_others(self):
+        def prepare(dependency, wazo_version):
+            if dependency['name'] == 'b':
+                raise Exception('unexpected')
+            return self.prepare(dependency, wazo_version)
+
+        self.resolver._prepare = prepare
+
+        assert_that(
+            calling(self.resolve).with_args('a', 'b'),
+            raises(Exception, 'unexpected'),
+        )
+        assert_that(self.installed, equal_to([]))
+        assert_that(len(self.cancelled), equal_to(1))
+
+
+class TestPackageAndInstallTaskDependencies(TestCase):
+    def setUp(self):
+        with patch('wazo_plugind.tasks._PackageBuilder'), patch(
+            'wazo_plugind.tasks.get_publisher'
+        ), patch('wazo_plugind.tasks.get_job_registry'):
+            self.task = PackageAndInstallTask(_DEFAULT_CONFIG, Mock())
+        self.builder = self.task._builder
+        self.publisher = self.task._publisher = Mock()
+
+    def test_that_a_failed_dependency_does_not_fail_the_plugin(self):
+        self.builder.download.side_effect = CommandExecutionFailed(['git'], 128)
+        metadata = {'namespace': 'foo', 'name': 'root', 'depends': _depends('a')}
+        ctx = Context(_DEFAULT_CONFIG, metadata=metadata, wazo_version='26.15')
+
+        result = self.task._dependency_resolver.install(ctx)
+
+        assert_that(result, same_instance(ctx))
+        self.publisher.install_error.assert_called_once_with(
+            ANY, 'install-error', 'Installation error', details=ANY
+        )
+        self.builder.install.assert_not_called()
+
+    def test_that_a_dependency_failing_to_install_does_not_raise(self):
+        self.builder.install.side_effect = CommandExecutionFailed(['dpkg'], 1)
+        ctx = Context(_DEFAULT_CONFIG, install_options=_depends('a')[0])
+
+        self.task._install_dependency(ctx)
+
+        self.publisher.install_error.assert_called_once()
+        self.builder.unlock.assert_called_once()
+
+
+class TestTopologicalLevels(TestCase):
+    def test_levels(self):
+        graph = {'root': {'a', 'b'}, 'a': {'c'}, 'b': {'c'}, 'c': set()}
+
+        assert_that(_topological_levels(graph), equal_to([['c'], ['a', 'b']]))
+
+    def test_cycle(self):
+        graph = {
+            'root': {('foo', 'a')},
+            ('foo', 'a'): {('foo', 'b')},
+            ('foo', 'b'): {('foo', 'a')},
+        }
+
+        assert_that(
+            calling(_topological_levels).with_args(graph),
+            raises(DependencyCycleException),
+        )
+
+
+class TestRunStep(TestCase):
+    def test_that_the_step_is_timed_and_published(self):
+        publisher = Mock()
+        ctx = Context(_DEFAULT_CONFIG)
+
+        result = _run_step(publisher, ctx, 'install', 'building', lambda ctx: ctx)
+
+        assert_that(result, same_instance(ctx))
+        publisher.step_timing.assert_called_once_with(ctx, 'install', 'building', ANY)
+        timing = publisher.step_timing.call_args[0][3]
+        assert_that(timing, has_entries(wall_time=ANY, cpu_time=ANY))
+
+    def test_that_a_failing_step_is_timed(self):
+        publisher = Mock()
+        ctx = Context(_DEFAULT_CONFIG)
+
+        def fail(ctx):
+            raise Exception('failed')
+
+        assert_that(
+            calling(_run_step).with_args(publisher, ctx, 'install', 'building', fail),
+            raises(Exception, 'failed'),
+        )
+        publisher.step_timing.assert_called_once()